@@ -1,8 +1,6 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-import base64
-import binascii
 import datetime
 import json
 import logging
@@ -11,46 +9,118 @@ import pathlib
 import re
 import sys
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from utils.sanitize import sanitize_text
 from utils.logger import logger as app_logger
+from utils.mime_sniffer import detect_mime
 
-import fitz
 import google.generativeai as genai
-import magic
 from bson import ObjectId
 from bson.errors import InvalidId
 from flask import (
     Flask,
     jsonify,
+    redirect,
     request,
-    send_from_directory,
 )
 from flask_cors import CORS
 from google_auth_oauthlib.flow import Flow
-from PIL import Image
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from flask_mail import Mail
 
 from database.databaseConfig import (
     get_beehive_message_collection,
     get_beehive_notification_collection,
-    initialize_text_index,
 )
+from database.indexes import ensure_indexes_in_background
 from database.databaseConfig import get_beehive_user_collection
 from database.userdatahandler import (
+    build_image,
+    build_notification,
     delete_image,
+    delete_images,
     get_image_by_id,
     get_image_by_audio_filename,
+    get_images_by_ids,
     get_images_by_user,
+    get_referenced_filenames,
+    get_user_blobs_by_content_hash,
     search_and_filter_images,
     get_user_by_username,
+    restore_deleted_images,
     save_image,
+    save_images,
     save_notification,
+    save_notifications,
+    trash_images,
     update_image,
 )
-from utils.pagination import parse_pagination_params
+from database.uploadsessionhandler import (
+    advance_upload_offset,
+    complete_upload_session,
+    create_upload_session,
+    delete_upload_session,
+    get_upload_session,
+    mark_upload_session_finalizing,
+    reset_upload_session_status,
+)
+from database.blobhandler import acquire_blob, get_blob, release_blob, set_blob_derivatives
+from database.jobqueue import delete_jobs, enqueue_jobs, get_job
+from utils.derivatives import (
+    derivative_formats,
+    fetch_derivative_source,
+    generate_derivatives,
+    render_resized,
+)
+from utils.media_cache import ResizeCache
+from utils.media_signing import verify_media_signature
+from utils.ownership_cache import audio_owner_cache
+from utils.media_delivery import (
+    MEDIA_CACHE_LOCATION,
+    UPLOADS_LOCATION,
+    cache_media_response,
+    send_media,
+)
+from utils.audio_ingest import (
+    MAX_AUDIO_FILE_SIZE,
+    audio_size_error_message,
+    parse_audio_data_url,
+    write_audio_data_url,
+    write_audio_file,
+)
+from utils.content_store import MIME_EXTENSIONS, blob_filename, hash_file, hash_stream, is_content_hash
+from utils.pagination import decode_cursor, keyset_query, next_cursor, parse_pagination_params
+from utils.thumbnails import generate_pdf_thumbnail
+from utils.upload_jobs import (
+    build_purge_job,
+    build_upload_jobs,
+    build_voice_note_job,
+    discard_stored_upload,
+    process_voice_note,
+    publish_derivatives,
+    publish_pdf_thumbnails,
+    purge_deleted_images,
+)
+from utils.media_storage import fetch_file, get_storage, publish_file, storage_key
+from utils.upload_paths import STATIC_UPLOADS_URL, resolve_path, resolve_relpath
+from utils.upload_policy import (
+    ALLOWED_EXTENSIONS,
+    ALLOWED_MIME_TYPES,
+    MIME_SIZE_LIMITS,
+    MIME_SNIFF_BYTES,
+    extension_error_message,
+    file_extension,
+    size_limit_error_message,
+)
+from utils.upload_stream import (
+    UploadRejected,
+    init_streaming_uploads,
+    is_streamed_upload,
+)
 
+from utils.admission import admit_upload
 from utils.jwt_auth import require_auth,require_admin_role 
 app = Flask(__name__, static_folder="static", static_url_path="/static")
 
@@ -70,7 +140,8 @@ CORS(
         r"/api/*": {
             "origins": app.config["CORS_ORIGINS"],
             "methods": ["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "Upload-Offset"],
+            "expose_headers": ["Upload-Offset", "Retry-After"],
             "supports_credentials": True,
         },
         r"/delete/*": {
@@ -106,18 +177,6 @@ mail = Mail(app)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 
-ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp", "heif", "pdf", "avif"}
-
-ALLOWED_MIME_TYPES = {
-    "image/jpeg",
-    "image/png",
-    "image/gif",
-    "image/webp",
-    "image/heif",
-    "application/pdf",
-    "image/avif",
-}
-
 ALLOWED_AUDIO_MIME_TYPES = {
     "audio/wav",
     "audio/x-wav",
@@ -128,21 +187,17 @@ ALLOWED_AUDIO_MIME_TYPES = {
     "video/ogg",   # Defensive allow for ogg containers
     "application/ogg",  # libmagic may report this for ogg
 }
-MAX_AUDIO_FILE_SIZE = 6 * 1024 * 1024  # We can set the size required to Beehive 
-AUDIO_DATA_URL_RE = re.compile(r"^data:(?P<mime>[-\w.+/]+);base64,(?P<data>[A-Za-z0-9+/=\r\n]+)$")
 
-# Initialized global MIME detector
-try:
-    MAGIC = magic.Magic(mime=True)
-except Exception as e:
-    MAGIC = None
-    app_logger.error(
-        "MIME detection unavailable: failed to initialize libmagic. Install system libmagic (e.g., `apt-get install libmagic1` or equivalent) and python-magic. Error: %s",
-        e,
-    )
+init_streaming_uploads(app, detect_mime)
+
+
+@app.after_request
+def cache_static_uploads(response):
+    """Stored files never change: let browsers and CDNs keep /static/uploads responses."""
+    if request.path.startswith(f"{STATIC_UPLOADS_URL}/") and response.status_code in (200, 206, 304):
+        cache_media_response(response, private=False)
+    return response
 
-# Fallback detector initialized lazily if the global MAGIC is unavailable
-_FALLBACK_MAGIC = None
 
 app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=30)
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
@@ -157,6 +212,8 @@ if (
 app.config["UPLOAD_FOLDER"] = "static/uploads"
 app.config["PDF_THUMBNAIL_FOLDER"] = "static/uploads/thumbnails/"
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024
+# Non-file form fields are buffered in memory; leave room for a base64 voice note data URL
+app.config["MAX_FORM_MEMORY_SIZE"] = (MAX_AUDIO_FILE_SIZE * 4) // 3 + 64 * 1024
 os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
 client_secrets_file = os.path.join(pathlib.Path(__file__).parent, "client_secret.json")
 
@@ -172,16 +229,6 @@ flow = Flow.from_client_secrets_file(
 )
 
 
-MIME_SIZE_LIMITS = {
-    "image/jpeg": 10*1024*1024 ,
-    "image/png": 10 *1024*1024,
-    "image/webp": 10 * 1024 * 1024,
-    "image/gif": 8 * 1024 * 1024,
-    "image/heif": 15 * 1024 * 1024,
-    "image/heic": 15 * 1024 * 1024,
-    "application/pdf": 25 * 1024 * 1024,
-}
-
 def validate_file_size(file, mime_type, filename):
     """
     Validates the file size against allowed limits.
@@ -199,13 +246,7 @@ def validate_file_size(file, mime_type, filename):
     file.stream.seek(0)
 
     if size > max_allowed:
-        return (
-            jsonify({
-                "error": f"File '{filename}' exceeds max size limit "
-                         f"({max_allowed // (1024 * 1024)}MB)"
-            }),
-            413,
-        )
+        return jsonify({"error": size_limit_error_message(filename, max_allowed)}), 413
     return None
 
 
@@ -240,57 +281,7 @@ def _build_audio_basename(title: str) -> str:
 
 
 def _audio_size_error():
-    return (
-        jsonify(
-            {
-                "error": f"Audio exceeds max size limit ({MAX_AUDIO_FILE_SIZE // (1024 * 1024)}MB)",
-            }
-        ),
-        413,
-    )
-
-
-def _validate_audio_size(size_bytes):
-    if size_bytes > MAX_AUDIO_FILE_SIZE:
-        return _audio_size_error()
-    return None
-
-
-def _decode_audio_data(audio_data):
-    """
-    Validates and decodes a base64 audio data URL.
-    Returns (bytes, None) when valid or (None, response) when invalid.
-    """
-    match = AUDIO_DATA_URL_RE.match(audio_data.strip()) if audio_data else None
-    if not match:
-        return None, (jsonify({"error": "Invalid audio data URL format"}), 400)
-
-    mime_type = match.group("mime").lower()
-    base_mime = mime_type.split(";")[0].strip()
-    if base_mime not in ALLOWED_AUDIO_MIME_TYPES:
-        return None, (jsonify({"error": "Unsupported audio MIME type"}), 400)
-
-    b64_payload = match.group("data").strip()
-    estimated_size = (len(b64_payload) * 3) // 4
-    size_error = _validate_audio_size(estimated_size)
-    if size_error:
-        return None, size_error
-
-    try:
-        audio_binary = base64.b64decode(b64_payload, validate=True)
-    except (binascii.Error, ValueError):
-        return None, (jsonify({"error": "Audio data is not valid base64"}), 400)
-
-    size_error = _validate_audio_size(len(audio_binary))
-    if size_error:
-        return None, size_error
-
-    if base_mime.startswith("audio/wav") and not (
-        audio_binary.startswith(b"RIFF") and audio_binary[8:12] == b"WAVE"
-    ):
-        return None, (jsonify({"error": "Audio content validation failed"}), 400)
-
-    return audio_binary, base_mime
+    return jsonify({"error": audio_size_error_message()}), 413
 
 
 def _validate_audio_file_upload(audio_file):
@@ -303,7 +294,7 @@ def _validate_audio_file_upload(audio_file):
 
     header = audio_file.stream.read(2048)
     audio_file.stream.seek(0)
-    detected_mime = (MAGIC.from_buffer(header) if MAGIC else None) or (
+    detected_mime = detect_mime(header) or (
         audio_file.mimetype.lower() if audio_file.mimetype else ""
     )
     base_mime = detected_mime.split(";")[0].strip() if detected_mime else ""
@@ -314,9 +305,8 @@ def _validate_audio_file_upload(audio_file):
     audio_file.stream.seek(0, os.SEEK_END)
     size = audio_file.stream.tell()
     audio_file.stream.seek(0)
-    size_error = _validate_audio_size(size)
-    if size_error:
-        return size_error
+    if size > MAX_AUDIO_FILE_SIZE:
+        return _audio_size_error()
 
     return None
 
@@ -331,9 +321,54 @@ AUDIO_MIME_TO_EXTENSION = {
     "audio/wav": ".wav",
 }
 
+# Bounded pool for writing the files of multi-file uploads concurrently
+UPLOAD_IO_EXECUTOR = ThreadPoolExecutor(
+    max_workers=app.config["UPLOAD_IO_WORKERS"], thread_name_prefix="upload-io"
+)
+
+MEDIA_MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpg": "image/jpeg"}
+
+# LRU disk cache for /api/media resizes
+MEDIA_RESIZE_CACHE = ResizeCache(
+    app.config["MEDIA_CACHE_FOLDER"], app.config["MEDIA_CACHE_MAX_BYTES"]
+)
+
+
+def _store_upload(file, upload_folder, filename):
+    """Write one validated upload into the upload folder."""
+    filepath = resolve_path(upload_folder, filename)
+    if is_streamed_upload(file):
+        # Land the already validated file with a rename
+        file.stream.commit(filepath)
+    else:
+        # Write under a temporary name so a concurrent upload of the same blob never sees a partial file
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        temp_path = f"{filepath}.{ObjectId()}.part"
+        file.save(temp_path)
+        os.replace(temp_path, filepath)
+    publish_file(upload_folder, filename)
+
+
+def _process_stored_media(upload_folder, filename):
+    """Generate the PDF thumbnail (if applicable) and resized derivatives for a stored blob."""
+    if filename.lower().endswith(".pdf"):
+        if generate_pdf_thumbnail(resolve_path(upload_folder, filename), filename, upload_folder):
+            publish_pdf_thumbnails(upload_folder, filename)
+    derivatives = generate_derivatives(upload_folder, filename)
+    if derivatives:
+        publish_derivatives(upload_folder, filename, derivatives)
+        set_blob_derivatives(filename, derivatives)
+
+
+def _log_background_failure(future):
+    if future.exception() is not None:
+        app_logger.error(f"Background upload processing failed: {future.exception()}")
+
+
 # Upload images
 @app.route("/api/user/upload", methods=["POST"])
 @require_auth
+@admit_upload
 def upload_images():
     user_id = request.current_user["id"]
     try:
@@ -347,121 +382,699 @@ def upload_images():
         )  # Base64 audio from browser (optional)
         audio_file = request.files.get("audio")  # Uploaded audio file (optional)
 
-        if not files or not files[0]:
+        # Content hashes of files the client already uploaded earlier and skipped sending
+        existing_hashes = request.form.getlist("existing_hashes")
+
+        if (not files or not files[0]) and not existing_hashes:
             return jsonify({"error": "No file selected"}), 400
 
         if not title or not description:
             return jsonify({"error": "Title and description are required"}), 400
 
-        audio_filename = None
         safe_audio_basename = _build_audio_basename(title)
 
-        # Prefer the global MIME detector to avoid per-file instantiation; fall back lazily if unavailable
-        if MAGIC is not None:
-            mime_detector = MAGIC
-        else:
-            global _FALLBACK_MAGIC
-            if _FALLBACK_MAGIC is None:
-                try:
-                    _FALLBACK_MAGIC = magic.Magic(mime=True)
-                except Exception as e:
-                    app_logger.error(
-                        "MIME detection unavailable: libmagic missing or misconfigured. Install system libmagic and python-magic. Error: %s",
-                        e,
-                    )
-                    return jsonify({"error": "Server MIME detection unavailable; contact administrator."}), 500
-            mime_detector = _FALLBACK_MAGIC
-
+        # Validate every file up front so a bad file rejects the request before anything is stored
+        entries = []  # (stored filename, original filename, content hash) per image
+        new_blobs = {}  # stored filename -> bytes to store for it
         for file in files:
             if file:
                 # Validate extension
                 original_filename = secure_filename(file.filename)
-                unique_filename = f"{ObjectId()}_{original_filename}"
-                file_ext = os.path.splitext(original_filename)[1].lstrip('.').lower()
+                file_ext = file_extension(original_filename)
                 if file_ext not in ALLOWED_EXTENSIONS:
-                    return jsonify(
-                        {
-                            "error": f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
-                        }
-                    ), 400
-
-                file.stream.seek(0)
-                file_header = file.stream.read(2048)
-                file.stream.seek(0)
-                file_mime_type = mime_detector.from_buffer(file_header)
+                    return jsonify({"error": extension_error_message()}), 400
+
+                # Streamed uploads were already validated and hashed while the body was parsed
+                if is_streamed_upload(file):
+                    file_mime_type = file.stream.mime_type
+                    content_hash = file.stream.content_hash
+                    size = file.stream.size
+                else:
+                    file.stream.seek(0)
+                    file_header = file.stream.read(MIME_SNIFF_BYTES)
+                    file.stream.seek(0)
+                    file_mime_type = detect_mime(file_header)
+                    if file_mime_type is None:
+                        return jsonify({"error": "Server MIME detection unavailable; contact administrator."}), 500
+
+                    if file_mime_type not in ALLOWED_MIME_TYPES:
+                        return jsonify(
+                            {
+                                "error": f'File content validation failed. Detected type "{file_mime_type}" is not allowed.'
+                            }
+                        ), 400
+
+                    size_error = validate_file_size(file, file_mime_type, original_filename)
+                    if size_error:
+                        return size_error
+
+                    content_hash = hash_stream(file.stream)
+                    file.stream.seek(0, os.SEEK_END)
+                    size = file.stream.tell()
+                    file.stream.seek(0)
+
+                stored_filename = blob_filename(content_hash, file_mime_type)
+                blob = new_blobs.setdefault(stored_filename, {
+                    "file": file,
+                    "content_hash": content_hash,
+                    "size": size,
+                    "mime_type": file_mime_type,
+                    "count": 0,
+                })
+                blob["count"] += 1
+                entries.append((stored_filename, original_filename, content_hash))
+
+        # Files the client skipped must already be held by this user
+        existing_refs = {}
+        if existing_hashes:
+            if not all(is_content_hash(h) for h in existing_hashes):
+                return jsonify({"error": "Invalid content hash"}), 400
+            known = get_user_blobs_by_content_hash(user_id, existing_hashes)
+            missing = [h for h in existing_hashes if h not in known]
+            if missing:
+                return jsonify({"error": "Some files must be uploaded", "missing": missing}), 409
+            for content_hash in existing_hashes:
+                image = known[content_hash]
+                existing_refs.setdefault(image["filename"], [content_hash, 0])[1] += 1
+                entries.append((image["filename"], image.get("original_filename"), content_hash))
+
+        # Handle audio upload (either base64 or file). It is written once per request
+        # and shared by every image of the upload.
+        upload_folder = app.config["UPLOAD_FOLDER"]
+        audio_filename = None
+        if audio_data:
+            audio_mime, payload_offset = parse_audio_data_url(audio_data, ALLOWED_AUDIO_MIME_TYPES)
+            audio_ext = AUDIO_MIME_TO_EXTENSION.get(audio_mime, ".wav")
+            audio_filename = f"{safe_audio_basename}_{ObjectId()}{audio_ext}"
+            write_audio_data_url(
+                audio_data, payload_offset, audio_mime, resolve_path(upload_folder, audio_filename)
+            )
 
-                if file_mime_type not in ALLOWED_MIME_TYPES:
-                    return jsonify(
-                        {
-                            "error": f'File content validation failed. Detected type "{file_mime_type}" is not allowed.'
-                        }
-                    ), 400
-                    
-                size_error = validate_file_size(file, file_mime_type, original_filename)
-                if size_error:
-                    return size_error
-
-                filepath = os.path.join(app.config["UPLOAD_FOLDER"], unique_filename)
-                os.makedirs(os.path.dirname(filepath), exist_ok=True)
-                file.save(filepath)
-
-                # Handle audio upload (either base64 or file)
-                if audio_data:
-                    audio_binary, audio_mime_or_error = _decode_audio_data(audio_data)
-                    if not isinstance(audio_binary, (bytes, bytearray)):
-                        # audio_mime_or_error holds the response tuple in this case
-                        return audio_mime_or_error
-
-                    audio_mime = audio_mime_or_error  # safe: decode returns mime on success
-                    audio_ext = audio_ext = AUDIO_MIME_TO_EXTENSION.get(audio_mime, ".wav")
-
-                    audio_filename = f"{safe_audio_basename}_{ObjectId()}{audio_ext}"
-                    audio_path = os.path.join(
-                        app.config["UPLOAD_FOLDER"], audio_filename
-                    )
-                    os.makedirs(os.path.dirname(audio_path), exist_ok=True)
-                    with open(audio_path, "wb") as f:
-                        f.write(audio_binary)
-
-                elif audio_file:
-                    audio_error = _validate_audio_file_upload(audio_file)
-                    if audio_error:
-                        return audio_error
-
-                    audio_ext = pathlib.Path(audio_file.filename).suffix.lower() or ".wav"
-                    audio_filename = f"{safe_audio_basename}_{ObjectId()}{audio_ext}"
-                    audio_path = os.path.join(
-                        app.config["UPLOAD_FOLDER"], audio_filename
-                    )
-                    os.makedirs(os.path.dirname(audio_path), exist_ok=True)
-                    audio_file.save(audio_path)
-
-                # Always safe to call now
-                time_created = datetime.datetime.now()
-                save_image(
-                    user_id,
-                    unique_filename,
-                    title,
-                    description,
-                    time_created,
-                    audio_filename,
-                    sentiment,
-                )
-                save_notification(
-                    user_id, username, unique_filename, title, time_created, sentiment
+        elif audio_file:
+            audio_error = _validate_audio_file_upload(audio_file)
+            if audio_error:
+                return audio_error
+
+            audio_ext = pathlib.Path(audio_file.filename).suffix.lower() or ".wav"
+            audio_filename = f"{safe_audio_basename}_{ObjectId()}{audio_ext}"
+            write_audio_file(audio_file.stream, resolve_path(upload_folder, audio_filename))
+
+        stored_uploads = [
+            (stored_filename, original_filename, content_hash, audio_filename)
+            for stored_filename, original_filename, content_hash in entries
+        ]
+
+        # Take references first; only the first holder of a blob has to write its bytes.
+        # Everything up to the last insert is rolled back together if any step fails.
+        acquired = {}
+        recorded_images = []
+        recorded_jobs = []
+        try:
+            if audio_filename:
+                publish_file(upload_folder, audio_filename)
+            blobs_to_write = []
+            for stored_filename, blob in new_blobs.items():
+                refcount = acquire_blob(
+                    stored_filename, blob["content_hash"], blob["size"], blob["mime_type"], blob["count"]
                 )
-
-                # Generate PDF thumbnail if applicable
-                if unique_filename.lower().endswith(".pdf"):
-                    generate_pdf_thumbnail(filepath, unique_filename)
+                acquired[stored_filename] = blob["count"]
+                if refcount == blob["count"] or not os.path.exists(
+                    resolve_path(upload_folder, stored_filename)
+                ):
+                    blobs_to_write.append((stored_filename, blob["file"]))
+            for stored_filename, (content_hash, count) in existing_refs.items():
+                acquire_blob(stored_filename, content_hash, None, None, count)
+                acquired[stored_filename] = acquired.get(stored_filename, 0) + count
+
+            # Write files concurrently on the bounded upload I/O pool
+            futures = [
+                UPLOAD_IO_EXECUTOR.submit(_store_upload, file, upload_folder, stored_filename)
+                for stored_filename, file in blobs_to_write
+            ]
+            for future in futures:
+                future.result()
+
+            time_created = datetime.datetime.now()
+            if app.config["BACKGROUND_JOBS"]:
+                # The files are stored; metadata, notifications and thumbnails run in worker.py
+                pending_jobs = []
+                for stored_filename, original_filename, content_hash, audio_filename in stored_uploads:
+                    pending_jobs.extend(build_upload_jobs(
+                        ObjectId(),
+                        ObjectId(),
+                        user_id,
+                        username,
+                        stored_filename,
+                        title,
+                        description,
+                        time_created,
+                        audio_filename,
+                        sentiment,
+                        content_hash=content_hash,
+                        original_filename=original_filename,
+                    ))
+                if audio_filename:
+                    pending_jobs.append(build_voice_note_job(audio_filename, user_id))
+                recorded_jobs = [job["_id"] for job in pending_jobs]
+                enqueue_jobs(pending_jobs)
+            else:
+                # Record every file with one insert per collection
+                images = [
+                    build_image(
+                        user_id,
+                        stored_filename,
+                        title,
+                        description,
+                        time_created,
+                        audio_filename,
+                        sentiment,
+                        content_hash,
+                        original_filename,
+                    )
+                    for stored_filename, original_filename, content_hash, audio_filename in stored_uploads
+                ]
+                for image in images:
+                    image["_id"] = ObjectId()
+                recorded_images = [image["_id"] for image in images]
+                save_images(user_id, images)
+                save_notifications([
+                    build_notification(user_id, username, stored_filename, title, time_created)
+                    for stored_filename, original_filename, content_hash, audio_filename in stored_uploads
+                ])
+        except Exception:
+            # Nothing may point at the blobs once their references are dropped
+            delete_images(recorded_images)
+            delete_jobs(recorded_jobs)
+            for stored_filename, count in acquired.items():
+                if release_blob(stored_filename, count):
+                    discard_stored_upload(upload_folder, stored_filename)
+            if audio_filename:
+                discard_stored_upload(upload_folder, None, audio_filename)
+            raise
+
+        if recorded_jobs:
+            return jsonify({"message": "Upload successful", "jobs": [str(job_id) for job_id in recorded_jobs]}), 200
+
+        # Thumbnails and derivatives are encoded after the response, like the worker does
+        for stored_filename, _ in blobs_to_write:
+            UPLOAD_IO_EXECUTOR.submit(
+                _process_stored_media, upload_folder, stored_filename
+            ).add_done_callback(_log_background_failure)
+
+        if audio_filename:
+            # Transcoding can take a while; finish it after the response
+            UPLOAD_IO_EXECUTOR.submit(
+                process_voice_note, upload_folder, audio_filename
+            ).add_done_callback(_log_background_failure)
 
         return jsonify({"message": "Upload successful"}), 200
 
+    except UploadRejected as e:
+        return jsonify({"error": e.message}), e.status_code
+    except RequestEntityTooLarge:
+        # Raised while parsing the form when the audioData field exceeds MAX_FORM_MEMORY_SIZE
+        return _audio_size_error()
     except Exception as e:
         logging.error(f"Upload error: {str(e)}")  # Add logging
         return jsonify({"error": "Failed to upload file. Please try again."}), 500
 
 
+# Pre-upload check: which of these files does the user already hold?
+@app.route("/api/user/upload/check", methods=["POST"])
+@require_auth
+def check_existing_uploads():
+    try:
+        data = request.get_json(silent=True) or {}
+        hashes = data.get("hashes")
+        if not isinstance(hashes, list) or not hashes:
+            return jsonify({"error": "hashes must be a non-empty list"}), 400
+        if len(hashes) > 100:
+            return jsonify({"error": "At most 100 hashes can be checked at once"}), 400
+        hashes = [h.lower() if isinstance(h, str) else h for h in hashes]
+        if not all(is_content_hash(h) for h in hashes):
+            return jsonify({"error": "Invalid content hash"}), 400
+
+        # Only the caller's own uploads are reported so the check cannot probe other users' files
+        known = get_user_blobs_by_content_hash(request.current_user["id"], hashes)
+        return jsonify({"existing": [h for h in hashes if h in known]}), 200
+    except Exception as e:
+        logging.error(f"Error checking existing uploads: {str(e)}")
+        return jsonify({"error": "Failed to check uploads. Please try again."}), 500
+
+
+UPLOAD_STAGING_DIRNAME = ".staging"
+RESUMABLE_CHUNK_READ_SIZE = 64 * 1024
+
+
+def _staging_path(session_id):
+    return os.path.join(
+        app.config["UPLOAD_FOLDER"], UPLOAD_STAGING_DIRNAME, f"{session_id}.part"
+    )
+
+
+def _validate_stored_file(path, filename):
+    """
+    Run the upload MIME and size validation against a file already on disk.
+    Returns (mime_type, None) when valid or (None, response) when invalid.
+    """
+    with open(path, "rb") as f:
+        file_header = f.read(MIME_SNIFF_BYTES)
+    file_mime_type = detect_mime(file_header)
+    if file_mime_type is None:
+        return None, (jsonify({"error": "Server MIME detection unavailable; contact administrator."}), 500)
+
+    if file_mime_type not in ALLOWED_MIME_TYPES:
+        return None, (jsonify(
+            {
+                "error": f'File content validation failed. Detected type "{file_mime_type}" is not allowed.'
+            }
+        ), 400)
+
+    max_allowed = MIME_SIZE_LIMITS.get(file_mime_type)
+    if max_allowed is None:
+        return None, (jsonify({"error": f"Unsupported MIME type: {file_mime_type}"}), 400)
+    if os.path.getsize(path) > max_allowed:
+        return None, (jsonify({"error": size_limit_error_message(filename, max_allowed)}), 413)
+
+    return file_mime_type, None
+
+
+def _load_owned_upload_session(session_id):
+    """
+    Fetch an upload session and verify it belongs to the current user.
+    Returns (session, None) or (None, response).
+    """
+    try:
+        upload_session = get_upload_session(session_id)
+    except InvalidId:
+        return None, (jsonify({"error": "Invalid upload session ID format."}), 400)
+
+    if not upload_session:
+        return None, (jsonify({"error": "Upload session not found."}), 404)
+    if not check_owner(request.current_user["id"], upload_session["user_id"]):
+        return None, (jsonify({"error": "Unauthorized: You do not own this upload session."}), 403)
+
+    expires_at = upload_session["expires_at"]
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=datetime.timezone.utc)
+    if upload_session["status"] != "completed" and expires_at < datetime.datetime.now(datetime.timezone.utc):
+        return None, (jsonify({"error": "Upload session expired."}), 410)
+
+    return upload_session, None
+
+
+def _upload_session_response(upload_session, status_code=200, extra=None):
+    response = jsonify(
+        {
+            "session_id": str(upload_session["_id"]),
+            "offset": upload_session["offset"],
+            "size": upload_session["total_size"],
+            "status": upload_session["status"],
+            "direct": upload_session.get("direct", False),
+            **(extra or {}),
+        }
+    )
+    response.headers["Upload-Offset"] = str(upload_session["offset"])
+    return response, status_code
+
+
+def _direct_upload_filename(upload_session):
+    return blob_filename(upload_session["content_hash"], upload_session["mime_type"])
+
+
+def _create_direct_upload(user_id, username, original_filename, total_size, title, description, sentiment, data):
+    """
+    Create a session whose bytes the browser PUTs straight into the storage
+    bucket under the content-addressed key, with the declared SHA-256 enforced
+    by the bucket. Finalize then only checks the object's metadata and header.
+    """
+    storage = get_storage()
+    # Only bucket backends can presign uploads
+    if not storage.remote:
+        return jsonify({"error": "Direct uploads require MEDIA_STORAGE_BACKEND=s3."}), 400
+
+    content_hash = str(data.get("sha256") or "").lower()
+    if not is_content_hash(content_hash):
+        return jsonify({"error": "sha256 must be the hex SHA-256 of the file"}), 400
+    mime_type = data.get("content_type")
+    if mime_type not in ALLOWED_MIME_TYPES or mime_type not in MIME_EXTENSIONS:
+        return jsonify({"error": f"Unsupported content_type: {mime_type}"}), 400
+    if total_size > MIME_SIZE_LIMITS[mime_type]:
+        return jsonify({"error": size_limit_error_message(original_filename, MIME_SIZE_LIMITS[mime_type])}), 413
+
+    session_id = create_upload_session(
+        user_id, username, original_filename, total_size, title, description, sentiment,
+        content_hash=content_hash, mime_type=mime_type,
+    )
+    upload_session = get_upload_session(session_id)
+    unique_filename = _direct_upload_filename(upload_session)
+    if get_user_blobs_by_content_hash(user_id, [content_hash]) and storage.head(storage_key(unique_filename)) is not None:
+        # The user already stored these bytes; finalize without uploading
+        upload = None
+    else:
+        upload = storage.presigned_put(storage_key(unique_filename), mime_type, content_hash)
+    return _upload_session_response(upload_session, 201, {"upload": upload})
+
+
+def _store_staged_upload(session_id, upload_session):
+    """
+    Validate the assembled staging file and move it into place.
+    Returns ((stored filename, content hash, refcount), None) or (None, response).
+    """
+    staging_path = _staging_path(session_id)
+    original_filename = upload_session["filename"]
+    file_mime_type, validation_error = _validate_stored_file(staging_path, original_filename)
+    if validation_error:
+        delete_upload_session(session_id)
+        os.remove(staging_path)
+        return None, validation_error
+
+    content_hash = hash_file(staging_path)
+    unique_filename = blob_filename(content_hash, file_mime_type)
+    filepath = resolve_path(app.config["UPLOAD_FOLDER"], unique_filename)
+    refcount = acquire_blob(
+        unique_filename, content_hash, os.path.getsize(staging_path), file_mime_type
+    )
+    try:
+        if refcount == 1 or not os.path.exists(filepath):
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            os.replace(staging_path, filepath)
+            publish_file(app.config["UPLOAD_FOLDER"], unique_filename)
+        else:
+            # Same bytes are already stored; drop the staged copy
+            os.remove(staging_path)
+    except Exception:
+        release_blob(unique_filename)
+        reset_upload_session_status(session_id)
+        raise
+    return (unique_filename, content_hash, refcount), None
+
+
+def _store_direct_upload(session_id, upload_session):
+    """
+    Verify the object a direct session uploaded to the bucket from its
+    metadata and first bytes, then take a blob reference. Same return value
+    as _store_staged_upload.
+    """
+    storage = get_storage()
+    content_hash = upload_session["content_hash"]
+    unique_filename = _direct_upload_filename(upload_session)
+    key = storage_key(unique_filename)
+
+    size = storage.head(key)
+    if size is None:
+        reset_upload_session_status(session_id)
+        return None, (jsonify({"error": "The file has not been uploaded yet."}), 409)
+
+    def reject(message, status_code=400):
+        delete_upload_session(session_id)
+        if not get_blob(unique_filename):
+            # Nothing references the object; do not leave unvalidated bytes in the bucket
+            storage.delete(key)
+        return None, (jsonify({"error": message}), status_code)
+
+    if size != upload_session["total_size"]:
+        return reject("Uploaded file size does not match the session.")
+    if storage.checksum_sha256(key) != content_hash:
+        return reject("Uploaded file does not match its SHA-256.")
+
+    file_mime_type = detect_mime(storage.read_range(key, MIME_SNIFF_BYTES))
+    if file_mime_type is None:
+        reset_upload_session_status(session_id)
+        return None, (jsonify({"error": "Server MIME detection unavailable; contact administrator."}), 500)
+    if file_mime_type not in ALLOWED_MIME_TYPES or blob_filename(content_hash, file_mime_type) != unique_filename:
+        return reject(f'File content validation failed. Detected type "{file_mime_type}" is not allowed.')
+    if size > MIME_SIZE_LIMITS[file_mime_type]:
+        return reject(size_limit_error_message(upload_session["filename"], MIME_SIZE_LIMITS[file_mime_type]), 413)
+
+    refcount = acquire_blob(unique_filename, content_hash, size, file_mime_type)
+    return (unique_filename, content_hash, refcount), None
+
+
+def _process_fetched_media(upload_folder, filename):
+    """Download a directly uploaded file into UPLOAD_FOLDER and process it."""
+    if fetch_file(upload_folder, filename) is not None:
+        _process_stored_media(upload_folder, filename)
+
+
+# Resumable upload: create a session
+@app.route("/api/user/upload/sessions", methods=["POST"])
+@require_auth
+def create_resumable_upload():
+    user_id = request.current_user["id"]
+    try:
+        data = request.get_json(silent=True) or {}
+        original_filename = secure_filename(data.get("filename") or "")
+        title = sanitize_text(data.get("title", ""))
+        description = sanitize_text(data.get("description", ""))
+        sentiment = sanitize_text(data.get("sentiment"))
+        username = sanitize_text(data.get("username", ""))
+
+        if not original_filename:
+            return jsonify({"error": "No file selected"}), 400
+        if not title or not description:
+            return jsonify({"error": "Title and description are required"}), 400
+        if file_extension(original_filename) not in ALLOWED_EXTENSIONS:
+            return jsonify({"error": extension_error_message()}), 400
+
+        try:
+            total_size = int(data.get("size"))
+        except (TypeError, ValueError):
+            return jsonify({"error": "File size must be an integer"}), 400
+        max_allowed = max(MIME_SIZE_LIMITS.values())
+        if total_size <= 0:
+            return jsonify({"error": "File size must be positive"}), 400
+        if total_size > max_allowed:
+            return jsonify({"error": size_limit_error_message(original_filename, max_allowed)}), 413
+
+        if data.get("direct"):
+            return _create_direct_upload(
+                user_id, username, original_filename, total_size, title, description, sentiment, data
+            )
+
+        session_id = create_upload_session(
+            user_id, username, original_filename, total_size, title, description, sentiment
+        )
+        staging_path = _staging_path(session_id)
+        os.makedirs(os.path.dirname(staging_path), exist_ok=True)
+        open(staging_path, "wb").close()
+
+        return _upload_session_response(get_upload_session(session_id), 201)
+
+    except Exception as e:
+        logging.error(f"Error creating upload session: {str(e)}")
+        return jsonify({"error": "Failed to create upload session. Please try again."}), 500
+
+
+# Resumable upload: query the last committed offset
+@app.route("/api/user/upload/sessions/<session_id>", methods=["GET"])
+@require_auth
+def get_resumable_upload(session_id):
+    try:
+        upload_session, error = _load_owned_upload_session(session_id)
+        if error:
+            return error
+        return _upload_session_response(upload_session)
+    except Exception as e:
+        logging.error(f"Error fetching upload session '{session_id}': {str(e)}")
+        return jsonify({"error": "Failed to fetch upload session. Please try again."}), 500
+
+
+# Resumable upload: append a chunk at the committed offset
+@app.route("/api/user/upload/sessions/<session_id>", methods=["PATCH"])
+@require_auth
+@admit_upload
+def append_resumable_upload_chunk(session_id):
+    try:
+        upload_session, error = _load_owned_upload_session(session_id)
+        if error:
+            return error
+        if upload_session["status"] != "uploading":
+            return jsonify({"error": "Upload session is not accepting chunks."}), 409
+        if upload_session.get("direct"):
+            return jsonify({"error": "Direct uploads are sent to the storage bucket, not in chunks."}), 409
+
+        try:
+            client_offset = int(request.headers.get("Upload-Offset", ""))
+        except ValueError:
+            return jsonify({"error": "Upload-Offset header must be an integer"}), 400
+
+        committed_offset = upload_session["offset"]
+        if client_offset != committed_offset:
+            # Tell the client where to resume from
+            response, _ = _upload_session_response(upload_session)
+            return response, 409
+
+        remaining = upload_session["total_size"] - committed_offset
+        staging_path = _staging_path(session_id)
+        written = 0
+        with open(staging_path, "r+b") as f:
+            # Drop bytes a previously interrupted chunk wrote past the committed offset
+            f.truncate(committed_offset)
+            f.seek(committed_offset)
+            while True:
+                chunk = request.stream.read(RESUMABLE_CHUNK_READ_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > remaining:
+                    f.truncate(committed_offset)
+                    return jsonify({"error": "Chunk exceeds the declared file size"}), 413
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+        new_offset = committed_offset + written
+        if not advance_upload_offset(session_id, committed_offset, new_offset):
+            return _upload_session_response(get_upload_session(session_id))[0], 409
+
+        upload_session["offset"] = new_offset
+        return _upload_session_response(upload_session)
+
+    except Exception as e:
+        logging.error(f"Error appending to upload session '{session_id}': {str(e)}")
+        return jsonify({"error": "Failed to store upload chunk. Please try again."}), 500
+
+
+# Resumable upload: validate and store the assembled file
+@app.route("/api/user/upload/sessions/<session_id>/finalize", methods=["POST"])
+@require_auth
+@admit_upload
+def finalize_resumable_upload(session_id):
+    user_id = request.current_user["id"]
+    try:
+        upload_session, error = _load_owned_upload_session(session_id)
+        if error:
+            return error
+        direct = upload_session.get("direct", False)
+        if not direct and upload_session["offset"] != upload_session["total_size"]:
+            return _upload_session_response(upload_session)[0], 409
+        if not mark_upload_session_finalizing(session_id):
+            return jsonify({"error": "Upload session is not ready to finalize."}), 409
+
+        if direct:
+            stored, error = _store_direct_upload(session_id, upload_session)
+        else:
+            stored, error = _store_staged_upload(session_id, upload_session)
+        if error:
+            return error
+        unique_filename, content_hash, refcount = stored
+        original_filename = upload_session["filename"]
+
+        time_created = datetime.datetime.now()
+        if app.config["BACKGROUND_JOBS"]:
+            job_ids = enqueue_jobs(build_upload_jobs(
+                ObjectId(),
+                ObjectId(),
+                user_id,
+                upload_session["username"],
+                unique_filename,
+                upload_session["title"],
+                upload_session["description"],
+                time_created,
+                None,
+                upload_session["sentiment"],
+                content_hash=content_hash,
+                original_filename=original_filename,
+            ))
+            complete_upload_session(session_id, unique_filename)
+            return jsonify({
+                "message": "Upload successful",
+                "filename": unique_filename,
+                "jobs": [str(job_id) for job_id in job_ids],
+            }), 200
+
+        save_image(
+            user_id,
+            unique_filename,
+            upload_session["title"],
+            upload_session["description"],
+            time_created,
+            None,
+            upload_session["sentiment"],
+            content_hash=content_hash,
+            original_filename=original_filename,
+        )
+        save_notification(
+            user_id,
+            upload_session["username"],
+            unique_filename,
+            upload_session["title"],
+            time_created,
+            upload_session["sentiment"],
+        )
+        complete_upload_session(session_id, unique_filename)
+
+        if refcount == 1:
+            # Thumbnails and derivatives are encoded after the response; a direct
+            # upload is downloaded from the bucket first
+            process = _process_fetched_media if direct else _process_stored_media
+            UPLOAD_IO_EXECUTOR.submit(
+                process, app.config["UPLOAD_FOLDER"], unique_filename
+            ).add_done_callback(_log_background_failure)
+
+        return jsonify({"message": "Upload successful", "filename": unique_filename}), 200
+
+    except Exception as e:
+        logging.error(f"Error finalizing upload session '{session_id}': {str(e)}")
+        return jsonify({"error": "Failed to finalize upload. Please try again."}), 500
+
+
+# Resumable upload: cancel a session and discard its staged bytes
+@app.route("/api/user/upload/sessions/<session_id>", methods=["DELETE"])
+@require_auth
+def cancel_resumable_upload(session_id):
+    try:
+        upload_session, error = _load_owned_upload_session(session_id)
+        if error:
+            return error
+        if upload_session["status"] == "completed":
+            return jsonify({"error": "Upload session already completed."}), 409
+
+        staging_path = _staging_path(session_id)
+        if os.path.exists(staging_path):
+            os.remove(staging_path)
+        if upload_session.get("direct") and not get_blob(_direct_upload_filename(upload_session)):
+            # Drop bytes the browser may already have put in the bucket
+            get_storage().delete(storage_key(_direct_upload_filename(upload_session)))
+        delete_upload_session(session_id)
+        return jsonify({"message": "Upload session cancelled"}), 200
+    except Exception as e:
+        logging.error(f"Error cancelling upload session '{session_id}': {str(e)}")
+        return jsonify({"error": "Failed to cancel upload session. Please try again."}), 500
+
+
+# Background job status
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+@require_auth
+def get_job_status(job_id):
+    try:
+        try:
+            job = get_job(job_id)
+        except InvalidId:
+            return jsonify({"error": "Invalid job ID format."}), 400
+        if not job:
+            return jsonify({"error": "Job not found."}), 404
+
+        is_admin = request.current_user.get("role") == "admin"
+        if not (is_admin or check_owner(request.current_user["id"], job.get("user_id"))):
+            return jsonify({"error": "Unauthorized: You do not own this job."}), 403
+
+        return jsonify({
+            "id": str(job["_id"]),
+            "type": job["type"],
+            "status": job["status"],
+            "attempts": job["attempts"],
+            "maxAttempts": job["max_attempts"],
+            "lastError": job.get("last_error"),
+            "createdAt": job["created_at"].isoformat(),
+            "finishedAt": job["finished_at"].isoformat() if job.get("finished_at") else None,
+        }), 200
+    except Exception as e:
+        logging.error(f"Error fetching job '{job_id}': {str(e)}")
+        return jsonify({"error": "Failed to fetch job status. Please try again."}), 500
+
+
 api_key = os.getenv("GOOGLE_API_KEY")
 if not api_key or api_key == "your_google_api_key_here":
     app_logger.warning(
@@ -566,45 +1179,16 @@ def analyze_media():
         return jsonify({"error": "Failed to analyze media. Please try again."}), 500
 
 
-# generate thumbnail for the pdf
-def generate_pdf_thumbnail(pdf_path, filename):
-    """Generate an image from the first page of a PDF using PyMuPDF."""
-    # Ensure the thumbnails directory exists
-    thumbnails_dir = os.path.join(app.config["UPLOAD_FOLDER"], "thumbnails")
-    os.makedirs(thumbnails_dir, exist_ok=True)
-
-    try:
-        with fitz.open(pdf_path) as pdf_document:
-            if not pdf_document.page_count:
-                app_logger.warning(f"PDF '{filename}' has no pages, cannot generate thumbnail.")
-                return None
-
-            # select only the first page for the thumbnail
-            first_page = pdf_document.load_page(0)
-
-            zoom = 2  # Increase for higher resolution
-            mat = fitz.Matrix(zoom, zoom)
-            pix = first_page.get_pixmap(matrix=mat)
-
-            image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-            # Robust filename handling
-            name, _ = os.path.splitext(filename)
-            thumbnail_filename = f"{name}.jpg"
-            thumbnail_path = os.path.join(thumbnails_dir, thumbnail_filename)
-            image.save(thumbnail_path, "JPEG")
-
-        return thumbnail_path
-    except Exception as e:
-        app_logger.error(f"Failed to generate thumbnail for PDF '{filename}': {e}")
-        return None
-
-
-
 def check_owner(current_id, resource_id):
     """Compares two IDs for equality by converting them to strings to handle type differences."""
     return str(current_id) == str(resource_id)
 
+def _can_access_image(image):
+    """Admins can access every upload, other users only their own."""
+    # Current user info comes from the JWT token (set by @require_auth decorator)
+    is_admin = request.current_user.get("role", "user") == "admin"
+    return is_admin or check_owner(request.current_user.get("id"), image.get("user_id"))
+
 # Edit images uploaded by the user
 @app.route("/edit/<image_id>", methods=["PATCH"])
 @require_auth
@@ -637,6 +1221,7 @@ def edit_image(image_id):
 
         # Update the image
         update_image(image_id, title, description, sentiment)
+        audio_owner_cache.invalidate(image.get("audio_filename"))
         return jsonify({"message": "Image updated successfully!"}), 200
 
     except Exception as e:
@@ -644,38 +1229,124 @@ def edit_image(image_id):
         return jsonify({"error": "Failed to update image. Please try again."}), 500
 
 
-@app.route("/api/audio/<filename>")
+def _send_audio(filename):
+    storage = get_storage()
+    if storage.remote:
+        # The bytes come straight from the bucket through a short-lived signed URL
+        return redirect(storage.url(storage_key(filename)))
+    return send_media(
+        app.config["UPLOAD_FOLDER"],
+        resolve_relpath(app.config["UPLOAD_FOLDER"], filename),
+        UPLOADS_LOCATION,
+    )
+
+
+def _load_audio_owner(filename):
+    image = get_image_by_audio_filename(filename)
+    return image.get("user_id") if image else None
+
+
 @require_auth
-def serve_audio(filename):
+def _serve_owned_audio(filename):
     """Serve audio files with ownership verification to prevent IDOR attacks."""
+    # Owner of the image record associated with this audio file, cached per process
+    owner_id = audio_owner_cache.get_owner(filename, _load_audio_owner)
+
+    # If no record found, the audio file doesn't exist or isn't associated with any upload
+    if owner_id is None:
+        return jsonify({"error": "Audio file not found"}), 404
+
+    # Allow access if user is admin OR owns the audio file
+    if not _can_access_image({"user_id": owner_id}):
+        return jsonify({"error": "Unauthorized: You do not have permission to access this audio file"}), 403
+
+    # User is authorized (either admin or owner), serve the file
+    return _send_audio(filename)
+
+
+@app.route("/api/audio/<filename>")
+def serve_audio(filename):
+    """
+    Serve a voice note. URLs signed by the list endpoints are served without a
+    token or database lookup; anything else needs a JWT for the owner or an admin.
+    """
     try:
-        # Query database to find the image record associated with this audio file
-        image = get_image_by_audio_filename(filename)
-        
-        # If no record found, the audio file doesn't exist or isn't associated with any upload
-        if not image:
-            return jsonify({"error": "Audio file not found"}), 404
-        
-        # Get current user info from the JWT token (set by @require_auth decorator)
-        current_user_id = request.current_user.get("id")
-        current_user_role = request.current_user.get("role", "user")
-        image_owner_id = image.get("user_id")
-        
-        # Allow access if user is admin OR owns the audio file
-        is_admin = current_user_role == "admin"
-        is_owner = check_owner(current_user_id, image_owner_id)
-        
-        if not (is_admin or is_owner):
-            return jsonify({"error": "Unauthorized: You do not have permission to access this audio file"}), 403
-        
-        # User is authorized (either admin or owner), serve the file
-        return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
-        
+        if "sig" in request.args:
+            if not verify_media_signature(request.path, request.args):
+                return jsonify({"error": "Invalid or expired media URL"}), 403
+            return _send_audio(filename)
+        return _serve_owned_audio(filename)
+
+    except NotFound:
+        # The image record outlived its file
+        return jsonify({"error": "Audio file not found"}), 404
     except Exception as e:
         logging.error(f"Error serving audio file '{filename}': {str(e)}")
         return jsonify({"error": "Failed to serve audio file"}), 500
 
 
+# Serve an upload resized on demand, e.g. /api/media/<image_id>?w=640&fmt=webp
+@app.route("/api/media/<image_id>")
+@require_auth
+def serve_resized_media(image_id):
+    try:
+        try:
+            image = get_image_by_id(ObjectId(image_id))
+        except InvalidId:
+            return jsonify({"error": "Invalid image ID format."}), 400
+        if not image:
+            return jsonify({"error": "Image not found."}), 404
+        if not _can_access_image(image):
+            return jsonify({"error": "Unauthorized: You do not have permission to access this image"}), 403
+
+        # Requested sizes are clamped to MAX_RESIZE_DIMENSION to bound the cache key space
+        max_dimension = app.config["MAX_RESIZE_DIMENSION"]
+        width = parse_int_param("w", 0, 0, max_dimension) or None
+        height = parse_int_param("h", 0, 0, max_dimension) or None
+        if width is None and height is None:
+            return jsonify({"error": "A positive 'w' or 'h' parameter is required."}), 400
+
+        fmt = request.args.get("fmt", "webp").lower()
+        if fmt == "jpeg":
+            fmt = "jpg"
+        if fmt not in derivative_formats():
+            return jsonify({"error": f"Unsupported format '{fmt}'. Allowed: {', '.join(derivative_formats())}"}), 400
+
+        source_path = fetch_derivative_source(app.config["UPLOAD_FOLDER"], image["filename"])
+        try:
+            source_mtime = os.stat(source_path).st_mtime_ns if source_path else None
+        except FileNotFoundError:
+            source_mtime = None
+        if source_mtime is None:
+            return jsonify({"error": "Media not available."}), 404
+
+        # The source mtime is part of the key so a replaced file never serves a stale resize
+        cache_name = f"{ResizeCache.key_for(image_id, width, height, fmt, source_mtime)}.{fmt}"
+        try:
+            cached_path = MEDIA_RESIZE_CACHE.get_or_create(
+                cache_name,
+                lambda temp_path: render_resized(source_path, width, height, fmt, temp_path),
+            )
+        except (OSError, ValueError) as e:
+            logging.error(f"Error resizing media for image '{image_id}': {str(e)}")
+            return jsonify({"error": "Media could not be resized."}), 422
+
+        # The cache key covers the parameters and the source mtime, so a resize never changes either
+        return send_media(
+            MEDIA_RESIZE_CACHE.directory,
+            os.path.basename(cached_path),
+            MEDIA_CACHE_LOCATION,
+            mimetype=MEDIA_MIME_TYPES[fmt],
+        )
+
+    except NotFound:
+        # Evicted from the resize cache by another process sharing the directory
+        return jsonify({"error": "Media not available."}), 404
+    except Exception as e:
+        logging.error(f"Error serving media for image '{image_id}': {str(e)}")
+        return jsonify({"error": "Failed to serve media"}), 500
+
+
 # Delete images uploaded by the user
 @app.route("/delete/<image_id>", methods=["DELETE"])
 @require_auth
@@ -698,30 +1369,19 @@ def delete_image_route(image_id):
         if not check_owner(current_user_id, image_owner_id):
             return jsonify({"error": "Unauthorized: You do not own this image."}), 403
 
-        # Delete image file from upload directory
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], image["filename"])
-        if os.path.exists(filepath):
-            os.remove(filepath)
-            # Also delete thumbnail if it exists
-            if image["filename"].lower().endswith(".pdf"):
-                thumbnail_path = os.path.join(
-                    app.config["UPLOAD_FOLDER"],
-                    "thumbnails",
-                    image["filename"].replace(".pdf", ".jpg"),
-                )
-                if os.path.exists(thumbnail_path):
-                    os.remove(thumbnail_path)
-
-        # Delete audio file if it exists
-        if image.get("audio_filename"):
-            audio_path = os.path.join(
-                app.config["UPLOAD_FOLDER"], image["audio_filename"]
-            )
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-
         # Delete image record from database
         delete_image(image_id)
+        audio_owner_cache.invalidate(image.get("audio_filename"))
+
+        # Shared blobs are only unlinked (with their thumbnail) once the last image using them is gone
+        if release_blob(image["filename"]):
+            discard_stored_upload(app.config["UPLOAD_FOLDER"], image["filename"])
+
+        # Delete audio file if it exists and no other image of the same upload (live or in the
+        # undo window of a bulk delete) still uses it
+        if image.get("audio_filename") and not get_referenced_filenames([image["audio_filename"]]):
+            discard_stored_upload(app.config["UPLOAD_FOLDER"], None, image["audio_filename"])
+
         return jsonify({"message": "Image deleted successfully!"}), 200
 
     except Exception as e:
@@ -729,6 +1389,96 @@ def delete_image_route(image_id):
         return jsonify({"error": "Failed to delete image. Please try again."}), 500
 
 
+def _parse_image_ids():
+    """Image ids from a JSON body `{"ids": [...]}`. Returns (ids, error response)."""
+    data = request.get_json(silent=True) or {}
+    raw_ids = data.get("ids")
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return None, (jsonify({"error": "ids must be a non-empty list of image ids."}), 400)
+    if len(raw_ids) > app.config["BULK_DELETE_MAX_IDS"]:
+        return None, (jsonify({
+            "error": f"At most {app.config['BULK_DELETE_MAX_IDS']} images can be handled per request."
+        }), 400)
+    try:
+        # Keep the request order, drop duplicates
+        return list(dict.fromkeys(ObjectId(image_id) for image_id in raw_ids)), None
+    except Exception:
+        return None, (jsonify({"error": "Invalid image ID format."}), 400)
+
+
+# Delete several images in one request
+@app.route("/api/user/images/delete", methods=["POST"])
+@require_auth
+def bulk_delete_images():
+    try:
+        image_ids, error = _parse_image_ids()
+        if error:
+            return error
+
+        # Ownership of every image is checked with one query; like delete_image_route, only owners delete
+        current_user_id = request.current_user.get("id")
+        images = get_images_by_ids(image_ids)
+        not_found = [image_id for image_id in image_ids if image_id not in images]
+        forbidden = [
+            image_id for image_id in image_ids
+            if image_id in images and not check_owner(current_user_id, images[image_id]["user_id"])
+        ]
+        deletable = [
+            image_id for image_id in image_ids
+            if image_id in images and image_id not in forbidden
+        ]
+
+        undo_seconds = app.config["DELETE_UNDO_SECONDS"]
+        purge_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=undo_seconds)
+        if deletable:
+            trash_images(deletable, current_user_id, purge_at)
+            audio_owner_cache.invalidate(*(images[image_id].get("audio_filename") for image_id in deletable))
+            # Files are released after the response (or the undo window) instead of inline
+            token = str(ObjectId())
+            if app.config["BACKGROUND_JOBS"]:
+                enqueue_jobs([build_purge_job(
+                    [str(image_id) for image_id in deletable], token, purge_at, current_user_id
+                )])
+            else:
+                UPLOAD_IO_EXECUTOR.submit(
+                    purge_deleted_images, app.config["UPLOAD_FOLDER"], deletable, token
+                ).add_done_callback(_log_background_failure)
+
+        return jsonify({
+            "deleted": [str(image_id) for image_id in deletable],
+            "not_found": [str(image_id) for image_id in not_found],
+            "forbidden": [str(image_id) for image_id in forbidden],
+            "undo_until": purge_at.isoformat() if deletable and undo_seconds > 0 else None,
+        }), 200
+
+    except Exception as e:
+        app_logger.error(f"Error deleting images: {str(e)}")
+        return jsonify({"error": "Failed to delete images. Please try again."}), 500
+
+
+# Restore images deleted less than DELETE_UNDO_SECONDS ago
+@app.route("/api/user/images/restore", methods=["POST"])
+@require_auth
+def restore_images():
+    try:
+        if app.config["DELETE_UNDO_SECONDS"] <= 0:
+            return jsonify({"error": "Undo is not enabled."}), 404
+        image_ids, error = _parse_image_ids()
+        if error:
+            return error
+
+        # Only the owners who could delete the images can bring them back
+        restored = set(restore_deleted_images(image_ids, request.current_user.get("id")))
+        return jsonify({
+            "restored": [str(image_id) for image_id in image_ids if image_id in restored],
+            "not_restored": [str(image_id) for image_id in image_ids if image_id not in restored],
+        }), 200
+
+    except Exception as e:
+        app_logger.error(f"Error restoring images: {str(e)}")
+        return jsonify({"error": "Failed to restore images. Please try again."}), 500
+
+
 # Get all images uploaded by a user with search and filter support
 @app.route("/api/user/user_uploads")
 @require_auth
@@ -767,6 +1517,11 @@ def user_images_show():
         
         limit = parse_int_param('limit', default=12, min_val=1, max_val=100)
         offset = parse_int_param('offset', default=0, min_val=0)
+        cursor = request.args.get('cursor', '').strip()
+        # count=false skips counting the matches for clients that only need hasMore
+        with_count = request.args.get('count', 'true').strip().lower() != 'false'
+        if cursor and sort_by == 'relevance':
+            return jsonify({"error": "Cursor pagination is not available when sorting by relevance. Use 'offset'."}), 400
         
         result = search_and_filter_images(
             user_id=user_id,
@@ -777,7 +1532,9 @@ def user_images_show():
             sort_by=sort_by,
             sort_order=sort_order,
             limit=limit,
-            offset=offset
+            offset=offset,
+            cursor=cursor or None,
+            with_count=with_count
         )
         
         response_data = {
@@ -786,6 +1543,7 @@ def user_images_show():
             'limit': result['limit'],
             'offset': result['offset'],
             'hasMore': result['hasMore'],
+            'next_cursor': result['next_cursor'],
             'user_id': user_id,
             'message': 'Success'
         }
@@ -799,6 +1557,9 @@ def user_images_show():
         return jsonify({"error": "Failed to fetch uploads. Please try again."}), 500
 
 
+NOTIFICATIONS_SORT = "timestamp:-1"
+
+
 @app.route("/api/admin/notifications", methods=["GET"])
 @require_admin_role
 def get_admin_notifications():
@@ -807,22 +1568,30 @@ def get_admin_notifications():
 
         try:
             page = int(request.args.get("page", 1))
-            per_page = int(request.args.get("limit", 5))
+            per_page = max(1, int(request.args.get("limit", 5)))
         except ValueError:
             return jsonify(
                 {"error": "Invalid 'page' or 'limit' parameter. Must be an integer."}
             ), 400
         skip = (page - 1) * per_page
+        # `cursor` (the previous page's next_cursor) seeks instead of skipping
+        cursor = request.args.get("cursor", "").strip()
+        try:
+            after = decode_cursor(cursor, NOTIFICATIONS_SORT) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Count unseen notifications
         unseen_count = notification_collection.count_documents({"seen": False})
 
-        notifications = list(
-            notification_collection.find({})
-            .sort("timestamp", -1)
-            .skip(skip)
-            .limit(per_page)
-        )
+        if after is not None:
+            results = notification_collection.find(keyset_query({}, "timestamp", -1, *after))
+        else:
+            results = notification_collection.find({}).skip(skip)
+        notifications = list(results.sort([("timestamp", -1), ("_id", -1)]).limit(per_page + 1))
+        has_more = len(notifications) > per_page
+        notifications = notifications[:per_page]
+        cursor_after = next_cursor(notifications, NOTIFICATIONS_SORT, "timestamp", has_more)
 
         for n in notifications:
             n["_id"] = str(n["_id"])
@@ -830,7 +1599,8 @@ def get_admin_notifications():
                 n["timestamp"] = n["timestamp"].isoformat()
 
         return jsonify(
-            {"notifications": notifications, "unseen_count": unseen_count, "page": page}
+            {"notifications": notifications, "unseen_count": unseen_count, "page": page,
+             "next_cursor": cursor_after}
         ), 200
 
     except Exception as e:
@@ -963,8 +1733,8 @@ app.register_blueprint(admin_bp)
 from routes.auth import auth_bp
 app.register_blueprint(auth_bp, url_prefix="/api/auth")
 
-# Initialize text index for search functionality
-initialize_text_index()
+# Build missing indexes (including the text index used by search) without delaying start-up
+ensure_indexes_in_background()
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,96 @@
+"""
+Render missing thumbnails (and preview strips) for PDFs already in UPLOAD_FOLDER,
+in either the sharded or the flat layout.
+
+    python backfill_thumbnails.py --workers 4 --preview-pages 3
+
+Safe to interrupt and re-run: PDFs whose renders exist are skipped unless
+--force is given.
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import Config
+from utils.logger import Logger
+from utils.thumbnails import (
+    PdfRenderer,
+    generate_pdf_thumbnail,
+    preview_strip_path,
+    remove_pdf_thumbnails,
+    thumbnail_path,
+)
+from utils.upload_paths import iter_stored_files, resolve_path
+
+logger = Logger.get_logger("backfill_thumbnails")
+
+
+def find_pdfs(upload_folder, preview_pages, force):
+    for filename in iter_stored_files(upload_folder):
+        if not filename.lower().endswith(".pdf"):
+            continue
+        if not force and os.path.exists(thumbnail_path(upload_folder, filename)) and (
+            not preview_pages or os.path.exists(preview_strip_path(upload_folder, filename))
+        ):
+            continue
+        yield filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill PDF thumbnails for existing uploads.")
+    parser.add_argument(
+        "--workers", type=int, default=Config.PDF_RENDER_WORKERS,
+        help="Number of render processes",
+    )
+    parser.add_argument(
+        "--preview-pages", type=int, default=Config.PDF_PREVIEW_PAGES,
+        help="Also render a strip of the first N pages (0 = thumbnail only)",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Re-render PDFs that already have thumbnails",
+    )
+    args = parser.parse_args()
+
+    upload_folder = Config.UPLOAD_FOLDER
+    workers = max(1, args.workers)
+    renderer = PdfRenderer(workers)
+    if args.force:
+        # Drop existing renders so the content-hash cache does not short-circuit them
+        for filename in find_pdfs(upload_folder, args.preview_pages, force=True):
+            remove_pdf_thumbnails(upload_folder, filename)
+
+    rendered = failed = 0
+    try:
+        # Threads only wait on the process pool, which does the rendering
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    generate_pdf_thumbnail,
+                    resolve_path(upload_folder, filename),
+                    filename,
+                    upload_folder,
+                    args.preview_pages,
+                    renderer,
+                ): filename
+                for filename in find_pdfs(upload_folder, args.preview_pages, force=False)
+            }
+            for future in as_completed(futures):
+                if future.result():
+                    rendered += 1
+                else:
+                    failed += 1
+                    logger.warning(f"Could not render '{futures[future]}'")
+    finally:
+        renderer.shutdown()
+
+    logger.info(f"Backfill finished: {rendered} rendered, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -14,10 +14,106 @@ class Config:
     SECRET_KEY = os.getenv('FLASK_SECRET_KEY')
     UPLOAD_FOLDER = 'static/uploads'
     PDF_THUMBNAIL_FOLDER = 'static/uploads/thumbnails/'
+    # Validate uploads while the request body is parsed and land them with a rename
+    STREAMING_UPLOADS = os.getenv('STREAMING_UPLOADS', 'true').lower() == 'true'
+    # Threads used to write the files of a multi-file upload concurrently
+    UPLOAD_IO_WORKERS = int(os.getenv('UPLOAD_IO_WORKERS', 4))
+    # Files are stored under two levels of hash-prefix directories; until
+    # migrate_uploads.py has run, reads also fall back to the old flat layout
+    UPLOAD_FLAT_FALLBACK = os.getenv('UPLOAD_FLAT_FALLBACK', 'true').lower() == 'true'
+
+    # Where stored media lives: 'local' (UPLOAD_FOLDER, served as static files)
+    # or 's3' (any S3-compatible bucket, served with presigned URLs; needs boto3)
+    MEDIA_STORAGE_BACKEND = os.getenv('MEDIA_STORAGE_BACKEND', 'local').lower()
+    S3_BUCKET = os.getenv('S3_BUCKET')
+    S3_KEY_PREFIX = os.getenv('S3_KEY_PREFIX', '')
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+    S3_REGION = os.getenv('S3_REGION')
+    S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID')
+    S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY')
+    S3_ADDRESSING_STYLE = os.getenv('S3_ADDRESSING_STYLE', 'auto')
+    S3_PRESIGN_EXPIRES_SECONDS = int(os.getenv('S3_PRESIGN_EXPIRES_SECONDS', 900))
+
+    # PDF thumbnails are rendered in a process pool, capped to this many
+    # pixels on the longest edge; PDF_PREVIEW_PAGES > 0 also renders a strip
+    # of the first pages
+    PDF_RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', 2))
+    PDF_THUMBNAIL_MAX_DIMENSION = int(os.getenv('PDF_THUMBNAIL_MAX_DIMENSION', 1600))
+    PDF_PREVIEW_PAGES = int(os.getenv('PDF_PREVIEW_PAGES', 0))
+
+    # Voice notes are transcoded to mono Opus after upload when ffmpeg is installed;
+    # list endpoints return WAVEFORM_PEAKS amplitude values per voice note
+    FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+    AUDIO_OPUS_BITRATE = os.getenv('AUDIO_OPUS_BITRATE', '24k')
+    WAVEFORM_PEAKS = int(os.getenv('WAVEFORM_PEAKS', 64))
+
+    # On-demand resizes from /api/media/<image_id>, kept in a size-capped LRU
+    # disk cache outside the public static folder
+    MEDIA_CACHE_FOLDER = os.getenv('MEDIA_CACHE_FOLDER', 'cache/media')
+    MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+    MAX_RESIZE_DIMENSION = int(os.getenv('MAX_RESIZE_DIMENSION', 2048))
+
+    # Authorized media views can leave the download to the front proxy:
+    # 'off', 'x-accel-redirect' (nginx) or 'x-sendfile'; see utils/media_delivery.py
+    MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', 'off').lower()
+    MEDIA_OFFLOAD_PREFIX = os.getenv('MEDIA_OFFLOAD_PREFIX', '/_protected')
+    USE_X_SENDFILE = MEDIA_OFFLOAD == 'x-sendfile'
+    # Stored media never changes, so browsers and proxies may keep it this long
+    MEDIA_MAX_AGE_SECONDS = int(os.getenv('MEDIA_MAX_AGE_SECONDS', 365 * 24 * 3600))
+
+    # Key for the names of stored uploads, so a file's URL cannot be derived
+    # from its bytes; see utils/content_store.py. Empty derives a key from JWT_SECRET.
+    UPLOAD_NAME_KEY = os.getenv('UPLOAD_NAME_KEY', '')
+
+    # Signed /api/audio URLs in list responses (served without a database
+    # lookup): comma-separated kid:secret keys, the first one signs; see
+    # utils/media_signing.py. Empty derives a key from JWT_SECRET.
+    MEDIA_URL_SIGNING_KEYS = [key.strip() for key in os.getenv('MEDIA_URL_SIGNING_KEYS', '').split(',') if key.strip()]
+    MEDIA_URL_TTL_SECONDS = int(os.getenv('MEDIA_URL_TTL_SECONDS', 3600))
+
+    # Per-process LRU of voice note owners for unsigned /api/audio requests
+    MEDIA_OWNER_CACHE_SIZE = int(os.getenv('MEDIA_OWNER_CACHE_SIZE', 10000))
+    MEDIA_OWNER_CACHE_TTL_SECONDS = int(os.getenv('MEDIA_OWNER_CACHE_TTL_SECONDS', 300))
+
+    # Upload admission control (per process); see utils/admission.py
+    UPLOAD_MAX_INFLIGHT_REQUESTS = int(os.getenv('UPLOAD_MAX_INFLIGHT_REQUESTS', 8))
+    UPLOAD_MAX_INFLIGHT_BYTES = int(os.getenv('UPLOAD_MAX_INFLIGHT_BYTES', 64 * 1024 * 1024))
+    UPLOAD_MIN_FREE_DISK_BYTES = int(os.getenv('UPLOAD_MIN_FREE_DISK_BYTES', 1024 * 1024 * 1024))
+    UPLOAD_MAX_QUEUE_DEPTH = int(os.getenv('UPLOAD_MAX_QUEUE_DEPTH', 5000))
+    UPLOAD_RETRY_AFTER_SECONDS = int(os.getenv('UPLOAD_RETRY_AFTER_SECONDS', 5))
+
+    # Background jobs: when enabled, uploads enqueue thumbnail, metadata and
+    # notification work for worker.py instead of running it in the request
+    BACKGROUND_JOBS = os.getenv('BACKGROUND_JOBS', 'false').lower() == 'true'
+    JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', 4))
+    JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.getenv('JOB_VISIBILITY_TIMEOUT_SECONDS', 300))
+
+    # Bulk delete: images are removed at once and their files purged in the
+    # background. With an undo window (requires BACKGROUND_JOBS) deleted
+    # images can be restored until it has passed.
+    BULK_DELETE_MAX_IDS = int(os.getenv('BULK_DELETE_MAX_IDS', 500))
+    DELETE_UNDO_SECONDS = int(os.getenv('DELETE_UNDO_SECONDS', 0))
     
     # Database Configuration
     MONGODB_URI = os.getenv('MONGODB_URI')
     DATABASE_NAME = os.getenv('DATABASE_NAME', 'beehive')
+    # Connection pool of each process's client (created on first use, and
+    # again in forked children). A full pool makes requests wait up to
+    # MONGO_WAIT_QUEUE_TIMEOUT_MS for a connection (0 waits indefinitely).
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 100))
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 0))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000))
+    # Wire compression in order of preference: zstd (needs zstandard),
+    # snappy (needs python-snappy) and/or zlib
+    MONGO_COMPRESSORS = [c.strip() for c in os.getenv('MONGO_COMPRESSORS', '').split(',') if c.strip()]
+    MONGO_APP_NAME = os.getenv('MONGO_APP_NAME', 'beehive')
+    # Reads of admin dashboards and analytics (the "analytics" read profile).
+    # On a replica set they prefer secondaries at most this many seconds
+    # behind the primary (-1 for no limit, otherwise at least 90).
+    MONGO_ANALYTICS_READ_PREFERENCE = os.getenv('MONGO_ANALYTICS_READ_PREFERENCE', 'secondaryPreferred')
+    MONGO_ANALYTICS_MAX_STALENESS_SECONDS = int(os.getenv('MONGO_ANALYTICS_MAX_STALENESS_SECONDS', 120))
     
     # CORS Configuration
     _cors_origins_env = os.getenv("CORS_ORIGINS")
@@ -35,6 +131,9 @@ class Config:
         'secret',
     }
     
+    # Parts of the example connection strings that must be replaced
+    PLACEHOLDER_MONGODB_URI_PARTS = ('username:password',)
+    
     @staticmethod
     def validate_config():
         """
@@ -65,11 +164,48 @@ class Config:
             errors.append("MONGODB_URI environment variable is required but not set.")
         elif not Config.MONGODB_URI.startswith(('mongodb://', 'mongodb+srv://')):
             errors.append("MONGODB_URI must start with 'mongodb://' or 'mongodb+srv://'")
+        elif any(part in Config.MONGODB_URI for part in Config.PLACEHOLDER_MONGODB_URI_PARTS):
+            errors.append("MONGODB_URI still contains the example 'username:password'. Set the real connection string.")
         
         # Required: CORS_ORIGINS
         if not Config.CORS_ORIGINS:
             errors.append("CORS_ORIGINS environment variable is required but not set. Specify allowed origins (comma-separated).")
         
+        # Required with the S3 storage backend: S3_BUCKET
+        if Config.MEDIA_STORAGE_BACKEND not in ('local', 's3'):
+            errors.append("MEDIA_STORAGE_BACKEND must be 'local' or 's3'.")
+        elif Config.MEDIA_STORAGE_BACKEND == 's3' and not Config.S3_BUCKET:
+            errors.append("S3_BUCKET environment variable is required when MEDIA_STORAGE_BACKEND=s3.")
+        
+        if Config.MEDIA_OFFLOAD not in ('off', 'x-accel-redirect', 'x-sendfile'):
+            errors.append("MEDIA_OFFLOAD must be 'off', 'x-accel-redirect' or 'x-sendfile'.")
+        
+        for key in Config.MEDIA_URL_SIGNING_KEYS:
+            kid, _, secret = key.partition(':')
+            if not kid or not secret:
+                errors.append("MEDIA_URL_SIGNING_KEYS entries must look like 'kid:secret'.")
+            elif len(secret) < 32:
+                warnings.append(f"MEDIA_URL_SIGNING_KEYS key '{kid}' is short ({len(secret)} chars). Recommended: 32+ characters.")
+        
+        # Deleted images can only be purged after the undo window by worker.py
+        if Config.DELETE_UNDO_SECONDS > 0 and not Config.BACKGROUND_JOBS:
+            errors.append("DELETE_UNDO_SECONDS requires BACKGROUND_JOBS=true so worker.py can purge deleted images.")
+        
+        # MongoDB connection pool
+        if Config.MONGO_MAX_POOL_SIZE < 1:
+            errors.append("MONGO_MAX_POOL_SIZE must be at least 1.")
+        elif not 0 <= Config.MONGO_MIN_POOL_SIZE <= Config.MONGO_MAX_POOL_SIZE:
+            errors.append("MONGO_MIN_POOL_SIZE must be between 0 and MONGO_MAX_POOL_SIZE.")
+        unknown_compressors = set(Config.MONGO_COMPRESSORS) - {'zstd', 'snappy', 'zlib'}
+        if unknown_compressors:
+            errors.append(f"MONGO_COMPRESSORS may only contain zstd, snappy and zlib (got {', '.join(sorted(unknown_compressors))}).")
+        if Config.MONGO_ANALYTICS_READ_PREFERENCE not in {'primary', 'primaryPreferred', 'secondary', 'secondaryPreferred', 'nearest'}:
+            errors.append("MONGO_ANALYTICS_READ_PREFERENCE must be primary, primaryPreferred, secondary, secondaryPreferred or nearest.")
+        if Config.MONGO_ANALYTICS_MAX_STALENESS_SECONDS != -1 and Config.MONGO_ANALYTICS_MAX_STALENESS_SECONDS < 90:
+            errors.append("MONGO_ANALYTICS_MAX_STALENESS_SECONDS must be -1 (no limit) or at least 90.")
+        if Config.MONGO_WAIT_QUEUE_TIMEOUT_MS <= 0:
+            warnings.append("MONGO_WAIT_QUEUE_TIMEOUT_MS is 0: requests wait indefinitely when the MongoDB pool is exhausted.")
+        
         # Print warnings (non-fatal)
         if warnings:
             print("\n⚠️  Configuration Warnings:", file=sys.stderr)
@@ -0,0 +1,89 @@
+"""
+Reference counts for content-addressed upload blobs.
+
+Every image document that points at a blob holds one reference. The file is
+only unlinked when the last reference is released. Uploads stored before
+content addressing have no blob record and are treated as single-owner files.
+"""
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+
+from database import databaseConfig
+from utils.logger import Logger
+
+logger = Logger.get_logger("blobhandler")
+
+beehive_blob_collection = databaseConfig.get_beehive_blob_collection()
+
+
+def acquire_blob(filename, content_hash, size, mime_type, count=1):
+    """
+    Add `count` references to a blob, creating its record if needed.
+    Returns the reference count after the increment.
+    """
+    blob = beehive_blob_collection.find_one_and_update(
+        {"_id": filename},
+        {
+            "$inc": {"refcount": count},
+            "$setOnInsert": {
+                "content_hash": content_hash,
+                "size": size,
+                "mime_type": mime_type,
+                "created_at": datetime.now(timezone.utc),
+            },
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return blob["refcount"]
+
+
+def release_blob(filename, count=1):
+    """
+    Drop `count` references to a blob. Returns True when the caller should
+    unlink the file: the last reference was released or the file is untracked.
+    """
+    blob = beehive_blob_collection.find_one_and_update(
+        {"_id": filename},
+        {"$inc": {"refcount": -count}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if blob is None:
+        return True
+    if blob["refcount"] > 0:
+        return False
+    # Only the caller that removes the record unlinks; a concurrent upload that
+    # re-acquired the blob in between keeps the record alive.
+    result = beehive_blob_collection.delete_one({"_id": filename, "refcount": {"$lte": 0}})
+    return result.deleted_count == 1
+
+
+def get_blob(filename):
+    return beehive_blob_collection.find_one({"_id": filename})
+
+
+def set_blob_derivatives(filename, derivatives):
+    """Record the resized derivatives generated for a blob."""
+    beehive_blob_collection.update_one(
+        {"_id": filename},
+        {"$set": {"derivatives": derivatives}}
+    )
+
+
+def get_blob_derivatives(filenames):
+    """Map each stored filename to its derivatives with a single query."""
+    if not filenames:
+        return {}
+    blobs = beehive_blob_collection.find(
+        {"_id": {"$in": list(filenames)}, "derivatives": {"$exists": True}},
+        {"derivatives": 1}
+    )
+    return {blob["_id"]: blob["derivatives"] for blob in blobs}
+
+
+def get_blob_filenames(values):
+    """Blob filenames matching `values` (names or compiled patterns)."""
+    if not values:
+        return set()
+    return {blob["_id"] for blob in beehive_blob_collection.find({"_id": {"$in": list(values)}}, {"_id": 1})}
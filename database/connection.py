@@ -0,0 +1,223 @@
+"""
+Per-process MongoClient, created on first use.
+
+A MongoClient is not fork-safe: its pool sockets and monitor threads belong
+to the process that created it. Pre-fork servers (gunicorn --preload) and
+multiprocessing import the app in one process and serve from its children,
+so the client is only created when a query runs and is re-created whenever
+the current pid differs from the one that created it. The child drops the
+parent's client without closing it; closing would end sessions the parent is
+still using.
+
+Pool settings come from Config (MONGO_*). Every client registers a pool
+listener whose counters (connections open and checked out, waiting
+operations, check-out timeouts) are exposed by `pool_snapshot()` for the
+admin API.
+"""
+import os
+import threading
+import time
+
+from pymongo import MongoClient, monitoring
+
+from config import Config
+from utils.logger import Logger
+
+logger = Logger.get_logger("connection")
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters of one client, summed over its servers."""
+
+    def __init__(self, max_pool_size):
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.peak_checked_out = 0
+        self.peak_waiting = 0
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self.waits = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._started = {}  # thread id -> check-out start, to time waits
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            self._started[threading.get_ident()] = time.monotonic()
+
+    def _check_out_ended(self):
+        self.waiting = max(0, self.waiting - 1)
+        started = self._started.pop(threading.get_ident(), None)
+        if started is not None:
+            waited = time.monotonic() - started
+            self.waits += 1
+            self.total_wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._check_out_ended()
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                self.checkout_timeouts += 1
+            else:
+                self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._check_out_ended()
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "maxPoolSize": self.max_pool_size,
+                "open": self.open,
+                "checkedOut": self.checked_out,
+                "waiting": self.waiting,
+                "saturation": round(self.checked_out / self.max_pool_size, 4) if self.max_pool_size else None,
+                "peakCheckedOut": self.peak_checked_out,
+                "peakWaiting": self.peak_waiting,
+                "checkouts": self.checkouts,
+                "checkoutTimeouts": self.checkout_timeouts,
+                "checkoutFailures": self.checkout_failures,
+                "poolClears": self.pool_clears,
+                "avgWaitMs": round(self.total_wait_seconds * 1000 / self.waits, 3) if self.waits else None,
+                "maxWaitMs": round(self.max_wait_seconds * 1000, 3),
+            }
+
+
+def mongodb_uri():
+    """
+    MONGODB_URI, which Config.validate_config requires at start-up. Scripts
+    and workers that skip validation fail here rather than quietly
+    connecting to some other server.
+    """
+    uri = Config.MONGODB_URI
+    if not uri:
+        raise ValueError("MONGODB_URI environment variable is required but not set.")
+    if any(part in uri for part in Config.PLACEHOLDER_MONGODB_URI_PARTS):
+        raise ValueError("MONGODB_URI still contains the example 'username:password'.")
+    return uri
+
+
+def client_options():
+    """MongoClient keyword arguments from Config."""
+    options = {
+        "maxPoolSize": Config.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": Config.MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "appname": Config.MONGO_APP_NAME,
+    }
+    if Config.MONGO_WAIT_QUEUE_TIMEOUT_MS > 0:
+        options["waitQueueTimeoutMS"] = Config.MONGO_WAIT_QUEUE_TIMEOUT_MS
+    if Config.MONGO_MAX_IDLE_TIME_MS > 0:
+        options["maxIdleTimeMS"] = Config.MONGO_MAX_IDLE_TIME_MS
+    if Config.MONGO_COMPRESSORS:
+        options["compressors"] = ",".join(Config.MONGO_COMPRESSORS)
+    return options
+
+
+class ConnectionManager:
+    """Hands out the MongoClient of the current process, creating it on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._metrics = None
+        self._pid = None
+        self.clients_created = 0
+
+    def client(self):
+        pid = os.getpid()
+        client = self._client
+        if client is not None and self._pid == pid:
+            return client
+        with self._lock:
+            if self._client is None or self._pid != pid:
+                if self._client is not None:
+                    logger.info(f"Process {pid} was forked from {self._pid}; opening its own MongoDB client")
+                options = client_options()
+                metrics = PoolMetrics(options["maxPoolSize"])
+                self._client = MongoClient(mongodb_uri(), event_listeners=[metrics], **options)
+                self._metrics = metrics
+                self._pid = pid
+                self.clients_created += 1
+                logger.info(
+                    f"MongoDB client created (pid {pid}, maxPoolSize {options['maxPoolSize']}, "
+                    f"minPoolSize {options['minPoolSize']})"
+                )
+            return self._client
+
+    def database(self):
+        return self.client()[Config.DATABASE_NAME]
+
+    def after_fork_in_child(self):
+        # Locks held by other threads at fork time stay locked in the child
+        self._lock = threading.Lock()
+        self._client = None
+        self._metrics = None
+        self._pid = None
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._metrics = None
+            self._pid = None
+
+    def snapshot(self):
+        metrics = self._metrics if self._pid == os.getpid() else None
+        return {
+            "connected": metrics is not None,
+            "pid": os.getpid(),
+            "clientsCreated": self.clients_created,
+            "pool": metrics.snapshot() if metrics else None,
+        }
+
+
+connection_manager = ConnectionManager()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=connection_manager.after_fork_in_child)
+
+
+def pool_snapshot():
+    return connection_manager.snapshot()
@@ -0,0 +1,226 @@
+"""
+Declared indexes for every collection and the query shapes they serve.
+
+`INDEXES` lists the indexes each collection needs; `ensure_indexes` creates
+the missing ones (create_index is a no-op for an index that already exists
+with the same definition). The app builds them in a background thread at
+start-up so a slow first build never delays serving; `manage_indexes.py`
+does the same from the command line.
+
+`QUERY_SHAPES` mirrors the filters and sorts issued by userdatahandler.py,
+adminroutes.py, auth.py, app.py and the other handlers. `verify_query_plans`
+runs explain() on each of them and reports every plan that still scans the
+whole collection. A shape that scans on purpose (e.g. an unfiltered admin
+listing) says why in `collscan_ok`.
+
+Add a shape here together with any new query, and an index if it needs one.
+"""
+import re
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+from database import databaseConfig
+from utils.logger import Logger
+
+logger = Logger.get_logger("indexes")
+
+IndexSpec = namedtuple("IndexSpec", ["keys", "name", "options"])
+QueryShape = namedtuple("QueryShape", ["name", "collection", "filter", "sort", "collscan_ok"])
+
+
+def index(keys, name, **options):
+    return IndexSpec(keys, name, options)
+
+
+def shape(name, collection, filter, sort=None, collscan_ok=None):
+    return QueryShape(name, collection, filter, sort, collscan_ok)
+
+
+INDEXES = {
+    "images": [
+        index([("title", TEXT), ("description", TEXT)], "title_text_description_text"),
+        # Gallery pages, per-user counts and filters, newest first; _id breaks
+        # ties so keyset cursors can seek to the next page
+        index([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], "user_id_created_at_id"),
+        index([("user_id", ASCENDING), ("title", ASCENDING), ("_id", ASCENDING)], "user_id_title_id"),
+        index([("user_id", ASCENDING), ("content_hash", ASCENDING)], "user_id_content_hash"),
+        index([("created_at", DESCENDING)], "created_at"),
+        index([("filename", ASCENDING)], "filename"),
+        index([("audio_filename", ASCENDING)], "audio_filename"),
+    ],
+    "deleted_images": [
+        index([("claimed_by", ASCENDING)], "claimed_by"),
+        index([("filename", ASCENDING)], "filename"),
+        index([("audio_filename", ASCENDING)], "audio_filename"),
+    ],
+    "users": [
+        index([("email", ASCENDING)], "email"),
+        index([("username", ASCENDING)], "username"),
+    ],
+    "admins": [
+        index([("google_id", ASCENDING)], "google_id"),
+    ],
+    "email_otps": [
+        index([("email", ASCENDING)], "email"),
+        # MongoDB removes codes once they expire
+        index([("expires_at", ASCENDING)], "expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "notifications": [
+        index([("seen", ASCENDING), ("timestamp", DESCENDING)], "seen_timestamp"),
+        index([("timestamp", DESCENDING), ("_id", DESCENDING)], "timestamp_id"),
+    ],
+    "messages": [
+        # One index per branch of the conversation $or
+        index([("from_id", ASCENDING), ("timestamp", ASCENDING)], "from_id_timestamp"),
+        index([("to_id", ASCENDING), ("timestamp", ASCENDING)], "to_id_timestamp"),
+    ],
+    "jobs": [
+        # Workers claim queued jobs by run_at and re-claim expired leases
+        index([("status", ASCENDING), ("run_at", ASCENDING)], "status_run_at"),
+        index([("status", ASCENDING), ("lease_expires_at", ASCENDING)], "status_lease_expires_at"),
+    ],
+}
+
+_ID = ObjectId()
+_NOW = datetime.now(timezone.utc)
+
+QUERY_SHAPES = [
+    # userdatahandler.py
+    shape("images by user, newest first", "images", {"user_id": "u"}, [("created_at", -1), ("_id", -1)]),
+    shape("images by user and sentiment", "images", {"user_id": "u", "sentiment": "positive"},
+          [("created_at", -1), ("_id", -1)]),
+    shape("images by user after cursor", "images",
+          {"$and": [{"user_id": "u"}, {"$or": [{"created_at": {"$lt": _NOW}},
+                                               {"created_at": _NOW, "_id": {"$lt": _ID}}]}]},
+          [("created_at", -1), ("_id", -1)]),
+    shape("images by user by title after cursor", "images",
+          {"$and": [{"user_id": "u"}, {"$or": [{"title": {"$gt": "t"}}, {"title": "t", "_id": {"$gt": _ID}}]}]},
+          [("title", 1), ("_id", 1)]),
+    shape("images by user, text search", "images", {"user_id": "u", "$text": {"$search": "bee"}}),
+    shape("images by user in date range", "images", {"user_id": "u", "created_at": {"$gte": _NOW}},
+          [("title", 1), ("_id", 1)]),
+    shape("images by user and content hash", "images", {"user_id": "u", "content_hash": {"$in": ["h"]}}),
+    shape("image by audio filename", "images", {"audio_filename": "a.wav"}),
+    shape("images referencing stored files", "images",
+          {"$or": [{"filename": {"$in": ["f"]}}, {"audio_filename": {"$in": ["f"]}}]}),
+    shape("images by filename stem", "images", {"filename": {"$in": [re.compile(r"^f\.[^.]+$")]}}),
+    shape("images uploaded in the last day", "images", {"created_at": {"$gte": _NOW}}),
+    shape("recent uploads", "images", {}, [("created_at", -1)]),
+    shape("voice note count", "images", {"audio_filename": {"$exists": True, "$ne": None}}),
+    shape("image by id", "images", {"_id": _ID}),
+    shape("images by ids", "images", {"_id": {"$in": [_ID]}}),
+    shape("image file refs after id", "images", {"_id": {"$gt": _ID}}, [("_id", 1)]),
+    shape("deleted images by claim", "deleted_images", {"claimed_by": "t"}),
+    shape("deleted images to claim", "deleted_images", {"_id": {"$in": [_ID]}, "purge_at": {"$lte": _NOW}}),
+    shape("deleted images referencing stored files", "deleted_images",
+          {"$or": [{"filename": {"$in": ["f"]}}, {"audio_filename": {"$in": ["f"]}}]}),
+    shape("user by username", "users", {"username": "u"}),
+    shape("user by id", "users", {"_id": _ID}),
+    shape("users by ids", "users", {"_id": {"$in": [_ID]}}),
+    shape("all users", "users", {}, collscan_ok="lists every user"),
+    shape("users after cursor", "users", {"_id": {"$gt": _ID}}, [("_id", 1)]),
+    # auth.py
+    shape("login by username or email", "users", {"$or": [{"username": "u"}, {"email": "e"}]}),
+    shape("user by email", "users", {"email": "e"}),
+    shape("otp by email", "email_otps", {"email": "e", "otp": "123456"}),
+    # adminroutes.py
+    shape("admin user search", "users",
+          {"$or": [{"username": {"$regex": "u", "$options": "i"}}, {"email": {"$regex": "u", "$options": "i"}}]}),
+    shape("admin by google id", "admins", {"google_id": "g"}),
+    # app.py
+    shape("unseen notifications", "notifications", {"seen": False}),
+    shape("notifications, newest first", "notifications", {}, [("timestamp", -1), ("_id", -1)]),
+    shape("notifications after cursor", "notifications",
+          {"$or": [{"timestamp": {"$lt": _NOW}}, {"timestamp": _NOW, "_id": {"$lt": _ID}}]},
+          [("timestamp", -1), ("_id", -1)]),
+    shape("conversation with admin", "messages",
+          {"$or": [{"from_id": "u", "to_role": "admin"}, {"to_id": "u", "from_role": "admin"}]},
+          [("timestamp", 1)]),
+    # jobqueue.py, blobhandler.py, uploadsessionhandler.py
+    shape("next runnable job", "jobs",
+          {"$or": [{"status": "queued", "run_at": {"$lte": _NOW}},
+                   {"status": "running", "lease_expires_at": {"$lte": _NOW}}]},
+          [("run_at", 1)]),
+    shape("pending jobs", "jobs", {"status": {"$in": ["queued", "running"]}}),
+    shape("blobs with derivatives", "blobs", {"_id": {"$in": ["f"]}, "derivatives": {"$exists": True}}),
+    shape("upload session by id", "upload_sessions", {"_id": _ID}),
+]
+
+
+def _collection(name):
+    return databaseConfig.db[name]
+
+
+def ensure_indexes(collections=None):
+    """
+    Create every declared index that does not exist yet. Returns the number
+    of indexes that failed to build; failures are logged and do not stop the others.
+    """
+    failed = 0
+    for collection_name, specs in INDEXES.items():
+        if collections and collection_name not in collections:
+            continue
+        collection = _collection(collection_name)
+        existing = collection.index_information()
+        for spec in specs:
+            if spec.name in existing:
+                continue
+            try:
+                collection.create_index(spec.keys, name=spec.name, **spec.options)
+                logger.info(f"Created index {collection_name}.{spec.name}")
+            except OperationFailure as e:
+                failed += 1
+                logger.error(f"Failed to create index {collection_name}.{spec.name}: {e}")
+    return failed
+
+
+def ensure_indexes_in_background():
+    """Build missing indexes without holding up start-up."""
+    def build():
+        try:
+            ensure_indexes()
+        except Exception as e:
+            logger.error(f"Error creating indexes: {str(e)}")
+
+    thread = threading.Thread(target=build, name="ensure-indexes", daemon=True)
+    thread.start()
+    return thread
+
+
+def _plan_stages(plan):
+    """Every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def explain_shape(query_shape):
+    """Stages of the winning plan for one query shape."""
+    cursor = _collection(query_shape.collection).find(query_shape.filter)
+    if query_shape.sort:
+        cursor = cursor.sort(query_shape.sort)
+    planner = cursor.explain().get("queryPlanner", {})
+    return list(_plan_stages(planner.get("winningPlan", {})))
+
+
+def verify_query_plans(shapes=QUERY_SHAPES):
+    """
+    Explain every query shape. Returns (shape, stages) for each plan that
+    scans a whole collection without being marked as expected to.
+    """
+    problems = []
+    for query_shape in shapes:
+        stages = explain_shape(query_shape)
+        if "COLLSCAN" in stages and not query_shape.collscan_ok:
+            problems.append((query_shape, stages))
+    return problems
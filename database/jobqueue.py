@@ -0,0 +1,189 @@
+"""
+MongoDB-backed durable job queue for post-upload processing.
+
+Jobs move through queued -> running -> succeeded / failed. A worker claims a
+job with an atomic find_one_and_update that sets a lease (visibility
+timeout); if the worker dies the lease expires and another worker picks the
+job up again. Failed attempts are re-queued with exponential backoff until
+`max_attempts` is reached.
+"""
+from datetime import datetime, timedelta, timezone
+
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+
+from database import databaseConfig
+from utils.logger import Logger
+
+logger = Logger.get_logger("jobqueue")
+
+beehive_job_collection = databaseConfig.get_beehive_job_collection()
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_VISIBILITY_TIMEOUT = timedelta(minutes=5)
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 15 * 60
+
+
+def build_job(job_type, payload, user_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS, run_at=None):
+    """`run_at` delays the job; by default it is runnable immediately."""
+    now = datetime.now(timezone.utc)
+    return {
+        "_id": ObjectId(),
+        "type": job_type,
+        "payload": payload,
+        "user_id": user_id,
+        "status": JOB_QUEUED,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": run_at or now,
+        "lease_expires_at": None,
+        "worker_id": None,
+        "last_error": None,
+        "created_at": now,
+        "updated_at": now,
+        "finished_at": None,
+    }
+
+
+# Enqueue several jobs with a single round trip
+def enqueue_jobs(jobs):
+    if not jobs:
+        return []
+    beehive_job_collection.insert_many(jobs, ordered=False)
+    return [job["_id"] for job in jobs]
+
+
+def delete_jobs(job_ids):
+    """Withdraw jobs that were enqueued for an upload that was rolled back."""
+    if job_ids:
+        beehive_job_collection.delete_many({"_id": {"$in": list(job_ids)}})
+
+
+def enqueue_job(job_type, payload, user_id=None, max_attempts=DEFAULT_MAX_ATTEMPTS, run_at=None):
+    return enqueue_jobs([build_job(job_type, payload, user_id, max_attempts, run_at)])[0]
+
+
+def claim_next_job(worker_id, job_types=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """
+    Atomically claim the oldest runnable job: either queued and due, or
+    running with an expired lease. Returns the claimed job or None.
+    """
+    now = datetime.now(timezone.utc)
+    query = {
+        "$or": [
+            {"status": JOB_QUEUED, "run_at": {"$lte": now}},
+            {"status": JOB_RUNNING, "lease_expires_at": {"$lte": now}},
+        ]
+    }
+    if job_types:
+        query["type"] = {"$in": list(job_types)}
+
+    return beehive_job_collection.find_one_and_update(
+        query,
+        {
+            "$set": {
+                "status": JOB_RUNNING,
+                "worker_id": worker_id,
+                "lease_expires_at": now + visibility_timeout,
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def complete_job(job_id, worker_id):
+    """Mark a job done. Ignored if the lease was lost to another worker."""
+    now = datetime.now(timezone.utc)
+    result = beehive_job_collection.update_one(
+        {"_id": job_id, "worker_id": worker_id, "status": JOB_RUNNING},
+        {"$set": {
+            "status": JOB_SUCCEEDED,
+            "lease_expires_at": None,
+            "updated_at": now,
+            "finished_at": now,
+        }}
+    )
+    return result.modified_count == 1
+
+
+def _backoff_delay(attempts):
+    return timedelta(seconds=min(BACKOFF_BASE_SECONDS * 2 ** max(attempts - 1, 0), BACKOFF_MAX_SECONDS))
+
+
+def fail_job(job, worker_id, error):
+    """Re-queue a failed job with backoff, or mark it failed when out of attempts."""
+    now = datetime.now(timezone.utc)
+    if job["attempts"] >= job["max_attempts"]:
+        update = {
+            "status": JOB_FAILED,
+            "lease_expires_at": None,
+            "last_error": error,
+            "updated_at": now,
+            "finished_at": now,
+        }
+    else:
+        update = {
+            "status": JOB_QUEUED,
+            "run_at": now + _backoff_delay(job["attempts"]),
+            "lease_expires_at": None,
+            "last_error": error,
+            "updated_at": now,
+        }
+    result = beehive_job_collection.update_one(
+        {"_id": job["_id"], "worker_id": worker_id, "status": JOB_RUNNING},
+        {"$set": update}
+    )
+    return result.modified_count == 1
+
+
+def extend_job_lease(job_id, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+    """Push the lease forward for long-running jobs."""
+    now = datetime.now(timezone.utc)
+    result = beehive_job_collection.update_one(
+        {"_id": job_id, "worker_id": worker_id, "status": JOB_RUNNING},
+        {"$set": {"lease_expires_at": now + visibility_timeout, "updated_at": now}}
+    )
+    return result.modified_count == 1
+
+
+# Get job by ID from MongoDB
+def get_job(job_id):
+    return beehive_job_collection.find_one({"_id": ObjectId(job_id)})
+
+
+def count_pending_jobs():
+    """Number of jobs waiting for or currently held by a worker."""
+    return beehive_job_collection.count_documents(
+        {"status": {"$in": [JOB_QUEUED, JOB_RUNNING]}}
+    )
+
+
+def get_pending_job_filenames(values):
+    """
+    Upload and voice note filenames matching `values` (names or compiled
+    patterns) that a queued or running job still has to process.
+    """
+    if not values:
+        return set()
+    values = list(values)
+    jobs = beehive_job_collection.find(
+        {
+            "status": {"$in": [JOB_QUEUED, JOB_RUNNING]},
+            "$or": [{"payload.filename": {"$in": values}}, {"payload.audio_filename": {"$in": values}}],
+        },
+        {"payload.filename": 1, "payload.audio_filename": 1},
+    )
+    filenames = set()
+    for job in jobs:
+        filenames.update(job["payload"].get(field) for field in ("filename", "audio_filename"))
+    filenames.discard(None)
+    return filenames
@@ -0,0 +1,101 @@
+"""
+Named read preferences that call sites opt into.
+
+Every read goes to the primary unless the code runs inside
+`read_profile(...)`. Admin dashboards and analytics use the ANALYTICS
+profile (secondaryPreferred with a maximum staleness by default) so their
+large scans and $facet aggregations run on a secondary instead of competing
+with upload writes. Writes always go to the primary whatever the profile.
+
+Collections from databaseConfig (the lazy proxies and `beehive`) pick up the
+active profile when they are used, so data handlers need no extra arguments:
+
+    @admin_bp.route("/analytics")
+    @require_admin_role
+    @read_profile(ANALYTICS)
+    def get_all_analytics(): ...
+
+The profile is held in a context variable: it applies to the current request
+only and is not inherited by threads the request starts. On a standalone
+server every profile reads from that server.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+from config import Config
+
+PRIMARY = "primary"
+ANALYTICS = "analytics"
+
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def build_read_preference(mode, max_staleness=-1):
+    """A pymongo read preference; `max_staleness` (seconds, -1 for none) is ignored for primary."""
+    if mode not in READ_PREFERENCE_MODES:
+        raise ValueError(f"Unknown read preference mode: {mode}")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCE_MODES[mode](max_staleness=max_staleness)
+
+
+READ_PROFILES = {
+    PRIMARY: Primary(),
+    ANALYTICS: build_read_preference(
+        Config.MONGO_ANALYTICS_READ_PREFERENCE,
+        Config.MONGO_ANALYTICS_MAX_STALENESS_SECONDS,
+    ),
+}
+
+_active_profile = contextvars.ContextVar("read_profile", default=PRIMARY)
+
+
+def active_read_profile():
+    return _active_profile.get()
+
+
+def active_read_preference():
+    """Read preference of the active profile, or None when reads go to the primary."""
+    preference = READ_PROFILES[_active_profile.get()]
+    return None if isinstance(preference, Primary) else preference
+
+
+@contextmanager
+def read_profile_scope(profile):
+    if profile not in READ_PROFILES:
+        raise ValueError(f"Unknown read profile: {profile}")
+    token = _active_profile.set(profile)
+    try:
+        yield
+    finally:
+        _active_profile.reset(token)
+
+
+def read_profile(profile):
+    """Decorator running a function (e.g. a route) with the reads of `profile`."""
+    if profile not in READ_PROFILES:
+        raise ValueError(f"Unknown read profile: {profile}")
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            with read_profile_scope(profile):
+                return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+def read_profiles_snapshot():
+    return {
+        name: {"mode": preference.mongos_mode, "maxStalenessSeconds": preference.max_staleness}
+        for name, preference in READ_PROFILES.items()
+    }
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+
+from bson.objectid import ObjectId
+
+from database import databaseConfig
+from utils.content_store import blob_filename
+from utils.logger import Logger
+
+logger = Logger.get_logger("uploadsessionhandler")
+
+beehive_upload_session_collection = databaseConfig.get_beehive_upload_session_collection()
+
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+
+
+# Create a resumable upload session. Direct sessions (with a content hash and
+# MIME type) are uploaded by the browser straight to the storage bucket.
+def create_upload_session(user_id, username, filename, total_size, title, description, sentiment,
+                          content_hash=None, mime_type=None):
+    now = datetime.now(timezone.utc)
+    session = {
+        "user_id": user_id,
+        "username": username,
+        "filename": filename,
+        "total_size": total_size,
+        "offset": 0,
+        "title": title,
+        "description": description,
+        "sentiment": sentiment,
+        "status": "uploading",
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + UPLOAD_SESSION_TTL,
+    }
+    if content_hash is not None:
+        session.update({"direct": True, "content_hash": content_hash, "mime_type": mime_type})
+    return beehive_upload_session_collection.insert_one(session).inserted_id
+
+
+# Get upload session by ID
+def get_upload_session(session_id):
+    return beehive_upload_session_collection.find_one({"_id": ObjectId(session_id)})
+
+
+def advance_upload_offset(session_id, expected_offset, new_offset):
+    """
+    Move the committed offset forward only if nobody else committed in between.
+    Returns True when the update was applied.
+    """
+    now = datetime.now(timezone.utc)
+    result = beehive_upload_session_collection.update_one(
+        {"_id": ObjectId(session_id), "offset": expected_offset, "status": "uploading"},
+        {"$set": {
+            "offset": new_offset,
+            "updated_at": now,
+            "expires_at": now + UPLOAD_SESSION_TTL,
+        }}
+    )
+    return result.modified_count == 1
+
+
+def mark_upload_session_finalizing(session_id):
+    """Claim a fully uploaded session for finalization. Returns True for exactly one caller."""
+    result = beehive_upload_session_collection.update_one(
+        {"_id": ObjectId(session_id), "status": "uploading"},
+        {"$set": {"status": "finalizing", "updated_at": datetime.now(timezone.utc)}}
+    )
+    return result.modified_count == 1
+
+
+def reset_upload_session_status(session_id):
+    """Return a session to the uploading state after a failed finalize."""
+    beehive_upload_session_collection.update_one(
+        {"_id": ObjectId(session_id)},
+        {"$set": {"status": "uploading", "updated_at": datetime.now(timezone.utc)}}
+    )
+
+
+def complete_upload_session(session_id, stored_filename):
+    beehive_upload_session_collection.update_one(
+        {"_id": ObjectId(session_id)},
+        {"$set": {
+            "status": "completed",
+            "stored_filename": stored_filename,
+            "updated_at": datetime.now(timezone.utc),
+        }}
+    )
+
+
+# Delete upload session from MongoDB
+def delete_upload_session(session_id):
+    beehive_upload_session_collection.delete_one({"_id": ObjectId(session_id)})
+
+
+# Filenames that live upload sessions have stored or are about to store
+def get_upload_session_filenames():
+    """
+    The stored filename of completed sessions and, for direct uploads not
+    finalized yet, the content-addressed name their object will be stored under.
+    """
+    sessions = beehive_upload_session_collection.find(
+        {"$or": [{"stored_filename": {"$exists": True}}, {"direct": True}]},
+        {"stored_filename": 1, "content_hash": 1, "mime_type": 1},
+    )
+    filenames = set()
+    for session in sessions:
+        if session.get("stored_filename"):
+            filenames.add(session["stored_filename"])
+        elif session.get("content_hash") and session.get("mime_type"):
+            filenames.add(blob_filename(session["content_hash"], session["mime_type"]))
+    return filenames
@@ -1,16 +1,35 @@
 from datetime import datetime, timedelta, timezone
 from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
 import re
 import bcrypt
 from flask import session
 from database import databaseConfig
+from database.blobhandler import get_blob_derivatives
+from config import Config
+from utils.derivatives import derivative_urls
 from utils.logger import Logger
+from utils.thumbnails import thumbnail_url
+from utils.media_storage import get_storage, media_url
+from utils.media_signing import sign_media_path
+from utils.pagination import decode_cursor, keyset_query, next_cursor
 
 logger = Logger.get_logger("userdatahandler")
 
 beehive_image_collection = databaseConfig.get_beehive_image_collection()
 beehive_notification_collection = databaseConfig.get_beehive_notification_collection()
 beehive_user_collection = databaseConfig.get_beehive_user_collection()
+beehive_deleted_image_collection = databaseConfig.get_beehive_deleted_image_collection()
+
+# Sort of keyset cursors over images ordered newest first
+NEWEST_FIRST = 'created_at:-1'
+
+# Image fields used by listing responses
+IMAGE_LIST_FIELDS = {
+    'filename': 1, 'title': 1, 'description': 1, 'audio_filename': 1,
+    'audio_duration': 1, 'audio_peaks': 1, 'sentiment': 1, 'created_at': 1,
+}
+
 #create user in MongoDB
 def create_user(username, email, password, role="user"):
     hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
@@ -42,8 +61,8 @@ def get_user_by_username(username: str):
     return user
 
 
-# Save image to MongoDB
-def save_image(id, filename, title, description, time_created, audio_filename=None, sentiment=None):
+def build_image(id, filename, title, description, time_created, audio_filename=None, sentiment=None,
+                content_hash=None, original_filename=None):
     image = {
         'user_id': id,
         'filename': filename,
@@ -53,11 +72,34 @@ def save_image(id, filename, title, description, time_created, audio_filename=No
         'audio_filename': audio_filename,
         'sentiment': sentiment
     }
+    # Content-addressed uploads keep the digest and the name the client sent
+    if content_hash is not None:
+        image['content_hash'] = content_hash
+        image['original_filename'] = original_filename
+    return image
+
+
+# Save image to MongoDB
+def save_image(id, filename, title, description, time_created, audio_filename=None, sentiment=None, image_id=None,
+               content_hash=None, original_filename=None):
+    image = build_image(id, filename, title, description, time_created, audio_filename, sentiment,
+                        content_hash, original_filename)
+    # A caller-supplied _id makes retried inserts (e.g. from the job queue) detectable
+    if image_id is not None:
+        image['_id'] = image_id
     beehive_image_collection.insert_one(image)
     update_last_seen(id)
+
+
+# Save several images from one upload request with a single round trip
+def save_images(user_id, images):
+    if images:
+        beehive_image_collection.insert_many(images)
+    update_last_seen(user_id)
 # Count all images from MongoDB
 def total_images():
-    return beehive_image_collection.count_documents({})
+    # Collection metadata; counting documents would scan every image
+    return beehive_image_collection.estimated_document_count()
 
 # Count all images from MongoDB uploaded today
 def todays_images():
@@ -90,7 +132,7 @@ def get_images_by_user(user_id, limit=None, offset=None):
     If `offset` and/or `limit` are provided, apply pagination using skip/limit on that
     sorted result set.
     """
-    cursor = beehive_image_collection.find({'user_id': user_id}).sort('created_at', -1)
+    cursor = beehive_image_collection.find({'user_id': user_id}, IMAGE_LIST_FIELDS).sort('created_at', -1)
     if offset is not None:
         try:
             cursor = cursor.skip(int(offset))
@@ -108,10 +150,40 @@ def get_images_by_user(user_id, limit=None, offset=None):
         'title': image.get('title', ''),
         'description': image.get('description', ''),
         'audio_filename': image.get('audio_filename', ""),
+        'audio_duration': image.get('audio_duration'),
+        'audio_peaks': image.get('audio_peaks', []),
         'sentiment': image.get('sentiment', ""),
         'created_at': image.get('created_at').get('$date') if isinstance(image.get('created_at'), dict) else image.get('created_at')
     } for image in cursor]
 
+def audio_url(upload_folder, audio_filename, owner_id):
+    """
+    A presigned bucket URL with remote storage, otherwise a signed
+    /api/audio URL that is served without looking the owner up again.
+    """
+    if get_storage().remote:
+        return media_url(upload_folder, audio_filename)
+    return sign_media_path(f"/api/audio/{audio_filename}", owner_id)
+
+def _attach_media_urls(images_list, owner_id):
+    """
+    Add the URLs of each listed upload of `owner_id`: the file, the PDF
+    thumbnail, the voice note and the resized derivatives (empty for uploads
+    without them).
+    """
+    upload_folder = Config.UPLOAD_FOLDER
+    derivatives = get_blob_derivatives({image['filename'] for image in images_list if image['filename']})
+    for image in images_list:
+        filename = image['filename']
+        audio_filename = image.get('audio_filename')
+        image['url'] = media_url(upload_folder, filename) if filename else ''
+        image['thumbnail_url'] = (
+            thumbnail_url(upload_folder, filename) if filename.lower().endswith('.pdf') else image['url']
+        )
+        image['audio_url'] = audio_url(upload_folder, audio_filename, owner_id) if audio_filename else ''
+        image['derivatives'] = derivative_urls(upload_folder, filename, derivatives.get(filename))
+    return images_list
+
 def count_images_by_user(user_id):
     try:
         return beehive_image_collection.count_documents({'user_id': user_id})
@@ -145,8 +217,66 @@ def _parse_iso_date(date_string, field_name):
         raise ValueError(f"Invalid '{field_name}' date format: {date_string}. Expected ISO format.")
 
 
+def _find_page(collection, query, sort, limit, projection, skip=0, seek=None, with_count=True):
+    """
+    Up to `limit` + 1 documents of `query` in `sort` order (the extra one
+    tells whether another page follows) and the number of documents matching
+    `query`. `seek` is a keyset condition that the page must also match.
+
+    Offset pages with `with_count` come from one $facet aggregation, so the
+    filter (and a $text search) runs once instead of once for count_documents
+    and once for find. Cursor pages are read with find so `seek` is part of
+    the leading filter and seeks through the index; inside $facet it would
+    only filter the already sorted result. Their total, when wanted, is a
+    separate count of `query`. Without `with_count` the total is None.
+    """
+    if seek or not with_count:
+        page_query = {'$and': [query, seek]} if seek else query
+        results = collection.find(page_query, projection).sort(sort).skip(skip).limit(limit + 1)
+        total = collection.count_documents(query) if with_count else None
+        return list(results), total
+
+    rows = [{'$skip': skip}] if skip else []
+    rows.append({'$limit': limit + 1})
+    pipeline = [
+        {'$match': query},
+        {'$sort': dict(sort)},
+        {'$project': projection},
+        {'$facet': {'rows': rows, 'total': [{'$count': 'count'}]}},
+    ]
+    result = next(collection.aggregate(pipeline), None) or {}
+    total = result.get('total') or [{'count': 0}]
+    return result.get('rows', []), total[0]['count']
+
+
 def search_and_filter_images(user_id, search_query=None, sentiment=None, from_date=None, to_date=None, 
-                             sort_by='date', sort_order='desc', limit=12, offset=0):
+                             sort_by='date', sort_order='desc', limit=12, offset=0, cursor=None,
+                             with_count=True):
+    """
+    One page of a user's images. Date and title sorts page with `cursor`
+    (the `next_cursor` of the previous page) when it is given, otherwise with
+    `offset`, which is kept for older clients. Relevance sorts only page by offset.
+    Without `with_count` the total is not computed and is returned as None.
+    Raises ValueError for a cursor that is invalid or belongs to another sort.
+    """
+    relevance = bool(search_query and search_query.strip()) and sort_by == 'relevance'
+    # Determine sort field and direction
+    if relevance:
+        sort_field = 'score'
+        sort_direction = -1  # Sort by text score descending
+    elif sort_by == 'title':
+        sort_field = 'title'
+        sort_direction = 1 if sort_order == 'asc' else -1
+    else:
+        sort_field = 'created_at'
+        sort_direction = 1 if sort_order == 'asc' else -1
+    cursor_sort = None if relevance else f"{sort_field}:{sort_direction}"
+    after = None
+    if cursor:
+        if cursor_sort is None:
+            raise ValueError("Cursor pagination is not available when sorting by relevance.")
+        after = decode_cursor(cursor, cursor_sort)
+
     try:
         query = {'user_id': user_id}
         update_last_seen(user_id)
@@ -170,29 +300,22 @@ def search_and_filter_images(user_id, search_query=None, sentiment=None, from_da
             if date_query:
                 query['created_at'] = date_query
         
-        # Determine sort field, direction, and projection
-        # Always include projection when search_query is present for efficiency
-        projection = {'score': {'$meta': 'textScore'}} if search_query and search_query.strip() else None
-        
-        if search_query and search_query.strip() and sort_by == 'relevance':
-            sort_field = 'score'
-            sort_direction = -1  # Sort by text score descending
-        elif sort_by == 'title':
-            sort_field = 'title'
-            sort_direction = 1 if sort_order == 'asc' else -1
-        else:
-            sort_field = 'created_at'
-            sort_direction = 1 if sort_order == 'asc' else -1
-        
-        total_count = beehive_image_collection.count_documents(query)
+        # Only the fields the response uses, plus the text score it is sorted by
+        projection = dict(IMAGE_LIST_FIELDS)
+        if search_query and search_query.strip():
+            projection['score'] = {'$meta': 'textScore'}
         
-        # Build cursor with proper sort syntax
-        if search_query and search_query.strip() and sort_by == 'relevance':
-            # For text score sorting, use $meta in projection and sort by the projected field
-            cursor = beehive_image_collection.find(query, projection).sort([('score', {'$meta': 'textScore'})])
+        if relevance:
+            sort = [('score', {'$meta': 'textScore'})]
         else:
-            cursor = beehive_image_collection.find(query, projection).sort([(sort_field, sort_direction)])
-        images = list(cursor.skip(offset).limit(limit))
+            sort = [(sort_field, sort_direction), ('_id', sort_direction)]
+        seek = keyset_query({}, sort_field, sort_direction, *after) if after is not None else None
+        images, total_count = _find_page(
+            beehive_image_collection, query, sort, limit, projection,
+            skip=0 if seek else offset, seek=seek, with_count=with_count,
+        )
+        has_more = len(images) > limit
+        images = images[:limit]
         
         images_list = [{
             'id': str(image['_id']),
@@ -200,16 +323,20 @@ def search_and_filter_images(user_id, search_query=None, sentiment=None, from_da
             'title': image['title'],
             'description': image['description'],
             'audio_filename': image.get('audio_filename', ''),
+            'audio_duration': image.get('audio_duration'),
+            'audio_peaks': image.get('audio_peaks', []),
             'sentiment': image.get('sentiment', ''),
             'created_at': image['created_at']['$date'] if isinstance(image.get('created_at'), dict) else image.get('created_at')
         } for image in images]
+        _attach_media_urls(images_list, user_id)
         
         return {
             'images': images_list,
             'total': total_count,
             'limit': limit,
             'offset': offset,
-            'hasMore': (offset + limit) < total_count
+            'hasMore': has_more,
+            'next_cursor': next_cursor(images, cursor_sort, sort_field, has_more) if cursor_sort else None
         }
         
     except Exception as e:
@@ -220,26 +347,32 @@ def search_and_filter_images(user_id, search_query=None, sentiment=None, from_da
             'limit': limit,
             'offset': offset,
             'hasMore': False,
+            'next_cursor': None,
             'error': 'An unexpected error occurred while searching for images.'
         }
 
 
 # Get paginated images (method)
-def _get_paginated_images_by_user(user_id, page=1, page_size=12, filters=None):
+def _get_paginated_images_by_user(user_id, page=1, page_size=12, filters=None, cursor=None, with_count=True):
     """
     Get paginated images for a user with optional filters and safe data access.
     
     Args:
         user_id: The user's ID
-        page: Page number (1-indexed)
+        page: Page number (1-indexed), ignored when `cursor` is given
         page_size: Number of items per page
+        cursor: `next_cursor` of the previous page
+        with_count: False to skip counting; total_count and totalPages are then None
         filters: Dictionary of filters - can contain:
             - 'q': search query (matches title or description)
             - 'sentiment': sentiment filter
             - 'date_filter': 'week', 'month', or 'custom'
             - 'from': custom start date (ISO string)
             - 'to': custom end date (ISO string)
+
+    Raises ValueError for an invalid cursor.
     """
+    after = decode_cursor(cursor, NEWEST_FIRST) if cursor else None
     try:
         # Calculate skip for pagination
         skip = (page - 1) * page_size
@@ -290,14 +423,15 @@ def _get_paginated_images_by_user(user_id, page=1, page_size=12, filters=None):
                     if date_range:
                         query['created_at'] = date_range
         
-        # total count with filters applied
-        total_count = beehive_image_collection.count_documents(query)
-        
-        # Get images
-        images = list(beehive_image_collection.find(query)
-                      .sort('created_at', -1)
-                      .skip(skip)
-                      .limit(page_size))
+        # Get images and the total count with filters applied, seeking past
+        # the previous page when a cursor is given
+        seek = keyset_query({}, 'created_at', -1, *after) if after is not None else None
+        images, total_count = _find_page(
+            beehive_image_collection, query, [('created_at', -1), ('_id', -1)], page_size,
+            IMAGE_LIST_FIELDS, skip=0 if seek else skip, seek=seek, with_count=with_count,
+        )
+        has_more = len(images) > page_size
+        images = images[:page_size]
         
         # Use safe .get() access to prevent KeyError exceptions
         formatted_images = [{
@@ -306,16 +440,22 @@ def _get_paginated_images_by_user(user_id, page=1, page_size=12, filters=None):
             'title': image.get('title', ''),
             'description': image.get('description', ''),
             'audio_filename': image.get('audio_filename', ""),
+            'audio_duration': image.get('audio_duration'),
+            'audio_peaks': image.get('audio_peaks', []),
             'sentiment': image.get('sentiment', ""),
             'created_at': image.get('created_at').get('$date') if isinstance(image.get('created_at'), dict) else image.get('created_at')
         } for image in images]
+        _attach_media_urls(formatted_images, user_id)
         
         return {
             'images': formatted_images,
             'total_count': total_count,
             'page': page,
             'pageSize': page_size,
-            'totalPages': (total_count + page_size - 1) // page_size if page_size > 0 else 0
+            'totalPages': None if total_count is None else (
+                (total_count + page_size - 1) // page_size if page_size > 0 else 0
+            ),
+            'next_cursor': next_cursor(images, NEWEST_FIRST, 'created_at', has_more)
         }
     except Exception as e:
         logger.error(f"Error getting paginated images: {str(e)}")
@@ -324,7 +464,8 @@ def _get_paginated_images_by_user(user_id, page=1, page_size=12, filters=None):
             'total_count': 0,
             'page': page,
             'pageSize': page_size,
-            'totalPages': 0
+            'totalPages': 0,
+            'next_cursor': None
         }
 
 # Get images by sentiments list from MongoDB ( Route to be used with the dreams prototype for analysis page)
@@ -370,23 +511,169 @@ def update_image(image_id, title, description, sentiment=None):
 def delete_image(image_id):
     beehive_image_collection.delete_one({'_id': image_id})
 
+# Delete several images with a single query
+def delete_images(image_ids):
+    if image_ids:
+        beehive_image_collection.delete_many({'_id': {'$in': list(image_ids)}})
+
 # Get image by ID from MongoDB
 def get_image_by_id(image_id):
     image = beehive_image_collection.find_one({'_id': image_id})
     return image
 
+# Get several images by ID with a single query
+def get_images_by_ids(image_ids):
+    images = beehive_image_collection.find(
+        {'_id': {'$in': list(image_ids)}},
+        {'user_id': 1, 'filename': 1, 'audio_filename': 1}
+    )
+    return {image['_id']: image for image in images}
+
+# Move images to the deleted_images collection until they are purged
+def trash_images(image_ids, deleted_by, purge_at):
+    """
+    Removes the images from the images collection with one delete_many. The
+    documents are kept in deleted_images (restorable until `purge_at`) so
+    their files can be released in the background.
+    """
+    image_ids = list(image_ids)
+    if not image_ids:
+        return 0
+    now = datetime.now(timezone.utc)
+    images = list(beehive_image_collection.find({'_id': {'$in': image_ids}}))
+    if not images:
+        return 0
+    for image in images:
+        image.update({'deleted_at': now, 'deleted_by': deleted_by, 'purge_at': purge_at, 'claimed_by': None})
+    found_ids = [image['_id'] for image in images]
+    # Copy before deleting: a crash in between leaves a copy the purge skips, never a lost document
+    beehive_deleted_image_collection.delete_many({'_id': {'$in': found_ids}, 'claimed_by': None})
+    beehive_deleted_image_collection.insert_many(images, ordered=False)
+    result = beehive_image_collection.delete_many({'_id': {'$in': found_ids}})
+    return result.deleted_count
+
+def _claim_deleted_images(query, token):
+    """Mark matching deleted images as taken by `token` and return them."""
+    beehive_deleted_image_collection.update_many(
+        {**query, 'claimed_by': {'$in': [None, token]}},
+        {'$set': {'claimed_by': token}}
+    )
+    return list(beehive_deleted_image_collection.find({'claimed_by': token}))
+
+# Put deleted images back while their undo window is open
+def restore_deleted_images(image_ids, user_id=None):
+    """Returns the ids restored. `user_id` limits the restore to that user's images."""
+    query = {'_id': {'$in': list(image_ids)}, 'purge_at': {'$gt': datetime.now(timezone.utc)}}
+    if user_id is not None:
+        query['user_id'] = user_id
+    token = str(ObjectId())
+    images = _claim_deleted_images(query, token)
+    if not images:
+        return []
+    for image in images:
+        for field in ('deleted_at', 'deleted_by', 'purge_at', 'claimed_by'):
+            image.pop(field, None)
+    try:
+        beehive_image_collection.insert_many(images, ordered=False)
+    except BulkWriteError as e:
+        # Copies left by an interrupted delete: the image was never removed
+        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+            raise
+    beehive_deleted_image_collection.delete_many({'claimed_by': token})
+    return [image['_id'] for image in images]
+
+# Take deleted images whose undo window has passed, for purging
+def claim_expired_deleted_images(image_ids, token):
+    """
+    Claims are exclusive, so a restore and a purge never both get an image;
+    re-running with the same `token` (a retried job) returns the same images.
+    Images that still exist in the images collection are dropped from the
+    result: their copy here is left over from an interrupted delete.
+    """
+    query = {'_id': {'$in': list(image_ids)}, 'purge_at': {'$lte': datetime.now(timezone.utc)}}
+    images = _claim_deleted_images(query, token)
+    live = {
+        image['_id'] for image in beehive_image_collection.find(
+            {'_id': {'$in': [image['_id'] for image in images]}}, {'_id': 1}
+        )
+    }
+    return [image for image in images if image['_id'] not in live]
+
+def delete_claimed_images(token):
+    beehive_deleted_image_collection.delete_many({'claimed_by': token})
+
+# Get a user's stored blobs by content hash
+def get_user_blobs_by_content_hash(user_id, content_hashes):
+    """Map each content hash the user already holds to its stored filename."""
+    images = beehive_image_collection.find(
+        {'user_id': user_id, 'content_hash': {'$in': list(content_hashes)}},
+        {'content_hash': 1, 'filename': 1, 'original_filename': 1}
+    )
+    return {image['content_hash']: image for image in images}
+
 # Get image by audio filename from MongoDB
 def get_image_by_audio_filename(audio_filename):
     """Get image record by its audio filename for ownership verification."""
     image = beehive_image_collection.find_one({'audio_filename': audio_filename})
     return image
 
+# Count images sharing an audio file (one voice note is stored per upload request)
+def count_images_by_audio_filename(audio_filename):
+    return beehive_image_collection.count_documents({'audio_filename': audio_filename}, limit=1)
+
+# Point every image of an upload at its normalized voice note
+def set_voice_note_rendition(audio_filename, rendition):
+    """Returns the number of images updated (0 if they were deleted meanwhile)."""
+    result = beehive_image_collection.update_many(
+        {'audio_filename': audio_filename},
+        {'$set': {
+            'audio_filename': rendition['filename'],
+            'audio_duration': rendition['duration'],
+            'audio_peaks': rendition['peaks'],
+        }}
+    )
+    return result.modified_count
+
+# Stored filenames (uploads or voice notes) that at least one image still references
+def get_referenced_filenames(filenames):
+    names = list(filenames)
+    if not names:
+        return set()
+    query = {'$or': [{'filename': {'$in': names}}, {'audio_filename': {'$in': names}}]}
+    referenced = set()
+    # Deleted images still hold their files until they are purged
+    for collection in (beehive_image_collection, beehive_deleted_image_collection):
+        for image in collection.find(query, {'filename': 1, 'audio_filename': 1}):
+            referenced.add(image.get('filename'))
+            referenced.add(image.get('audio_filename'))
+    return referenced & set(names)
+
+# File stems (names without extension) of uploads that at least one image still references
+def get_referenced_stems(stems):
+    stems = list(stems)
+    if not stems:
+        return set()
+    # Anchored prefix patterns can use the filename index
+    patterns = [re.compile(f"^{re.escape(stem)}\\.[^.]+$") for stem in stems]
+    referenced = set()
+    for collection in (beehive_image_collection, beehive_deleted_image_collection):
+        for image in collection.find({'filename': {'$in': patterns}}, {'filename': 1}):
+            referenced.add(image['filename'].rsplit('.', 1)[0])
+    return referenced & set(stems)
+
+# Page through image file references in _id order, for consistency checks
+def get_image_file_refs_after(last_id, limit):
+    query = {'_id': {'$gt': ObjectId(last_id)}} if last_id else {}
+    return list(beehive_image_collection.find(
+        query, {'filename': 1, 'audio_filename': 1, 'user_id': 1}
+    ).sort('_id', 1).limit(limit))
+
 # Get upload statistics for admin dashboard
 def get_upload_stats():
     """Get statistics for admin dashboard including total users, images, and voice notes."""
     try:
         # Count total images
-        total_images = beehive_image_collection.count_documents({})
+        total_images = beehive_image_collection.estimated_document_count()
 
         # Count voice notes (images with audio_filename)
         total_voice_notes = beehive_image_collection.count_documents({
@@ -411,8 +698,8 @@ def get_recent_uploads(limit=10):
     """Get recent uploads with user information from Clerk for admin dashboard."""
     try:
         #  Get recent uploads sorted by creation date
-        recent_uploads = list(beehive_image_collection.find().sort(
-            'created_at', -1).limit(limit))
+        recent_uploads = list(beehive_image_collection.find(
+            {}, {**IMAGE_LIST_FIELDS, 'user_id': 1}).sort('created_at', -1).limit(limit))
         if not recent_uploads:
             return []
         # collect user ids and query local user collection
@@ -425,7 +712,8 @@ def get_recent_uploads(limit=10):
                 # skip invalid ids
                 continue
 
-        users_cursor = beehive_user_collection.find({'_id': {'$in': object_ids}}) if object_ids else []
+        users_cursor = beehive_user_collection.find(
+            {'_id': {'$in': object_ids}}, {'username': 1}) if object_ids else []
         users_data = {str(u['_id']): u for u in users_cursor}
 
         uploads_list = []
@@ -450,9 +738,8 @@ def get_recent_uploads(limit=10):
         return []
 
 
-def save_notification(user_id, username, filename, title, time_created, sentiment):
-    # Insert notification for admin
-    notification = {
+def build_notification(user_id, username, filename, title, time_created):
+    return {
         "type": "image_upload",
         "user_id": user_id,
         "username": username,
@@ -461,9 +748,22 @@ def save_notification(user_id, username, filename, title, time_created, sentimen
         "timestamp": time_created,
         "seen": False
     }
+
+
+def save_notification(user_id, username, filename, title, time_created, sentiment, notification_id=None):
+    # Insert notification for admin
+    notification = build_notification(user_id, username, filename, title, time_created)
+    if notification_id is not None:
+        notification["_id"] = notification_id
     beehive_notification_collection.insert_one(notification)
 
 
+# Insert admin notifications for a multi-file upload with a single round trip
+def save_notifications(notifications):
+    if notifications:
+        beehive_notification_collection.insert_many(notifications)
+
+
 def get_all_users():
     users = beehive_user_collection.find({}, {'_id': 1, 'username': 1})
     return list(users)
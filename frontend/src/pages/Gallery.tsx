@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
 import { useSearchParams } from 'react-router-dom';
-import { apiUrl } from '../utils/api';
+import { apiUrl, mediaUrl } from '../utils/api';
 import { getToken } from '../utils/auth';
 import {
   PencilIcon,
@@ -27,9 +27,18 @@ interface Upload {
   description: string;
   created_at: string;
   audio_filename?: string;
+  audio_duration?: number | null;
+  audio_peaks?: number[];
   sentiment?: string;
+  url?: string;
+  thumbnail_url?: string;
+  audio_url?: string;
+  derivatives?: Record<string, Record<string, string>>;
 }
 
+// Stored files live in hash-prefix directories; the API returns their URLs
+const getFileUrl = (upload: Upload) => mediaUrl(upload.url || `/static/uploads/${upload.filename}`);
+
 interface EditModalProps {
   image: Upload;
   onClose: () => void;
@@ -116,7 +125,7 @@ const Gallery = () => {
   const [loading, setLoading] = useState(true);
   const [loadingMore, setLoadingMore] = useState(false);
   const [editingImage, setEditingImage] = useState<Upload | null>(null);
-  const [selectedFile, setSelectedFile] = useState<string | null>(null);
+  const [selectedFile, setSelectedFile] = useState<Upload | null>(null);
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [currentAudio, setCurrentAudio] = useState<string | null>(null);
   const [currentAudioUrl, setCurrentAudioUrl] = useState<string | null>(null);
@@ -149,6 +158,8 @@ const Gallery = () => {
   
   const searchTimeoutRef = useRef<ReturnType<typeof setTimeout> | null>(null);
   const abortControllerRef = useRef<AbortController | null>(null);
+  // next_cursor returned for each page, keyed by the page it leads to
+  const pageCursorsRef = useRef<Record<number, string>>({});
 
   // Auto-switch from relevance to date when search query is cleared
   useEffect(() => {
@@ -264,12 +275,18 @@ const Gallery = () => {
         setLoadingMore(true);
       }
       
-      // Always use offset/limit pagination
-      const offset = (page - 1) * pageSize;
-      const params = new URLSearchParams({
-        limit: pageSize.toString(),
-        offset: offset.toString(),
-      });
+      // Page 1 starts a new listing (filters or sort may have changed)
+      if (page === 1) {
+        pageCursorsRef.current = {};
+      }
+      // Follow the previous page's cursor when we have it; jumps fall back to offset
+      const cursor = pageCursorsRef.current[page];
+      const params = new URLSearchParams({ limit: pageSize.toString() });
+      if (cursor) {
+        params.append('cursor', cursor);
+      } else {
+        params.append('offset', ((page - 1) * pageSize).toString());
+      }
       
       if (searchQuery.trim()) params.append('q', searchQuery.trim());
       if (sentiment) params.append('sentiment', sentiment);
@@ -304,6 +321,9 @@ const Gallery = () => {
       }
       setTotalResults(data.total || 0);
       setHasMore(data.hasMore || false);
+      if (data.next_cursor) {
+        pageCursorsRef.current[page + 1] = data.next_cursor;
+      }
       setTotalPages(Math.ceil((data.total || 0) / pageSize));
       setTotalCount(data.total || 0);
       setCurrentPage(page);
@@ -464,8 +484,8 @@ const Gallery = () => {
     }
   };
 
-  const handleFileClick = (filename: string) => {
-    setSelectedFile(filename);
+  const handleFileClick = (upload: Upload) => {
+    setSelectedFile(upload);
     setIsModalOpen(true);
   };
 
@@ -474,13 +494,12 @@ const Gallery = () => {
     setSelectedFile(null);
   };
 
-  const handleDownload = (filename: string) => {
-    const url = apiUrl(`/static/uploads/${filename}`);
-    window.open(url, '_blank');
+  const handleDownload = (upload: Upload) => {
+    window.open(getFileUrl(upload), '_blank');
     toast.success('File opened in new window!');
   };
 
-  const handleAudioClick = async (audioFilename: string) => {
+  const handleAudioClick = async (audioFilename: string, audioUrl?: string) => {
     if (currentAudio === audioFilename) {
       cleanupAudio();
       return;
@@ -502,7 +521,9 @@ const Gallery = () => {
     }
 
     try {
-      const response = await authenticatedFetch(`/api/audio/${audioFilename}`, {
+      // Signed /api/audio URLs from the list response skip the server-side ownership lookup
+      const audioPath = audioUrl?.startsWith('/api/audio/') ? audioUrl : `/api/audio/${audioFilename}`;
+      const response = await authenticatedFetch(audioPath, {
         method: 'GET',
         signal: controller.signal,
       });
@@ -568,8 +589,9 @@ const Gallery = () => {
   const renderFilePreview = () => {
     if (!selectedFile) return null;
 
-    const fileUrl = apiUrl(`/static/uploads/${selectedFile}`);
-    const isPDF = selectedFile.toLowerCase().endsWith('.pdf');
+    const fileUrl = getFileUrl(selectedFile);
+    // Presigned URLs end in a query string; the stored filename keeps the extension
+    const isPDF = selectedFile.filename.toLowerCase().endsWith('.pdf');
 
     if (isPDF) {
       return (
@@ -590,13 +612,17 @@ const Gallery = () => {
     );
   };
 
-  const getThumbnailUrl = (filename: string) => {
-    if (filename.toLowerCase().endsWith('.pdf')) {
-      // For PDFs, use the thumbnail
-      return apiUrl(`/static/uploads/thumbnails/${filename.replace('.pdf', '.jpg')}`);
+  const getThumbnailUrl = (upload: Upload, size = '256') => {
+    const derivative = upload.derivatives?.[size];
+    if (derivative) {
+      // Prefer the resized WebP, falling back to the JPEG derivative
+      return mediaUrl(derivative.webp || derivative.jpg);
     }
-    // For images, use the original file
-    return apiUrl(`/static/uploads/${filename}`);
+    if (upload.thumbnail_url) {
+      // PDF thumbnail, or the original file for images
+      return mediaUrl(upload.thumbnail_url);
+    }
+    return getFileUrl(upload);
   };
 
   const getSentimentColor = (sentiment?: string) => {
@@ -700,7 +726,7 @@ const Gallery = () => {
                 <div className="relative w-full h-full max-w-5xl mx-auto">
                   <div className="relative w-full h-full rounded-2xl overflow-hidden shadow-2xl">
                     <img
-                      src={getThumbnailUrl(filteredImages[currentRollingIndex].filename)}
+                      src={getThumbnailUrl(filteredImages[currentRollingIndex], '1024')}
                       alt={filteredImages[currentRollingIndex].title}
                       className="w-full h-full object-contain bg-gray-100 dark:bg-gray-800"
                     />
@@ -776,7 +802,7 @@ const Gallery = () => {
                               </span>
                             </motion.button>
                             <motion.button
-                              onClick={() => handleDownload(filteredImages[currentRollingIndex].filename)}
+                              onClick={() => handleDownload(filteredImages[currentRollingIndex])}
                               className="p-2.5 rounded-full bg-white/20 hover:bg-white/30 text-white transition-all duration-200 group"
                               whileHover={{ scale: 1.1 }}
                               whileTap={{ scale: 0.95 }}
@@ -1109,12 +1135,12 @@ const Gallery = () => {
                     <motion.div
                       className={`relative cursor-pointer group ${viewMode === 'list' ? 'w-32 h-32 flex-shrink-0' : 'w-full aspect-[4/3]'
                         }`}
-                      onClick={() => handleFileClick(image.filename)}
+                      onClick={() => handleFileClick(image)}
                       whileHover={{ scale: 1.05 }}
                       transition={{ duration: 0.2 }}
                     >
                       <img
-                        src={getThumbnailUrl(image.filename)}
+                        src={getThumbnailUrl(image)}
                         alt={image.title}
                         className={`w-full h-full object-cover transition-transform duration-200`}
                       />
@@ -1175,7 +1201,7 @@ const Gallery = () => {
                               <TrashIcon className="h-4 w-4" />
                             </motion.button>
                             <motion.button
-                              onClick={() => handleDownload(image.filename)}
+                              onClick={() => handleDownload(image)}
                               className="p-1.5 text-gray-600 hover:text-yellow-400 dark:text-gray-400 transition-colors duration-200"
                               title="Download"
                               whileHover={{ scale: 1.1 }}
@@ -1195,7 +1221,7 @@ const Gallery = () => {
                           transition={{ delay: 0.3 }}
                         >
                           <motion.button
-                            onClick={() => handleAudioClick(image.audio_filename!)}
+                            onClick={() => handleAudioClick(image.audio_filename!, image.audio_url)}
                             disabled={audioLoading && currentAudio !== image.audio_filename}
                             className={`p-1.5 rounded-full transition-colors duration-200 ${
                               currentAudio === image.audio_filename
@@ -1214,6 +1240,25 @@ const Gallery = () => {
                               <SpeakerWaveIcon className="h-4 w-4" />
                             )}
                           </motion.button>
+                          {currentAudio !== image.audio_filename && image.audio_peaks && image.audio_peaks.length > 0 && (
+                            <div className="flex items-center space-x-2" aria-hidden="true">
+                              <div className="flex items-center h-6 gap-px">
+                                {image.audio_peaks.map((peak, index) => (
+                                  <span
+                                    key={index}
+                                    className="w-0.5 rounded-sm bg-gray-400 dark:bg-gray-500"
+                                    style={{ height: `${Math.max(8, peak)}%` }}
+                                  />
+                                ))}
+                              </div>
+                              {image.audio_duration != null && (
+                                <span className="text-xs text-gray-500 dark:text-gray-400">
+                                  {Math.floor(image.audio_duration / 60)}:
+                                  {String(Math.round(image.audio_duration % 60)).padStart(2, '0')}
+                                </span>
+                              )}
+                            </div>
+                          )}
                           {currentAudio === image.audio_filename && currentAudioUrl && !audioLoading && (
                             <motion.audio
                               ref={audioRef}
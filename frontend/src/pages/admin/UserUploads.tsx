@@ -5,7 +5,7 @@ import { motion } from 'framer-motion';
 import Pagination from '../../components/ui/Pagination';
 import { ArrowLeftIcon, XMarkIcon, ArrowDownTrayIcon } from '@heroicons/react/24/outline';
 import { toast } from 'react-hot-toast';
-import { apiUrl } from '../../utils/api';
+import { apiUrl, mediaUrl } from '../../utils/api';
 
 interface Upload {
   id: string;
@@ -15,8 +15,14 @@ interface Upload {
   created_at: string;
   audio_filename?: string;
   sentiment?: string;
+  url?: string;
+  audio_url?: string;
 }
 
+// Stored files live in hash-prefix directories; the API returns their URLs
+const filePath = (upload: Upload) => upload.url || `/static/uploads/${upload.filename}`;
+const audioPath = (upload: Upload) => upload.audio_url || `/static/uploads/${upload.audio_filename}`;
+
 const UserUploads = () => {
   const { userId } = useParams();
   const navigate = useNavigate();
@@ -24,7 +30,7 @@ const UserUploads = () => {
   const [uploads, setUploads] = useState<Upload[]>([]);
   const userName = 'User';
   const [loading, setLoading] = useState(true);
-  const [selectedFile, setSelectedFile] = useState<string | null>(null);
+  const [selectedFile, setSelectedFile] = useState<Upload | null>(null);
   const [currentAudio, setCurrentAudio] = useState<string | null>(null);
   const [isModalOpen, setIsModalOpen] = useState(false);
   const audioRef = useRef<HTMLAudioElement | null>(null);
@@ -108,8 +114,8 @@ const UserUploads = () => {
 
   // Pagination is handled via explicit controls (no infinite scroll)
 
-  const handleFileClick = (filename: string) => {
-    setSelectedFile(filename);
+  const handleFileClick = (upload: Upload) => {
+    setSelectedFile(upload);
     setIsModalOpen(true);
   };
 
@@ -143,9 +149,10 @@ const UserUploads = () => {
   const renderFilePreview = () => {
     if (!selectedFile) return null;
 
-    const fileUrl = apiUrl(`/static/uploads/${selectedFile}`);
+    const fileUrl = mediaUrl(filePath(selectedFile));
 
-    if (isPDF(selectedFile)) {
+    // Presigned URLs end in a query string; the stored filename keeps the extension
+    if (isPDF(selectedFile.filename)) {
       return (
         <iframe
           src={fileUrl}
@@ -164,8 +171,8 @@ const UserUploads = () => {
     );
   };
 
-  const handleDownload = (filename: string, type: 'file' | 'audio') => {
-    const url = apiUrl(`/static/uploads/${filename}`);
+  const handleDownload = (path: string, type: 'file' | 'audio') => {
+    const url = mediaUrl(path);
     window.open(url, '_blank');
     toast.success(`${type === 'file' ? 'File' : 'Audio'} opened in new window!`);
   };
@@ -251,7 +258,7 @@ const UserUploads = () => {
                     >
                       <td className="px-6 py-4 whitespace-nowrap">
                         <button
-                          onClick={() => handleFileClick(upload.filename)}
+                          onClick={() => handleFileClick(upload)}
                           className="text-sm font-medium text-blue-600 hover:text-blue-800 dark:text-blue-400 dark:hover:text-blue-300"
                         >
                           {upload.title}
@@ -291,7 +298,7 @@ const UserUploads = () => {
                                   ref={audioRef}
                                   controls
                                   className="w-full [&::-webkit-media-controls-panel]:bg-gray-100 dark:[&::-webkit-media-controls-panel]:bg-gray-800 [&::-webkit-media-controls-current-time-display]:text-gray-700 dark:[&::-webkit-media-controls-current-time-display]:text-gray-300 [&::-webkit-media-controls-time-remaining-display]:text-gray-700 dark:[&::-webkit-media-controls-time-remaining-display]:text-gray-300 [&::-webkit-media-controls-timeline]:bg-gray-300 dark:[&::-webkit-media-controls-timeline]:bg-gray-600 [&::-webkit-media-controls-volume-slider]:bg-gray-300 dark:[&::-webkit-media-controls-volume-slider]:bg-gray-600"
-                                  src={apiUrl(`/static/uploads/${upload.audio_filename}`)}
+                                  src={mediaUrl(audioPath(upload))}
                                   onEnded={() => setCurrentAudio(null)}
                                 >
                                   Your browser does not support the audio element.
@@ -308,7 +315,7 @@ const UserUploads = () => {
                       <td className="px-6 py-4 whitespace-nowrap">
                         <div className="flex items-center space-x-3">
                           <button
-                            onClick={() => handleDownload(upload.filename, 'file')}
+                            onClick={() => handleDownload(filePath(upload), 'file')}
                             className="inline-flex items-center px-3 py-1.5 rounded-md text-sm font-medium bg-yellow-100 text-yellow-700 hover:bg-yellow-200 dark:bg-yellow-900 dark:text-yellow-100 dark:hover:bg-yellow-800 transition-colors duration-200"
                             title="Download File"
                           >
@@ -317,7 +324,7 @@ const UserUploads = () => {
                           </button>
                           {upload.audio_filename && (
                             <button
-                              onClick={() => handleDownload(upload.audio_filename!, 'audio')}
+                              onClick={() => handleDownload(audioPath(upload), 'audio')}
                               className="inline-flex items-center px-3 py-1.5 rounded-md text-sm font-medium bg-blue-100 text-blue-700 hover:bg-blue-200 dark:bg-blue-900 dark:text-blue-100 dark:hover:bg-blue-800 transition-colors duration-200"
                               title="Download Audio"
                             >
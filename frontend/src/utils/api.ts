@@ -4,3 +4,7 @@ export const apiUrl = (path: string): string => {
   const cleanPath = path.startsWith('/') ? path : `/${path}`;
   return `${API_BASE_URL}${cleanPath}`;
 };
+
+// Media URLs from the API may be absolute (presigned bucket URLs); only relative paths get the API base
+export const mediaUrl = (path: string): string =>
+  /^(?:[a-z][a-z\d+.-]*:)?\/\//i.test(path) ? path : apiUrl(path);
@@ -0,0 +1,78 @@
+"""
+Build the declared MongoDB indexes and check that every query shape uses one.
+
+    python manage_indexes.py build [--collection images ...]
+    python manage_indexes.py verify
+    python manage_indexes.py list
+
+`build` creates missing indexes from database/indexes.py (the app also does
+this in the background at start-up). `verify` runs explain() on every
+declared query shape and exits non-zero if a plan is a collection scan that
+is not marked as expected, so it can gate deploys and CI against a copy of
+the production data.
+"""
+import argparse
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database.indexes import INDEXES, QUERY_SHAPES, ensure_indexes, explain_shape, verify_query_plans
+from utils.logger import Logger
+
+logger = Logger.get_logger("manage_indexes")
+
+
+def build(collections):
+    failed = ensure_indexes(collections)
+    if failed:
+        logger.error(f"{failed} indexes failed to build")
+        return 1
+    logger.info("All declared indexes exist")
+    return 0
+
+
+def verify():
+    problems = verify_query_plans()
+    for query_shape, stages in problems:
+        logger.error(f"COLLSCAN: {query_shape.collection} '{query_shape.name}' ({' > '.join(stages)})")
+    for query_shape in QUERY_SHAPES:
+        if query_shape.collscan_ok:
+            logger.info(f"Allowed scan: {query_shape.collection} '{query_shape.name}' ({query_shape.collscan_ok})")
+    if problems:
+        logger.error(f"{len(problems)} of {len(QUERY_SHAPES)} query shapes scan a whole collection")
+        return 1
+    logger.info(f"All {len(QUERY_SHAPES)} query shapes use an index")
+    return 0
+
+
+def list_plans():
+    for collection_name, specs in INDEXES.items():
+        for spec in specs:
+            print(f"{collection_name}.{spec.name}: {spec.keys} {spec.options or ''}")
+    for query_shape in QUERY_SHAPES:
+        print(f"{query_shape.collection} '{query_shape.name}': {' > '.join(explain_shape(query_shape))}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Create missing indexes")
+    build_parser.add_argument(
+        "--collection", action="append",
+        help="Only build indexes of this collection (repeatable)",
+    )
+    subparsers.add_parser("verify", help="Fail if a query shape is a collection scan")
+    subparsers.add_parser("list", help="Print declared indexes and the plan of every query shape")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        return build(args.collection)
+    if args.command == "verify":
+        return verify()
+    return list_plans()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,154 @@
+"""
+Move files from the flat UPLOAD_FOLDER layout into hash-prefix directories.
+
+    python migrate_uploads.py --batch-size 500 --pause 0.5
+
+Each file is hard-linked into its sharded path before the flat name is
+removed, so every file stays readable through the app's fallback lookup while
+the migration runs. Thumbnails and derivatives move together with the upload
+they belong to. Moved files leave the flat layout, so an interrupted run is
+resumed by running the command again. Once it reports nothing left to move,
+set UPLOAD_FLAT_FALLBACK=false.
+"""
+import argparse
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import Config
+from utils.derivatives import (
+    DERIVATIVE_SIZES,
+    DERIVATIVES_DIRNAME,
+    derivative_filename,
+    derived_file_owner,
+)
+from utils.logger import Logger
+from utils.thumbnails import THUMBNAILS_DIRNAME, preview_strip_name, thumbnail_name
+from utils.upload_paths import flat_relpath, iter_flat_files, sharded_relpath
+
+logger = Logger.get_logger("migrate_uploads")
+
+# Every format a derivative may have been written in, including ones this host cannot encode
+DERIVATIVE_FORMATS = ("avif", "webp", "jpg")
+
+
+def _derived_files(filename):
+    """(area, name) of every file that may have been derived from an upload."""
+    yield THUMBNAILS_DIRNAME, thumbnail_name(filename)
+    yield THUMBNAILS_DIRNAME, preview_strip_name(filename)
+    for size in DERIVATIVE_SIZES:
+        for fmt in DERIVATIVE_FORMATS:
+            yield DERIVATIVES_DIRNAME, derivative_filename(filename, size, fmt)
+
+
+def move_to_shard(upload_folder, owner, area="", name=None, dry_run=False):
+    """
+    Move one file from its flat path to its sharded path.
+    Returns False when there was nothing to move.
+    """
+    source = os.path.join(upload_folder, flat_relpath(owner, area, name))
+    destination = os.path.join(upload_folder, sharded_relpath(owner, area, name))
+    if not os.path.isfile(source):
+        return False
+    if dry_run:
+        return True
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        # Link first: between the two steps the file exists at both paths
+        os.link(source, destination)
+    except FileExistsError:
+        # Already sharded by an interrupted run or written there since; the sharded copy wins
+        pass
+    except FileNotFoundError:
+        # Deleted while we were looking at it
+        return False
+    except OSError:
+        # Hard links are not supported here; a rename is still atomic
+        os.replace(source, destination)
+        return True
+
+    try:
+        os.remove(source)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+def _flat_work(upload_folder, counted=None):
+    """
+    Yield (owner, area, name) groups to move, one group per upload. Derived
+    files listed in `counted` (a dry run does not move them) are not yielded twice.
+    """
+    for filename in iter_flat_files(upload_folder):
+        group = [
+            (filename, area, name)
+            for area, name in _derived_files(filename)
+            if os.path.isfile(os.path.join(upload_folder, flat_relpath(filename, area, name)))
+        ]
+        # The upload itself moves last so its derived files never point at the wrong directory for long
+        group.append((filename, "", None))
+        yield group
+
+    # Thumbnails and derivatives whose upload is already sharded or gone
+    for area in (THUMBNAILS_DIRNAME, DERIVATIVES_DIRNAME):
+        for name in iter_flat_files(upload_folder, area):
+            if counted is None or (area, name) not in counted:
+                # Only the owner's stem matters for sharding
+                yield [(derived_file_owner(area, name), area, name)]
+
+
+def migrate(upload_folder, batch_size, pause, dry_run=False):
+    moved = failed = batch = 0
+    counted = set() if dry_run else None
+    for group in _flat_work(upload_folder, counted):
+        for owner, area, name in group:
+            try:
+                if move_to_shard(upload_folder, owner, area, name, dry_run):
+                    moved += 1
+                    batch += 1
+                    if dry_run and area:
+                        counted.add((area, name))
+            except OSError as e:
+                failed += 1
+                logger.error(f"Failed to move '{os.path.join(area, name or owner)}': {e}")
+        if batch >= batch_size:
+            logger.info(f"{'Would move' if dry_run else 'Moved'} {moved} files so far")
+            batch = 0
+            if pause and not dry_run:
+                # Leave disk bandwidth to the app between batches
+                time.sleep(pause)
+    return moved, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate uploads into hash-prefix directories.")
+    parser.add_argument(
+        "--batch-size", type=int, default=500,
+        help="Files moved between pauses",
+    )
+    parser.add_argument(
+        "--pause", type=float, default=0.5,
+        help="Seconds to sleep after each batch",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Only count the files that would be moved",
+    )
+    args = parser.parse_args()
+
+    moved, failed = migrate(
+        Config.UPLOAD_FOLDER, max(1, args.batch_size), max(0.0, args.pause), args.dry_run
+    )
+    if args.dry_run:
+        logger.info(f"Dry run: {moved} files would be moved")
+    else:
+        logger.info(f"Migration finished: {moved} moved, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
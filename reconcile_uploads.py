@@ -0,0 +1,329 @@
+"""
+Find files in UPLOAD_FOLDER that no image references, and images whose files are gone.
+
+    python reconcile_uploads.py --rate 200 --max-entries 50000
+    python reconcile_uploads.py --quarantine
+    python reconcile_uploads.py --check-documents
+
+Directory entries are compared against `images.filename` and
+`images.audio_filename` in batches: uploads and voice notes must be
+referenced by name, thumbnails and derivatives need an image for the upload
+they were made from. Blob records, live upload sessions and queued or running
+jobs also hold the files they name, since with background jobs the image
+document is only written after the file. Files younger than
+--min-age-minutes are skipped as well.
+
+The scan walks the flat layout and then every shard directory in sorted
+order, saving its position to a checkpoint file after each batch. A run can
+be stopped (or capped with --max-entries) and the next run continues where
+it left off; a finished pass starts over on the next run. --rate caps
+entries per second so the scan can run on live nodes.
+
+Orphans are only reported unless --quarantine is given, which moves them to
+--quarantine-dir (same relative paths) for inspection or manual restore.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import Config
+from database.blobhandler import get_blob_filenames
+from database.jobqueue import get_pending_job_filenames
+from database.uploadsessionhandler import get_upload_session_filenames
+from database.userdatahandler import (
+    get_image_file_refs_after,
+    get_referenced_filenames,
+    get_referenced_stems,
+)
+from utils.derivatives import DERIVATIVES_DIRNAME, derived_file_owner
+from utils.logger import Logger
+from utils.media_storage import get_storage, storage_key
+from utils.thumbnails import THUMBNAILS_DIRNAME
+from utils.upload_paths import iter_flat_files, iter_shard_dirs, iter_shard_files, resolve_path
+
+logger = Logger.get_logger("reconcile_uploads")
+
+# Uploads and voice notes first, then files derived from them
+AREAS = ("", THUMBNAILS_DIRNAME, DERIVATIVES_DIRNAME)
+
+
+class Checkpoint:
+    """Scan position persisted as JSON: the last area, directory and name handled."""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def position(self, key):
+        return self.state.get(key)
+
+    def save(self, key, value):
+        self.state[key] = value
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.part"
+        with open(temp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(temp_path, self.path)
+
+
+class RateLimiter:
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.started = time.monotonic()
+        self.count = 0
+
+    def wait(self, count):
+        """Sleep until `count` more entries fit in the rate."""
+        self.count += count
+        if self.per_second:
+            delay = self.count / self.per_second - (time.monotonic() - self.started)
+            if delay > 0:
+                time.sleep(delay)
+
+
+def _position_key(area, directory, name):
+    # Tuples compare in scan order: areas in AREAS order, flat ("") before shards, then names
+    return [AREAS.index(area), directory, name]
+
+
+def iter_entries(upload_folder, start=None):
+    """Yield (area, directory, name) for every stored file after `start`, in scan order."""
+    for area in AREAS:
+        directories = [""] + list(iter_shard_dirs(upload_folder, area))
+        for directory in directories:
+            if start and _position_key(area, directory, "\uffff") <= start:
+                continue
+            if directory:
+                names = sorted(iter_shard_files(upload_folder, area, directory))
+            else:
+                names = sorted(iter_flat_files(upload_folder, area))
+            for name in names:
+                if not start or _position_key(area, directory, name) > start:
+                    yield area, directory, name
+
+
+def _entry_path(upload_folder, area, directory, name):
+    shard = directory.split("/") if directory else []
+    return os.path.join(upload_folder, area, *shard, name)
+
+
+def _held_filenames(values):
+    """Filenames matching `values` (names or patterns) held by a blob record, upload session or pending job."""
+    return get_blob_filenames(values) | get_pending_job_filenames(values) | get_upload_session_filenames()
+
+
+def referenced_filenames(names):
+    """Uploads and voice notes in `names` that are still referenced."""
+    names = set(names)
+    if not names:
+        return set()
+    return (get_referenced_filenames(names) | _held_filenames(names)) & names
+
+
+def referenced_stems(stems):
+    """Stems in `stems` of uploads that are still referenced."""
+    stems = set(stems)
+    referenced = get_referenced_stems(stems)
+    rest = stems - referenced
+    if rest:
+        patterns = [re.compile(f"^{re.escape(stem)}\\.[^.]+$") for stem in rest]
+        referenced |= {name.rsplit(".", 1)[0] for name in _held_filenames(patterns)} & rest
+    return referenced
+
+
+def find_orphans(batch):
+    """Return the (area, directory, name) entries of `batch` nothing accounts for."""
+    uploads = [name for area, _, name in batch if not area]
+    referenced = referenced_filenames(uploads)
+    owners = {derived_file_owner(area, name) for area, _, name in batch if area}
+    referenced_owners = referenced_stems(owners)
+    return [
+        (area, directory, name)
+        for area, directory, name in batch
+        if (derived_file_owner(area, name) not in referenced_owners if area else name not in referenced)
+    ]
+
+
+def _still_orphaned(area, name):
+    # Re-check right before moving; an upload may have claimed the file since the batch query
+    if not area:
+        return not referenced_filenames([name])
+    return not referenced_stems([derived_file_owner(area, name)])
+
+
+def quarantine(upload_folder, quarantine_dir, area, directory, name):
+    source = _entry_path(upload_folder, area, directory, name)
+    destination = _entry_path(quarantine_dir, area, directory, name)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    shutil.move(source, destination)
+
+
+def scan_files(upload_folder, checkpoint, batch_size, limiter, min_age, max_entries,
+               quarantine_dir=None):
+    start = checkpoint.position("files")
+    cutoff = time.time() - min_age
+    scanned = orphaned = orphaned_bytes = 0
+    batch = []
+
+    def flush():
+        nonlocal orphaned, orphaned_bytes
+        for area, directory, name in find_orphans(batch):
+            path = _entry_path(upload_folder, area, directory, name)
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            if quarantine_dir and not _still_orphaned(area, name):
+                continue
+            orphaned += 1
+            orphaned_bytes += size
+            if quarantine_dir:
+                quarantine(upload_folder, quarantine_dir, area, directory, name)
+                logger.info(f"Quarantined orphan {path} ({size} bytes)")
+            else:
+                logger.info(f"Orphan {path} ({size} bytes)")
+        area, directory, name = batch[-1]
+        checkpoint.save("files", _position_key(area, directory, name))
+        limiter.wait(len(batch))
+        batch.clear()
+
+    finished = True
+    for area, directory, name in iter_entries(upload_folder, start):
+        if max_entries and scanned >= max_entries:
+            finished = False
+            break
+        scanned += 1
+        try:
+            if os.path.getmtime(_entry_path(upload_folder, area, directory, name)) > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        batch.append((area, directory, name))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    if finished:
+        # Full pass done; the next run starts from the beginning
+        checkpoint.save("files", None)
+    return scanned, orphaned, orphaned_bytes, finished
+
+
+def _file_exists(upload_folder, filename):
+    storage = get_storage()
+    if storage.remote:
+        return storage.head(storage_key(filename)) is not None
+    return os.path.exists(resolve_path(upload_folder, filename))
+
+
+def scan_documents(upload_folder, checkpoint, batch_size, limiter, max_entries):
+    """Report images whose upload or voice note file no longer exists."""
+    last_id = checkpoint.position("documents")
+    scanned = missing = 0
+    finished = True
+    while True:
+        if max_entries and scanned >= max_entries:
+            finished = False
+            break
+        images = get_image_file_refs_after(last_id, batch_size)
+        if not images:
+            break
+        for image in images:
+            for field in ("filename", "audio_filename"):
+                filename = image.get(field)
+                if filename and not _file_exists(upload_folder, filename):
+                    missing += 1
+                    logger.info(f"Image {image['_id']} (user {image.get('user_id')}) is missing {field} '{filename}'")
+        scanned += len(images)
+        last_id = str(images[-1]["_id"])
+        checkpoint.save("documents", last_id)
+        limiter.wait(len(images))
+    if finished:
+        checkpoint.save("documents", None)
+    return scanned, missing, finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile stored files with the images collection.")
+    parser.add_argument(
+        "--batch-size", type=int, default=500,
+        help="Entries compared per database query",
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0,
+        help="Maximum entries per second (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--max-entries", type=int, default=0,
+        help="Stop after this many entries and resume from the checkpoint next run (0 = full pass)",
+    )
+    parser.add_argument(
+        "--min-age-minutes", type=float, default=60,
+        help="Ignore files modified more recently than this",
+    )
+    parser.add_argument(
+        "--checkpoint", default=os.path.join("cache", "reconcile_uploads.json"),
+        help="File the scan position is saved to",
+    )
+    parser.add_argument(
+        "--reset", action="store_true",
+        help="Ignore the checkpoint and start a new pass",
+    )
+    parser.add_argument(
+        "--quarantine", action="store_true",
+        help="Move orphaned files to --quarantine-dir instead of only reporting them",
+    )
+    parser.add_argument(
+        "--quarantine-dir", default=os.path.join("quarantine", "uploads"),
+        help="Where quarantined files are moved, outside the public static folder",
+    )
+    parser.add_argument(
+        "--check-documents", action="store_true",
+        help="Also report images whose files are missing",
+    )
+    args = parser.parse_args()
+
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = Checkpoint(args.checkpoint)
+    limiter = RateLimiter(args.rate)
+    batch_size = max(1, args.batch_size)
+
+    scanned, orphaned, orphaned_bytes, finished = scan_files(
+        Config.UPLOAD_FOLDER,
+        checkpoint,
+        batch_size,
+        limiter,
+        args.min_age_minutes * 60,
+        args.max_entries,
+        args.quarantine_dir if args.quarantine else None,
+    )
+    logger.info(
+        f"Files: {scanned} scanned, {orphaned} orphaned ({orphaned_bytes} bytes)"
+        f"{' quarantined' if args.quarantine else ''}; "
+        f"{'pass complete' if finished else 'resume from checkpoint next run'}"
+    )
+
+    if args.check_documents:
+        scanned, missing, finished = scan_documents(
+            Config.UPLOAD_FOLDER, checkpoint, batch_size, limiter, args.max_entries
+        )
+        logger.info(
+            f"Images: {scanned} checked, {missing} missing files; "
+            f"{'pass complete' if finished else 'resume from checkpoint next run'}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
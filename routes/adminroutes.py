@@ -6,7 +6,11 @@ from database.userdatahandler import (
     get_upload_stats,
     get_upload_analytics
 )
-from utils.pagination import parse_pagination_params
+from database.connection import pool_snapshot
+from database.read_routing import ANALYTICS, read_profile, read_profiles_snapshot
+from utils.admission import upload_admission
+from utils.ownership_cache import audio_owner_cache
+from utils.pagination import decode_cursor, next_cursor, parse_pagination_params
 from utils.logger import Logger
 from utils.sanitize import sanitize_api_query
 
@@ -30,7 +34,11 @@ def admin_user_images_show(user_id):
             'to': request.args.get('to')
         }
         filters = {k: v for k, v in filters.items() if v is not None}
-        result = _get_paginated_images_by_user(user_id, page, page_size, filters if filters else None)
+        cursor = request.args.get('cursor', '').strip() or None
+        with_count = request.args.get('count', 'true').strip().lower() != 'false'
+        result = _get_paginated_images_by_user(
+            user_id, page, page_size, filters if filters else None, cursor, with_count
+        )
         return jsonify(result), 200
     except ValueError as e:
         logger.error(f"Invalid pagination parameters: {str(e)}")
@@ -42,6 +50,7 @@ def admin_user_images_show(user_id):
 # Admin: Dashboard
 @admin_bp.route("/dashboard", methods=["GET"])
 @require_admin_role
+@read_profile(ANALYTICS)
 def get_dashboard_data():
     try:
         limit = int(request.args.get("limit", 10))
@@ -61,6 +70,7 @@ def get_dashboard_data():
 # Admin: Analytics (Uploads only)
 @admin_bp.route("/analytics", methods=["GET"])
 @require_admin_role
+@read_profile(ANALYTICS)
 def get_all_analytics():
     try:
         days_ago = int(request.args.get("days", 7))
@@ -78,15 +88,52 @@ def get_all_analytics():
         logger.error("Error fetching analytics", exc_info=True)
         return jsonify({"error": "Failed to fetch analytics data"}), 500
 
+# Admin: Upload admission state of the worker process serving this request
+@admin_bp.route("/uploads/admission", methods=["GET"])
+@require_admin_role
+def get_upload_admission_state():
+    try:
+        return jsonify(upload_admission.snapshot()), 200
+    except Exception:
+        logger.error("Error fetching upload admission state", exc_info=True)
+        return jsonify({"error": "Failed to fetch upload admission state"}), 500
+
+# Admin: Media ownership cache counters of the worker process serving this request
+@admin_bp.route("/media/ownership-cache", methods=["GET"])
+@require_admin_role
+def get_ownership_cache_state():
+    try:
+        return jsonify(audio_owner_cache.snapshot()), 200
+    except Exception:
+        logger.error("Error fetching ownership cache state", exc_info=True)
+        return jsonify({"error": "Failed to fetch ownership cache state"}), 500
+
+# Admin: MongoDB connection pool counters of the worker process serving this request
+@admin_bp.route("/db/pool", methods=["GET"])
+@require_admin_role
+def get_db_pool_state():
+    try:
+        return jsonify({**pool_snapshot(), "readProfiles": read_profiles_snapshot()}), 200
+    except Exception:
+        logger.error("Error fetching database pool state", exc_info=True)
+        return jsonify({"error": "Failed to fetch database pool state"}), 500
+
 # Admin: List users (paginated, searchable)
+USERS_SORT = "_id:1"
 
 @admin_bp.route("/users", methods=["GET"])
 @require_admin_role
+@read_profile(ANALYTICS)
 def list_users():
     try:
-        limit = int(request.args.get("limit", 10))
+        limit = max(1, int(request.args.get("limit", 10)))
         offset = int(request.args.get("offset", 0))
         query = request.args.get("query", "").strip()
+        cursor = request.args.get("cursor", "").strip()
+        try:
+            after = decode_cursor(cursor, USERS_SORT) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Build filter
         mongo_filter = {}
@@ -97,10 +144,18 @@ def list_users():
         users_col = beehive.users
         total_count = users_col.count_documents(mongo_filter)
 
-        cursor = users_col.find(mongo_filter).skip(offset).limit(limit)
+        # Page in _id order, seeking past the previous page when a cursor is given
+        if after is not None:
+            page_filter = {"_id": {"$gt": after[1]}}
+            results = users_col.find({"$and": [mongo_filter, page_filter]} if mongo_filter else page_filter)
+        else:
+            results = users_col.find(mongo_filter).skip(offset)
+        rows = list(results.sort("_id", 1).limit(limit + 1))
+        has_more = len(rows) > limit
+        rows = rows[:limit]
 
         users = []
-        for u in cursor:
+        for u in rows:
             users.append({
                 "id": str(u.get("_id")),
                 "user_id": str(u.get("_id")),
@@ -112,7 +167,11 @@ def list_users():
                 "clerkId": u.get("clerk_id", ""),
             })
 
-        return jsonify({"users": users, "totalCount": total_count}), 200
+        return jsonify({
+            "users": users,
+            "totalCount": total_count,
+            "next_cursor": next_cursor(rows, USERS_SORT, "_id", has_more),
+        }), 200
     except Exception:
         logger.error("Error listing users", exc_info=True)
         return jsonify({"error": "Failed to list users"}), 500
@@ -120,6 +179,7 @@ def list_users():
 
 @admin_bp.route("/users/only-users", methods=["GET"])
 @require_admin_role
+@read_profile(ANALYTICS)
 def list_only_users():
     try:
         users_col = beehive.users
@@ -1,5 +1,12 @@
+import os
+
 import pytest
 from app import app as flask_app
+from config import Config
+from database.connection import connection_manager
+from utils import media_storage
+from utils.admission import upload_admission
+from utils.jwt_auth import create_access_token
 
 @pytest.fixture
 def app():
@@ -16,3 +23,31 @@ def client(app):
 @pytest.fixture
 def runner(app):
     return app.test_cli_runner()
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An empty in-memory database serving every collection for one test."""
+    mongomock = pytest.importorskip("mongomock")
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(connection_manager, "_client", client)
+    monkeypatch.setattr(connection_manager, "_pid", os.getpid())
+    return client[Config.DATABASE_NAME]
+
+@pytest.fixture
+def upload_folder(app, tmp_path, monkeypatch):
+    """A fresh UPLOAD_FOLDER with local storage and no free-disk requirement."""
+    folder = tmp_path / "uploads"
+    folder.mkdir()
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(folder))
+    monkeypatch.setattr(Config, "UPLOAD_FOLDER", str(folder))
+    monkeypatch.setattr(media_storage, "_storage", media_storage.LocalStorage(str(folder)))
+    monkeypatch.setattr(upload_admission, "upload_folder", str(folder))
+    monkeypatch.setattr(upload_admission, "min_free_disk_bytes", 0)
+    return folder
+
+@pytest.fixture
+def auth_headers(app):
+    def make(user_id, role="user"):
+        with app.app_context():
+            return {"Authorization": f"Bearer {create_access_token(str(user_id), role)}"}
+    return make
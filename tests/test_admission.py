@@ -0,0 +1,109 @@
+import pytest
+from flask import Flask
+
+from utils import admission
+from utils.admission import AdmissionRejected, UploadAdmissionController, admit_upload
+
+
+@pytest.fixture
+def controller(tmp_path, monkeypatch):
+    controller = UploadAdmissionController(
+        str(tmp_path), max_inflight_requests=2, max_inflight_bytes=1000,
+        min_free_disk_bytes=0, max_queue_depth=10, retry_after_seconds=7,
+    )
+    monkeypatch.setattr(controller, "_free_disk_bytes", lambda: 10_000)
+    monkeypatch.setattr(admission, "upload_admission", controller)
+    return controller
+
+
+def rejection(controller, content_length, check_queue=False):
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.admit(content_length, check_queue)
+    return excinfo.value
+
+
+def test_requests_over_the_concurrency_cap_are_throttled(controller):
+    controller.admit(10)
+    controller.admit(10)
+    rejected = rejection(controller, 10)
+    assert (rejected.reason, rejected.status_code, rejected.retry_after) == ("requests", 429, 7)
+
+    controller.release(10)
+    controller.admit(10)
+    assert controller.inflight_requests == 2
+    assert controller.rejected == {"requests": 1}
+
+
+def test_bodies_over_the_byte_cap_are_throttled(controller):
+    controller.admit(600)
+    rejected = rejection(controller, 600)
+    assert (rejected.reason, rejected.status_code) == ("bytes", 429)
+    controller.release(600)
+    # A single oversized body is admitted when nothing else is in flight
+    controller.admit(5000)
+
+
+def test_uploads_stop_while_the_disk_is_nearly_full(controller):
+    controller.min_free_disk_bytes = 9_500
+    controller.admit(400)
+    rejected = rejection(controller, 200)
+    assert (rejected.reason, rejected.status_code) == ("disk", 503)
+
+
+def test_uploads_stop_while_the_job_queue_is_backed_up(controller, monkeypatch):
+    monkeypatch.setattr(admission, "count_pending_jobs", lambda: 10)
+    # The queue is only consulted when background jobs are enabled
+    controller.admit(10)
+    rejected = rejection(controller, 10, check_queue=True)
+    assert (rejected.reason, rejected.status_code) == ("queue", 503)
+
+
+@pytest.fixture
+def guarded_app(controller):
+    app = Flask(__name__)
+    app.config.update(TESTING=True, BACKGROUND_JOBS=False)
+
+    @app.route("/upload", methods=["POST"])
+    @admit_upload
+    def upload():
+        if controller.inflight_requests != 1:
+            return "unexpected", 500
+        return "ok", 200
+
+    @app.route("/broken", methods=["POST"])
+    @admit_upload
+    def broken():
+        raise RuntimeError("handler failed")
+
+    return app
+
+
+def test_rejection_carries_retry_after(guarded_app, controller):
+    controller.admit(10)
+    controller.admit(10)
+    response = guarded_app.test_client().post("/upload", data=b"x" * 10)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    assert "error" in response.get_json()
+
+
+def test_disk_rejection_is_a_503_with_retry_after(guarded_app, controller):
+    controller.min_free_disk_bytes = 20_000
+    response = guarded_app.test_client().post("/upload", data=b"x" * 10)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+
+
+def test_slot_is_released_after_the_request(guarded_app, controller):
+    client = guarded_app.test_client()
+    assert client.post("/upload", data=b"x" * 10).status_code == 200
+    assert (controller.inflight_requests, controller.inflight_bytes) == (0, 0)
+
+
+def test_slot_is_released_when_the_handler_raises(guarded_app, controller):
+    guarded_app.config["PROPAGATE_EXCEPTIONS"] = False
+    client = guarded_app.test_client()
+    for _ in range(3):
+        assert client.post("/broken", data=b"x" * 10).status_code == 500
+    assert (controller.inflight_requests, controller.inflight_bytes) == (0, 0)
+    assert client.post("/upload", data=b"x" * 10).status_code == 200
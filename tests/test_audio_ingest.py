@@ -0,0 +1,92 @@
+import base64
+import os
+
+import pytest
+
+from utils import audio_ingest
+from utils.audio_ingest import parse_audio_data_url, write_audio_data_url
+from utils.upload_stream import UploadRejected
+
+ALLOWED = {"audio/wav", "audio/webm", "audio/ogg"}
+WAV = b"RIFF\x24\x00\x00\x00WAVEfmt " + bytes(range(256)) * 3
+
+
+def data_url(payload, mime="audio/wav", encoded=None):
+    return f"data:{mime};base64,{encoded or base64.b64encode(payload).decode()}"
+
+
+def ingest(audio_data, path):
+    mime_type, offset = parse_audio_data_url(audio_data, ALLOWED)
+    write_audio_data_url(audio_data, offset, mime_type, str(path))
+    return mime_type
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # 7 is not a multiple of 4, so quanta straddle every chunk boundary
+    monkeypatch.setattr(audio_ingest, "AUDIO_DECODE_CHUNK_CHARS", 7)
+
+
+def test_payload_round_trips_byte_for_byte(tmp_path):
+    assert ingest(data_url(WAV), tmp_path / "a.wav") == "audio/wav"
+    assert (tmp_path / "a.wav").read_bytes() == WAV
+    assert os.listdir(tmp_path) == ["a.wav"]
+
+
+def test_quanta_split_across_chunks_are_joined(tmp_path, small_chunks):
+    ingest(data_url(WAV), tmp_path / "a.wav")
+    assert (tmp_path / "a.wav").read_bytes() == WAV
+
+
+def test_whitespace_and_newlines_are_ignored(tmp_path, small_chunks):
+    encoded = base64.encodebytes(WAV).decode().replace("\n", "\r\n  \t")
+    ingest(data_url(WAV, encoded=encoded), tmp_path / "a.wav")
+    assert (tmp_path / "a.wav").read_bytes() == WAV
+
+
+@pytest.mark.parametrize("prefix, mime_type", [
+    ("data:audio/webm;codecs=opus;base64,", "audio/webm"),
+    ("  data:AUDIO/OGG;base64,", "audio/ogg"),
+])
+def test_data_url_prefix_parameters_are_dropped(prefix, mime_type):
+    assert parse_audio_data_url(prefix + "T2dnUw==", ALLOWED) == (mime_type, len(prefix))
+
+
+@pytest.mark.parametrize("audio_data, message", [
+    ("audio/wav;base64,UklGRg==", "Invalid audio data URL"),
+    ("data:audio/wav,UklGRg==", "Invalid audio data URL"),
+    ("data:" + "x" * 300 + ";base64,UklGRg==", "Invalid audio data URL"),
+    ("data:audio/mpeg;base64,SUQz", "Unsupported audio MIME type"),
+])
+def test_malformed_prefixes_are_rejected(audio_data, message):
+    with pytest.raises(UploadRejected, match=message):
+        parse_audio_data_url(audio_data, ALLOWED)
+
+
+def test_payload_at_the_limit_is_accepted_and_one_byte_more_refused(tmp_path, monkeypatch, small_chunks):
+    monkeypatch.setattr(audio_ingest, "MAX_AUDIO_FILE_SIZE", 99)
+    ingest(data_url(WAV[:99]), tmp_path / "a.wav")
+    assert (tmp_path / "a.wav").read_bytes() == WAV[:99]
+
+    with pytest.raises(UploadRejected) as excinfo:
+        ingest(data_url(WAV[:100]), tmp_path / "b.wav")
+    assert excinfo.value.status_code == 413
+    assert os.listdir(tmp_path) == ["a.wav"]
+
+
+@pytest.mark.parametrize("payload, mime_type", [
+    (b"ID3\x04" + bytes(64), "audio/wav"),
+    (WAV, "audio/ogg"),
+    (b"RIFF", "audio/wav"),  # Shorter than the signature
+])
+def test_wrong_signature_is_rejected(tmp_path, payload, mime_type):
+    with pytest.raises(UploadRejected, match="content validation"):
+        ingest(data_url(payload, mime_type), tmp_path / "a.wav")
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("encoded", ["UklGRi", "UklG!!==", ""])
+def test_invalid_base64_is_rejected(tmp_path, encoded):
+    with pytest.raises(UploadRejected, match="not valid base64"):
+        ingest(f"data:audio/wav;base64,{encoded}", tmp_path / "a.wav")
+    assert os.listdir(tmp_path) == []
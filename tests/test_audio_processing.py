@@ -0,0 +1,167 @@
+import array
+import datetime
+import os
+import subprocess
+import wave
+
+import pytest
+from bson import ObjectId
+
+from utils import audio_processing
+from utils.audio_processing import normalize_voice_note, rendition_filename, waveform_peaks
+from utils.upload_jobs import process_voice_note
+from utils.upload_paths import resolve_path
+
+RATE = 8000
+
+
+def tone(loud_samples, silence_samples=0):
+    return [0] * silence_samples + [3000 if i % 2 else -3000 for i in range(loud_samples)] + [0] * silence_samples
+
+
+def write_wav(upload_folder, filename, samples, channels=2):
+    path = resolve_path(str(upload_folder), filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frames = array.array("h", [sample for sample in samples for _ in range(channels)])
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(frames.tobytes())
+    return path
+
+
+@pytest.fixture
+def without_ffmpeg(monkeypatch):
+    monkeypatch.setattr(audio_processing, "FFMPEG", None)
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Stands in for the ffmpeg binary: 'transcodes' to an Ogg stub and decodes to a fixed tone."""
+    calls = []
+
+    def run(args):
+        calls.append(args)
+        if args[-1] == "-":
+            return subprocess.CompletedProcess(args, 0, stdout=array.array("h", tone(RATE // 2)).tobytes())
+        with open(args[-1], "wb") as f:
+            f.write(b"OggS" + bytes(60))
+        return subprocess.CompletedProcess(args, 0, stdout=b"")
+
+    monkeypatch.setattr(audio_processing, "FFMPEG", "ffmpeg")
+    monkeypatch.setattr(audio_processing, "_run_ffmpeg", run)
+    return calls
+
+
+def test_peaks_are_scaled_per_bucket():
+    samples = [0] * 50 + [100] * 25 + [-400] * 25
+    assert waveform_peaks(samples, count=4) == [0, 0, 25, 100]
+    assert waveform_peaks([], count=4) == []
+    assert waveform_peaks([0] * 10, count=2) == [0, 0]
+    assert len(waveform_peaks(tone(1001), count=64)) == 64
+
+
+@pytest.mark.parametrize("filename, ext, expected", [
+    ("note_1.webm", ".opus", "note_1.opus"),
+    ("note_1.opus", ".opus", "note_1_mono.opus"),
+    ("note_1.wav", ".wav", "note_1_mono.wav"),
+    ("note_1.WAV", ".wav", "note_1_mono.wav"),
+])
+def test_rendition_never_takes_the_original_name(filename, ext, expected):
+    assert rendition_filename(filename, ext) == expected
+
+
+def test_wav_is_downmixed_and_trimmed_into_a_new_file(upload_folder, without_ffmpeg):
+    source = write_wav(upload_folder, "note_1.wav", tone(RATE, silence_samples=RATE // 2))
+    original = open(source, "rb").read()
+
+    rendition = normalize_voice_note(str(upload_folder), "note_1.wav")
+    assert rendition["filename"] == "note_1_mono.wav"
+    assert rendition["duration"] == pytest.approx(1.0, abs=0.02)
+    assert max(rendition["peaks"]) == 100
+    assert open(source, "rb").read() == original
+    with wave.open(resolve_path(str(upload_folder), "note_1_mono.wav"), "rb") as wav:
+        assert wav.getnchannels() == 1
+        assert wav.getnframes() == pytest.approx(RATE, abs=160)
+
+
+def test_other_containers_are_kept_without_ffmpeg(upload_folder, without_ffmpeg):
+    (upload_folder / "note_1.webm").write_bytes(b"\x1a\x45\xdf\xa3")
+    assert normalize_voice_note(str(upload_folder), "note_1.webm") is None
+
+
+def test_opus_rendition_is_written_next_to_the_original(upload_folder, fake_ffmpeg):
+    source = resolve_path(str(upload_folder), "note_1.opus")
+    os.makedirs(os.path.dirname(source), exist_ok=True)
+    with open(source, "wb") as f:
+        f.write(b"OggS original")
+
+    rendition = normalize_voice_note(str(upload_folder), "note_1.opus")
+    assert rendition["filename"] == "note_1_mono.opus"
+    assert rendition["duration"] == 0.5
+    assert open(source, "rb").read() == b"OggS original"
+    assert open(resolve_path(str(upload_folder), "note_1_mono.opus"), "rb").read().startswith(b"OggS")
+    transcode, decode = fake_ffmpeg
+    assert transcode[transcode.index("-i") + 1] == source
+    assert decode[decode.index("-i") + 1] == resolve_path(str(upload_folder), "note_1_mono.opus")
+
+
+@pytest.fixture
+def add_image(mongo):
+    def add(audio_filename, **fields):
+        mongo.images.insert_one({
+            "_id": ObjectId(), "user_id": str(ObjectId()), "filename": f"{ObjectId()}.png", "title": "Bee",
+            "description": "On a flower", "created_at": datetime.datetime.now(), "audio_filename": audio_filename,
+            **fields,
+        })
+    return add
+
+
+def test_images_switch_to_the_rendition_and_the_original_is_deleted(upload_folder, mongo, add_image,
+                                                                      without_ffmpeg):
+    source = write_wav(upload_folder, "note_1.wav", tone(RATE))
+    add_image("note_1.wav")
+    add_image("note_1.wav")
+
+    process_voice_note(str(upload_folder), "note_1.wav")
+    images = list(mongo.images.find())
+    assert {image["audio_filename"] for image in images} == {"note_1_mono.wav"}
+    assert all(image["audio_duration"] == 1.0 for image in images)
+    assert not os.path.exists(source)
+    assert os.path.exists(resolve_path(str(upload_folder), "note_1_mono.wav"))
+
+
+def test_rendition_is_dropped_when_the_images_are_gone(upload_folder, mongo, add_image, without_ffmpeg, monkeypatch):
+    source = write_wav(upload_folder, "note_1.wav", tone(RATE))
+    add_image("note_1.wav")
+    # The images are deleted while the audio is being normalized
+    monkeypatch.setattr("utils.upload_jobs.set_voice_note_rendition", lambda *args: 0)
+
+    process_voice_note(str(upload_folder), "note_1.wav")
+    assert os.path.exists(source)
+    assert not os.path.exists(resolve_path(str(upload_folder), "note_1_mono.wav"))
+
+
+@pytest.mark.parametrize("rendition", ["note_1.opus", "note_1_mono.wav"])
+def test_retry_after_the_switch_deletes_the_original(upload_folder, mongo, add_image, rendition):
+    source = write_wav(upload_folder, "note_1.wav", tone(RATE))
+    add_image(rendition, audio_duration=1.0)
+
+    process_voice_note(str(upload_folder), "note_1.wav")
+    assert not os.path.exists(source)
+    assert mongo.images.find_one()["audio_filename"] == rendition
+
+
+def test_voice_note_without_images_is_retried_later(upload_folder, mongo):
+    write_wav(upload_folder, "note_1.wav", tone(RATE))
+    with pytest.raises(RuntimeError, match="No image references"):
+        process_voice_note(str(upload_folder), "note_1.wav")
+
+
+def test_processed_voice_note_is_left_alone(upload_folder, mongo, add_image, without_ffmpeg):
+    source = write_wav(upload_folder, "note_1.wav", tone(RATE))
+    add_image("note_1.wav", audio_duration=1.0)
+    process_voice_note(str(upload_folder), "note_1.wav")
+    assert os.path.exists(source)
+    assert not os.path.exists(resolve_path(str(upload_folder), "note_1_mono.wav"))
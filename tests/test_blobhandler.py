@@ -0,0 +1,22 @@
+from database.blobhandler import acquire_blob, get_blob, release_blob
+
+
+def test_last_release_removes_the_record(mongo):
+    assert acquire_blob("ab.png", "ab", 10, "image/png") == 1
+    assert acquire_blob("ab.png", "ab", 10, "image/png", count=2) == 3
+
+    assert release_blob("ab.png", 2) is False
+    assert get_blob("ab.png")["refcount"] == 1
+    assert release_blob("ab.png") is True
+    assert get_blob("ab.png") is None
+
+
+def test_untracked_files_are_released_to_their_single_owner(mongo):
+    assert release_blob("legacy.png") is True
+
+
+def test_first_acquire_keeps_the_metadata(mongo):
+    acquire_blob("ab.png", "ab", 10, "image/png")
+    acquire_blob("ab.png", "ab", None, None)
+    blob = get_blob("ab.png")
+    assert (blob["size"], blob["mime_type"], blob["refcount"]) == (10, "image/png", 2)
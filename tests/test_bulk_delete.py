@@ -0,0 +1,131 @@
+import datetime
+import os
+
+import pytest
+from bson import ObjectId
+
+from database.blobhandler import acquire_blob
+from utils.upload_jobs import purge_deleted_images
+from utils.upload_paths import resolve_path
+
+OWNER = str(ObjectId())
+OTHER = str(ObjectId())
+
+
+@pytest.fixture
+def undo_window(app, monkeypatch):
+    monkeypatch.setitem(app.config, "BACKGROUND_JOBS", True)
+    monkeypatch.setitem(app.config, "DELETE_UNDO_SECONDS", 60)
+
+
+@pytest.fixture
+def add_image(mongo, upload_folder):
+    def add(user_id, filename=None, audio_filename=None):
+        filename = filename or f"{ObjectId()}.png"
+        path = resolve_path(str(upload_folder), filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+        acquire_blob(filename, None, 8, "image/png")
+        image_id = ObjectId()
+        mongo.images.insert_one({
+            "_id": image_id, "user_id": user_id, "filename": filename, "title": "Bee",
+            "description": "On a flower", "created_at": datetime.datetime.now(), "audio_filename": audio_filename,
+        })
+        return image_id
+    return add
+
+
+def post_ids(client, url, headers, *image_ids):
+    return client.post(url, json={"ids": [str(image_id) for image_id in image_ids]}, headers=headers)
+
+
+def test_only_owned_images_are_deleted(client, auth_headers, add_image, mongo, undo_window):
+    own, others, missing = add_image(OWNER), add_image(OTHER), ObjectId()
+
+    response = post_ids(client, "/api/user/images/delete", auth_headers(OWNER), own, others, missing)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["deleted"] == [str(own)]
+    assert body["forbidden"] == [str(others)]
+    assert body["not_found"] == [str(missing)]
+    assert body["undo_until"] is not None
+    assert mongo.images.find_one({"_id": own}) is None
+    assert mongo.images.find_one({"_id": others}) is not None
+
+
+def test_admins_cannot_bulk_delete_other_users_images(client, auth_headers, add_image, mongo, undo_window):
+    image_id = add_image(OWNER)
+    response = post_ids(client, "/api/user/images/delete", auth_headers(OTHER, "admin"), image_id)
+    assert response.get_json()["forbidden"] == [str(image_id)]
+    assert mongo.images.find_one({"_id": image_id}) is not None
+
+
+def test_deleted_images_can_be_restored_within_the_undo_window(client, auth_headers, add_image, mongo, upload_folder,
+                                                               undo_window):
+    image_id = add_image(OWNER)
+    headers = auth_headers(OWNER)
+    post_ids(client, "/api/user/images/delete", headers, image_id)
+    assert mongo.jobs.find_one({"type": "purge_deleted_images"}) is not None
+
+    response = post_ids(client, "/api/user/images/restore", auth_headers(OTHER), image_id)
+    assert response.get_json() == {"restored": [], "not_restored": [str(image_id)]}
+
+    response = post_ids(client, "/api/user/images/restore", headers, image_id)
+    assert response.get_json() == {"restored": [str(image_id)], "not_restored": []}
+    assert mongo.images.find_one({"_id": image_id})["user_id"] == OWNER
+    assert mongo.deleted_images.count_documents({}) == 0
+
+
+def test_purge_releases_files_once_the_window_has_passed(client, auth_headers, add_image, mongo, upload_folder,
+                                                         undo_window):
+    shared = f"{ObjectId()}.png"
+    first, second = add_image(OWNER, shared), add_image(OWNER, shared)
+    headers = auth_headers(OWNER)
+    post_ids(client, "/api/user/images/delete", headers, first)
+    job = mongo.jobs.find_one({"type": "purge_deleted_images"})
+    image_ids = [ObjectId(image_id) for image_id in job["payload"]["image_ids"]]
+
+    # Still inside the undo window: nothing is purged
+    assert purge_deleted_images(str(upload_folder), image_ids, job["payload"]["token"]) == 0
+    assert mongo.deleted_images.count_documents({}) == 1
+
+    mongo.deleted_images.update_many({}, {"$set": {
+        "purge_at": datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1),
+    }})
+    assert purge_deleted_images(str(upload_folder), image_ids, job["payload"]["token"]) == 1
+    assert mongo.deleted_images.count_documents({}) == 0
+    # The second image still uses the file
+    assert mongo.blobs.find_one({"_id": shared})["refcount"] == 1
+    assert os.path.exists(resolve_path(str(upload_folder), shared))
+
+    response = post_ids(client, "/api/user/images/restore", headers, first)
+    assert response.get_json()["not_restored"] == [str(first)]
+
+    post_ids(client, "/api/user/images/delete", headers, second)
+    mongo.deleted_images.update_many({}, {"$set": {
+        "purge_at": datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=1),
+    }})
+    assert purge_deleted_images(str(upload_folder), [second], "retry-token") == 1
+    assert mongo.blobs.find_one({"_id": shared}) is None
+    assert not any(upload_folder.rglob(shared))
+
+
+def test_deleting_an_image_keeps_the_voice_note_of_a_trashed_sibling(client, auth_headers, add_image, mongo,
+                                                                    upload_folder, undo_window):
+    audio_path = resolve_path(str(upload_folder), "voice_1.ogg")
+    os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+    with open(audio_path, "wb") as f:
+        f.write(b"OggS")
+    first, second = add_image(OWNER, audio_filename="voice_1.ogg"), add_image(OWNER, audio_filename="voice_1.ogg")
+    headers = auth_headers(OWNER)
+
+    post_ids(client, "/api/user/images/delete", headers, second)
+    assert client.delete(f"/delete/{first}", headers=headers).status_code == 200
+    # The trashed sibling can still be restored, so its voice note stays
+    assert os.path.exists(audio_path)
+
+    response = post_ids(client, "/api/user/images/restore", headers, second)
+    assert response.get_json()["restored"] == [str(second)]
+    assert mongo.images.find_one({"_id": second})["audio_filename"] == "voice_1.ogg"
+    assert os.path.exists(audio_path)
@@ -0,0 +1,109 @@
+import io
+import os
+import threading
+
+import pytest
+from bson import ObjectId
+from PIL import Image
+
+import app as app_module
+from utils import derivatives
+from utils.derivatives import (
+    DERIVATIVE_SIZES, derivative_formats, derivative_path, generate_derivatives, remove_derivatives,
+    render_resized,
+)
+from utils.upload_paths import resolve_path
+
+FILENAME = f"{'ab' * 32}.jpg"
+
+
+def save_image(upload_folder, size, fmt="JPEG", filename=FILENAME):
+    path = resolve_path(str(upload_folder), filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.new("RGB", size, (200, 120, 40)).save(path, fmt)
+    return path
+
+
+def derivative_files(upload_folder):
+    return sorted(
+        name for _, _, names in os.walk(os.path.join(upload_folder, derivatives.DERIVATIVES_DIRNAME))
+        for name in names
+    )
+
+
+def test_every_size_and_format_is_written(upload_folder):
+    save_image(upload_folder, (2000, 1000))
+    result = generate_derivatives(str(upload_folder), FILENAME)
+
+    assert sorted(result) == sorted(str(size) for size in DERIVATIVE_SIZES)
+    for size in DERIVATIVE_SIZES:
+        assert sorted(result[str(size)]) == sorted(derivative_formats())
+        for fmt in derivative_formats():
+            with Image.open(derivative_path(str(upload_folder), FILENAME, size, fmt)) as image:
+                assert image.size == (size, size // 2)
+    assert not any(name.endswith(".part") for name in derivative_files(upload_folder))
+
+
+def test_large_jpegs_are_decoded_in_draft_mode(upload_folder):
+    path = save_image(upload_folder, (4096, 3072))
+    with derivatives._open_bounded(path, 1024) as image:
+        # The largest DCT scale that keeps both edges at or above 1024 px
+        assert image.size == (2048, 1536)
+
+    png = save_image(upload_folder, (4096, 3072), "PNG", f"{'cd' * 32}.png")
+    with derivatives._open_bounded(png, 1024) as image:
+        assert image.size == (4096, 3072)
+
+
+def test_images_above_the_pixel_limit_are_refused(upload_folder, monkeypatch):
+    path = save_image(upload_folder, (200, 100))
+    monkeypatch.setattr(derivatives, "MAX_SOURCE_PIXELS", 200 * 100 - 1)
+
+    assert generate_derivatives(str(upload_folder), FILENAME) == {}
+    assert derivative_files(upload_folder) == []
+    with pytest.raises(ValueError, match="pixel limit"):
+        render_resized(path, 64, None, "jpg", str(upload_folder / "out.jpg"))
+
+
+def test_heic_originals_are_decoded(upload_folder):
+    pytest.importorskip("pillow_heif")
+    if "HEIF" not in Image.SAVE:
+        pytest.skip("pillow-heif was built without a HEIF encoder")
+    filename = f"{'ef' * 32}.heic"
+    save_image(upload_folder, (1200, 800), "HEIF", filename)
+
+    result = generate_derivatives(str(upload_folder), filename)
+    with Image.open(derivative_path(str(upload_folder), filename, 256, "jpg")) as image:
+        assert image.size == (256, 171)
+    assert result["256"]["jpg"] == f"{'ef' * 32}_256.jpg"
+
+
+def test_remove_derivatives_deletes_every_rendition(upload_folder):
+    save_image(upload_folder, (600, 400))
+    generate_derivatives(str(upload_folder), FILENAME)
+    assert derivative_files(upload_folder)
+
+    remove_derivatives(str(upload_folder), FILENAME)
+    assert derivative_files(upload_folder) == []
+    assert os.path.exists(resolve_path(str(upload_folder), FILENAME))
+
+
+def test_upload_responds_before_derivatives_are_encoded(client, mongo, upload_folder, auth_headers, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_derivatives(upload_folder, filename):
+        started.set()
+        release.wait(5)
+        return {}
+
+    monkeypatch.setattr(app_module, "generate_derivatives", slow_derivatives)
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48)).save(buffer, format="PNG")
+    try:
+        response = client.post("/api/user/upload", data={
+            "title": "Bee", "description": "On a flower", "files": [(io.BytesIO(buffer.getvalue()), "photo.png")],
+        }, headers=auth_headers(ObjectId()), content_type="multipart/form-data")
+        assert response.status_code == 200
+        assert started.wait(5)
+    finally:
+        release.set()
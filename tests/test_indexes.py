@@ -0,0 +1,127 @@
+import os
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+import manage_indexes
+from config import Config
+from database import indexes
+from database.connection import connection_manager
+from database.indexes import INDEXES, QUERY_SHAPES, ensure_indexes, explain_shape, verify_query_plans
+
+TEST_URI = os.environ.get("MONGODB_TEST_URI")
+
+
+def test_every_declared_index_is_built(mongo):
+    assert ensure_indexes() == 0
+    for collection_name, specs in INDEXES.items():
+        existing = mongo[collection_name].index_information()
+        for spec in specs:
+            assert spec.name in existing, f"{collection_name}.{spec.name}"
+    # Expired OTPs are deleted by MongoDB itself
+    assert mongo.email_otps.index_information()["expires_at_ttl"]["expireAfterSeconds"] == 0
+
+
+def test_existing_indexes_are_left_alone(mongo, monkeypatch):
+    ensure_indexes()
+    created = []
+    monkeypatch.setattr(type(mongo.images), "create_index", lambda self, *args, **kwargs: created.append(args))
+    assert ensure_indexes() == 0
+    assert created == []
+
+
+def test_build_can_be_limited_to_collections(mongo):
+    assert ensure_indexes(["users"]) == 0
+    assert "email" in mongo.users.index_information()
+    assert "filename" not in mongo.images.index_information()
+
+
+def test_failed_builds_are_counted_and_do_not_stop_the_rest(mongo, monkeypatch):
+    real_create_index = type(mongo.users).create_index
+
+    def create_index(self, keys, name=None, **options):
+        if name == "email":
+            raise OperationFailure("duplicate key")
+        return real_create_index(self, keys, name=name, **options)
+
+    monkeypatch.setattr(type(mongo.users), "create_index", create_index)
+    assert ensure_indexes(["users"]) == 1
+    assert "username" in mongo.users.index_information()
+    assert manage_indexes.build(["users"]) == 1
+
+
+class StubCursor:
+    def __init__(self, collection, filter):
+        self.collection = collection
+        self.filter = filter
+        self.sort_keys = None
+
+    def sort(self, keys):
+        self.sort_keys = keys
+        return self
+
+    def explain(self):
+        self.collection.explained.append((self.collection.name, self.filter, self.sort_keys))
+        stage = "COLLSCAN" if self.collection.name in self.collection.scanned else "IXSCAN"
+        return {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": stage}}}}
+
+
+class StubCollection:
+    """explain() of a collection scan for the collections in `scanned`, an index scan otherwise."""
+
+    def __init__(self, name, scanned, explained):
+        self.name = name
+        self.scanned = scanned
+        self.explained = explained
+
+    def find(self, filter):
+        return StubCursor(self, filter)
+
+
+@pytest.fixture
+def plans(monkeypatch):
+    scanned = set()
+    explained = []
+    monkeypatch.setattr(indexes, "_collection", lambda name: StubCollection(name, scanned, explained))
+    return scanned, explained
+
+
+def test_every_query_shape_is_explained(plans):
+    _, explained = plans
+    assert verify_query_plans() == []
+    assert explained == [(s.collection, s.filter, s.sort) for s in QUERY_SHAPES]
+    assert manage_indexes.verify() == 0
+
+
+def test_collection_scans_fail_verification(plans):
+    scanned, _ = plans
+    scanned.add("messages")
+    problems = verify_query_plans()
+    assert [query_shape.name for query_shape, _ in problems] == ["conversation with admin"]
+    assert problems[0][1] == ["FETCH", "COLLSCAN"]
+    assert manage_indexes.verify() == 1
+
+
+def test_expected_collection_scans_pass_verification(plans):
+    scanned, _ = plans
+    scanned.add("users")
+    allowed = {s.name for s in QUERY_SHAPES if s.collection == "users" and s.collscan_ok}
+    assert allowed
+    assert allowed.isdisjoint(query_shape.name for query_shape, _ in verify_query_plans())
+
+
+@pytest.mark.skipif(not TEST_URI, reason="set MONGODB_TEST_URI to explain the query shapes on a real MongoDB")
+def test_every_query_shape_uses_an_index_on_mongodb(monkeypatch):
+    client = MongoClient(TEST_URI, serverSelectionTimeoutMS=10000)
+    monkeypatch.setattr(Config, "DATABASE_NAME", "beehive_index_test")
+    monkeypatch.setattr(connection_manager, "_client", client)
+    monkeypatch.setattr(connection_manager, "_pid", os.getpid())
+    try:
+        assert ensure_indexes() == 0
+        for query_shape in QUERY_SHAPES:
+            assert explain_shape(query_shape), query_shape.name
+        assert verify_query_plans() == []
+    finally:
+        client.drop_database("beehive_index_test")
+        client.close()
@@ -0,0 +1,159 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import worker
+from database import jobqueue
+from database.jobqueue import (
+    BACKOFF_MAX_SECONDS, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED,
+    build_job, claim_next_job, enqueue_jobs, fail_job, get_job,
+)
+from utils.upload_jobs import PDF_THUMBNAIL_JOB, VOICE_NOTE_JOB
+
+
+def as_utc(value):
+    # mongomock hands datetimes back naive, like pymongo without tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def enqueue(mongo, **fields):
+    job = build_job(PDF_THUMBNAIL_JOB, {"filename": "a.png"})
+    job.update(fields)
+    enqueue_jobs([job])
+    return job["_id"]
+
+
+def test_claim_takes_the_oldest_due_job_and_sets_a_lease(mongo):
+    now = datetime.now(timezone.utc)
+    later = enqueue(mongo, run_at=now + timedelta(minutes=1))
+    first = enqueue(mongo, run_at=now - timedelta(minutes=2))
+    second = enqueue(mongo, run_at=now - timedelta(minutes=1))
+
+    job = claim_next_job("w1", visibility_timeout=timedelta(seconds=30))
+    assert job["_id"] == first
+    assert job["status"] == JOB_RUNNING
+    assert job["attempts"] == 1
+    assert job["worker_id"] == "w1"
+    assert as_utc(job["lease_expires_at"]) > now
+
+    assert claim_next_job("w2")["_id"] == second
+    assert claim_next_job("w3") is None
+    assert get_job(later)["status"] == JOB_QUEUED
+
+
+def test_claim_only_returns_requested_job_types(mongo):
+    enqueue(mongo, type=VOICE_NOTE_JOB)
+    assert claim_next_job("w1", job_types=[PDF_THUMBNAIL_JOB]) is None
+    assert claim_next_job("w1", job_types=[VOICE_NOTE_JOB])["type"] == VOICE_NOTE_JOB
+
+
+def test_running_job_is_reclaimed_once_its_lease_expires(mongo):
+    job_id = enqueue(mongo)
+    claim_next_job("w1", visibility_timeout=timedelta(minutes=5))
+    assert claim_next_job("w2") is None
+
+    mongo.jobs.update_one({"_id": job_id}, {"$set": {
+        "lease_expires_at": datetime.now(timezone.utc) - timedelta(seconds=1),
+    }})
+    job = claim_next_job("w2")
+    assert job["_id"] == job_id
+    assert job["worker_id"] == "w2"
+    assert job["attempts"] == 2
+
+
+def test_failed_attempt_is_requeued_with_exponential_backoff(mongo):
+    job_id = enqueue(mongo)
+    delays = []
+    for attempt in range(1, 4):
+        mongo.jobs.update_one({"_id": job_id}, {"$set": {"run_at": datetime.now(timezone.utc)}})
+        job = claim_next_job("w1")
+        assert job["attempts"] == attempt
+        before = datetime.now(timezone.utc)
+        assert fail_job(job, "w1", "boom")
+        stored = get_job(job_id)
+        assert stored["status"] == JOB_QUEUED
+        assert stored["last_error"] == "boom"
+        delays.append((as_utc(stored["run_at"]) - before).total_seconds())
+
+    assert delays[0] == pytest.approx(5, abs=1)
+    assert delays[1] == pytest.approx(10, abs=1)
+    assert delays[2] == pytest.approx(20, abs=1)
+
+
+def test_backoff_is_capped(mongo):
+    assert jobqueue._backoff_delay(30) == timedelta(seconds=BACKOFF_MAX_SECONDS)
+
+
+def test_last_attempt_is_dead_lettered(mongo):
+    job_id = enqueue(mongo, max_attempts=2, attempts=1)
+    job = claim_next_job("w1")
+    assert job["attempts"] == 2
+    assert fail_job(job, "w1", "still broken")
+
+    stored = get_job(job_id)
+    assert stored["status"] == JOB_FAILED
+    assert stored["last_error"] == "still broken"
+    assert stored["finished_at"] is not None
+    assert claim_next_job("w1") is None
+
+
+def test_fail_is_ignored_after_the_lease_moved_to_another_worker(mongo):
+    job_id = enqueue(mongo)
+    job = claim_next_job("w1")
+    mongo.jobs.update_one({"_id": job_id}, {"$set": {"worker_id": "w2"}})
+    assert not fail_job(job, "w1", "late")
+    assert get_job(job_id)["status"] == JOB_RUNNING
+
+
+@pytest.fixture
+def run_once(monkeypatch):
+    """Run the worker loop until it has handled a single claimed job."""
+    stop = threading.Event()
+
+    def claim(*args):
+        job = claim_next_job(*args)
+        stop.set()
+        return job
+
+    monkeypatch.setattr(worker, "claim_next_job", claim)
+    return lambda: worker.run_worker("w1", stop, 0, timedelta(minutes=5))
+
+
+def test_worker_runs_the_handler_and_completes_the_job(mongo, monkeypatch, run_once):
+    seen = []
+    monkeypatch.setitem(worker.JOB_HANDLERS, PDF_THUMBNAIL_JOB, seen.append)
+    job_id = enqueue(mongo)
+
+    run_once()
+    assert seen == [{"filename": "a.png"}]
+    assert get_job(job_id)["status"] == JOB_SUCCEEDED
+
+
+def test_worker_requeues_a_failing_handler(mongo, monkeypatch, run_once):
+    def broken(payload):
+        raise RuntimeError("decoder crashed")
+
+    monkeypatch.setitem(worker.JOB_HANDLERS, PDF_THUMBNAIL_JOB, broken)
+    job_id = enqueue(mongo)
+
+    run_once()
+    stored = get_job(job_id)
+    assert stored["status"] == JOB_QUEUED
+    assert stored["last_error"] == "decoder crashed"
+
+
+def test_worker_fails_a_job_whose_lease_expired_after_the_final_attempt(mongo, monkeypatch, run_once):
+    seen = []
+    monkeypatch.setitem(worker.JOB_HANDLERS, PDF_THUMBNAIL_JOB, seen.append)
+    job_id = enqueue(
+        mongo, status=JOB_RUNNING, attempts=3, max_attempts=3, last_error="killed",
+        lease_expires_at=datetime.now(timezone.utc) - timedelta(seconds=1),
+    )
+
+    run_once()
+    assert seen == []
+    stored = get_job(job_id)
+    assert stored["status"] == JOB_FAILED
+    assert stored["attempts"] == 4
+    assert stored["last_error"] == "killed"
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+
+from utils.media_cache import ResizeCache
+
+
+def writer(data):
+    def render(temp_path):
+        with open(temp_path, "wb") as f:
+            f.write(data)
+    return render
+
+
+def test_miss_renders_and_hit_reuses(tmp_path):
+    cache = ResizeCache(tmp_path / "cache", max_bytes=1000)
+    renders = []
+
+    def render(temp_path):
+        renders.append(temp_path)
+        writer(b"x" * 10)(temp_path)
+
+    path = cache.get_or_create("a", render)
+    assert cache.get_or_create("a", render) == path
+    assert len(renders) == 1
+    assert open(path, "rb").read() == b"x" * 10
+    assert os.listdir(tmp_path / "cache") == ["a"]
+
+
+def test_least_recently_used_entries_are_evicted_over_the_cap(tmp_path):
+    cache = ResizeCache(tmp_path / "cache", max_bytes=25)
+    cache.get_or_create("a", writer(b"a" * 10))
+    cache.get_or_create("b", writer(b"b" * 10))
+    assert cache.get("a")  # b is now the least recently used
+    cache.get_or_create("c", writer(b"c" * 10))
+
+    assert cache.stats() == {"entries": 2, "bytes": 20, "max_bytes": 25}
+    assert cache.get("b") is None
+    assert sorted(os.listdir(tmp_path / "cache")) == ["a", "c"]
+
+
+def test_an_entry_larger_than_the_cap_is_still_served(tmp_path):
+    cache = ResizeCache(tmp_path / "cache", max_bytes=5)
+    cache.get_or_create("a", writer(b"a" * 4))
+    path = cache.get_or_create("big", writer(b"b" * 50))
+    assert os.path.exists(path)
+    assert cache.stats()["entries"] == 1
+
+
+def test_lru_order_is_restored_from_access_times(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    for age, name in enumerate(["new", "old"]):
+        (directory / name).write_bytes(b"x" * 10)
+        os.utime(directory / name, (1000 - age * 100, 1000 - age * 100))
+
+    cache = ResizeCache(directory, max_bytes=25)
+    assert cache.get("new")
+    cache.get_or_create("fresh", writer(b"y" * 10))
+    assert sorted(os.listdir(directory)) == ["fresh", "new"]
+
+
+def test_failed_render_leaves_no_entry(tmp_path):
+    cache = ResizeCache(tmp_path / "cache", max_bytes=100)
+
+    def broken(temp_path):
+        writer(b"partial")(temp_path)
+        raise OSError("cannot decode")
+
+    try:
+        cache.get_or_create("a", broken)
+    except OSError:
+        pass
+    assert os.listdir(tmp_path / "cache") == []
+    assert cache.stats()["entries"] == 0
+    assert not cache._key_locks
+
+
+def test_concurrent_misses_render_once(tmp_path):
+    cache = ResizeCache(tmp_path / "cache", max_bytes=1000)
+    renders = []
+    first_started = threading.Event()
+
+    def render(temp_path):
+        renders.append(temp_path)
+        first_started.set()
+        # Hold the key lock while the other threads queue up behind it
+        time.sleep(0.1)
+        writer(b"x" * 10)(temp_path)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create("a", render))) for _ in range(8)]
+    threads[0].start()
+    first_started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(renders) == 1
+    assert len(set(results)) == 1 and len(results) == 8
+    assert not cache._key_locks
+
+
+def test_key_lock_is_kept_while_threads_wait_for_it(tmp_path):
+    cache = ResizeCache(tmp_path / "cache", max_bytes=1000)
+    rendering, release = threading.Event(), threading.Event()
+
+    def slow(temp_path):
+        rendering.set()
+        release.wait(5)
+        writer(b"x")(temp_path)
+
+    first = threading.Thread(target=cache.get_or_create, args=("a", slow))
+    first.start()
+    rendering.wait(5)
+    second = threading.Thread(target=cache.get_or_create, args=("a", writer(b"y")))
+    second.start()
+    # Both misses share one lock entry, which outlives the first thread while the second waits
+    while cache._key_locks["a"][1] < 2:
+        time.sleep(0.01)
+
+    release.set()
+    first.join(5)
+    second.join(5)
+    assert not cache._key_locks
+    assert open(cache.get("a"), "rb").read() == b"x"
@@ -0,0 +1,174 @@
+import datetime
+import io
+import os
+
+import pytest
+from bson import ObjectId
+from PIL import Image
+
+import app as app_module
+from utils.media_cache import ResizeCache
+from utils.media_delivery import OFFLOAD_X_ACCEL, OFFLOAD_X_SENDFILE
+from utils.media_signing import sign_media_path
+from utils.upload_paths import resolve_path, shard_dirs
+
+OWNER = str(ObjectId())
+AUDIO = "voice_1.ogg"
+AUDIO_BYTES = b"OggS" + bytes(range(256)) * 4
+
+
+def store(upload_folder, filename, data, flat=False):
+    path = os.path.join(upload_folder, filename) if flat else resolve_path(str(upload_folder), filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def get_audio(client, filename=AUDIO, headers=None):
+    return client.get(sign_media_path(f"/api/audio/{filename}", OWNER), headers=headers or {})
+
+
+@pytest.fixture
+def offload(app, monkeypatch):
+    def use(mode):
+        monkeypatch.setitem(app.config, "MEDIA_OFFLOAD", mode)
+        monkeypatch.setitem(app.config, "USE_X_SENDFILE", mode == OFFLOAD_X_SENDFILE)
+    return use
+
+
+def test_x_accel_redirect_names_the_sharded_file(client, upload_folder, offload):
+    offload(OFFLOAD_X_ACCEL)
+    store(upload_folder, AUDIO, AUDIO_BYTES)
+
+    response = get_audio(client)
+    assert response.status_code == 200
+    first, second = shard_dirs(AUDIO)
+    assert response.headers["X-Accel-Redirect"] == f"/_protected/uploads/{first}/{second}/{AUDIO}"
+    assert response.data == b""
+    assert response.mimetype == "audio/ogg"
+    assert "Accept-Ranges" not in response.headers
+
+
+def test_x_accel_redirect_maps_unmigrated_flat_files(client, upload_folder, offload):
+    offload(OFFLOAD_X_ACCEL)
+    store(upload_folder, AUDIO, AUDIO_BYTES, flat=True)
+    assert get_audio(client).headers["X-Accel-Redirect"] == f"/_protected/uploads/{AUDIO}"
+
+
+def test_x_accel_redirect_quotes_the_path(client, upload_folder, offload):
+    offload(OFFLOAD_X_ACCEL)
+    store(upload_folder, "voice note 1.ogg", AUDIO_BYTES)
+    assert get_audio(client, "voice note 1.ogg").headers["X-Accel-Redirect"].endswith("/voice%20note%201.ogg")
+
+
+def test_x_sendfile_sends_the_absolute_path(client, upload_folder, offload):
+    offload(OFFLOAD_X_SENDFILE)
+    path = store(upload_folder, AUDIO, AUDIO_BYTES)
+
+    response = get_audio(client)
+    assert response.status_code == 200
+    assert response.headers["X-Sendfile"] == os.path.abspath(path)
+    assert response.data == b""
+
+
+def test_without_offload_flask_sends_the_bytes(client, upload_folder, offload):
+    offload("off")
+    store(upload_folder, AUDIO, AUDIO_BYTES)
+    response = get_audio(client)
+    assert response.data == AUDIO_BYTES
+    assert "X-Accel-Redirect" not in response.headers and "X-Sendfile" not in response.headers
+
+
+def test_resized_media_is_offloaded_to_the_cache_location(client, mongo, upload_folder, auth_headers, offload,
+                                                          tmp_path, monkeypatch):
+    offload(OFFLOAD_X_ACCEL)
+    monkeypatch.setattr(app_module, "MEDIA_RESIZE_CACHE", ResizeCache(tmp_path / "media-cache", 10 ** 6))
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48)).save(buffer, format="PNG")
+    store(upload_folder, "photo.png", buffer.getvalue())
+    image_id = ObjectId()
+    mongo.images.insert_one({
+        "_id": image_id, "user_id": OWNER, "filename": "photo.png", "title": "Bee",
+        "description": "On a flower", "created_at": datetime.datetime.now(),
+    })
+
+    response = client.get(f"/api/media/{image_id}?w=16&fmt=jpg", headers=auth_headers(OWNER))
+    assert response.status_code == 200
+    name = os.listdir(tmp_path / "media-cache")[0]
+    assert response.headers["X-Accel-Redirect"] == f"/_protected/media-cache/{name}"
+    assert response.mimetype == "image/jpeg"
+
+
+def test_media_is_private_immutable_and_advertises_ranges(app, client, upload_folder):
+    store(upload_folder, AUDIO, AUDIO_BYTES)
+    response = get_audio(client)
+    assert response.status_code == 200
+    cache_control = response.headers["Cache-Control"]
+    assert "private" in cache_control and "immutable" in cache_control and "public" not in cache_control
+    assert f"max-age={app.config['MEDIA_MAX_AGE_SECONDS']}" in cache_control
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["ETag"]
+
+
+def test_range_request_gets_a_partial_response(client, upload_folder):
+    store(upload_folder, AUDIO, AUDIO_BYTES)
+    response = get_audio(client, headers={"Range": "bytes=4-19"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 4-19/{len(AUDIO_BYTES)}"
+    assert response.data == AUDIO_BYTES[4:20]
+    assert "immutable" in response.headers["Cache-Control"]
+
+
+def test_matching_etag_gets_not_modified(client, upload_folder):
+    store(upload_folder, AUDIO, AUDIO_BYTES)
+    etag = get_audio(client).headers["ETag"]
+    response = get_audio(client, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert get_audio(client, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_content_addressed_files_use_their_hash_as_etag(client, upload_folder):
+    filename = f"{'ab' * 32}.ogg"
+    store(upload_folder, filename, AUDIO_BYTES)
+    assert get_audio(client, filename).headers["ETag"] == f'"{"ab" * 32}"'
+
+
+def test_static_uploads_are_public(client, upload_folder, monkeypatch):
+    # The fixture's folder is named "uploads", so its parent stands in for static/
+    monkeypatch.setattr(app_module.app, "static_folder", str(upload_folder.parent))
+    store(upload_folder, "photo.png", b"\x89PNG\r\n\x1a\n")
+    relpath = os.path.relpath(resolve_path(str(upload_folder), "photo.png"), upload_folder.parent)
+
+    response = client.get(f"/static/{relpath}")
+    assert response.status_code == 200
+    assert "public" in response.headers["Cache-Control"] and "immutable" in response.headers["Cache-Control"]
+
+
+@pytest.mark.parametrize("mode", ["off", OFFLOAD_X_ACCEL])
+def test_missing_file_is_not_found(client, upload_folder, offload, mode):
+    offload(mode)
+    response = get_audio(client)
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Audio file not found"}
+
+
+def test_evicted_resize_is_not_found(client, mongo, upload_folder, auth_headers, tmp_path, monkeypatch):
+    class EvictingCache(ResizeCache):
+        def get_or_create(self, name, render):
+            path = super().get_or_create(name, render)
+            os.remove(path)
+            return path
+
+    monkeypatch.setattr(app_module, "MEDIA_RESIZE_CACHE", EvictingCache(tmp_path / "media-cache", 10 ** 6))
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48)).save(buffer, format="PNG")
+    store(upload_folder, "photo.png", buffer.getvalue())
+    image_id = ObjectId()
+    mongo.images.insert_one({
+        "_id": image_id, "user_id": OWNER, "filename": "photo.png", "title": "Bee",
+        "description": "On a flower", "created_at": datetime.datetime.now(),
+    })
+    response = client.get(f"/api/media/{image_id}?w=16", headers=auth_headers(OWNER))
+    assert response.status_code == 404
@@ -0,0 +1,97 @@
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+from config import Config
+from utils import media_signing
+from utils.media_signing import DERIVED_KEY_ID, sign_media_path, verify_media_signature
+
+PATH = "/api/audio/voice_0001.ogg"
+OWNER = "64b7f0c2a1e4d5f6a7b8c9d0"
+
+
+def signed_args(path=PATH, owner=OWNER, ttl=None):
+    url = urlsplit(sign_media_path(path, owner, ttl))
+    assert url.path == path
+    return dict(parse_qsl(url.query))
+
+
+@pytest.fixture
+def keys(monkeypatch):
+    def use(*entries):
+        monkeypatch.setattr(Config, "MEDIA_URL_SIGNING_KEYS", list(entries))
+    use("k1:" + "a" * 32)
+    return use
+
+
+def test_signed_url_verifies(keys):
+    args = signed_args()
+    assert args["uid"] == OWNER
+    assert args["kid"] == "k1"
+    assert verify_media_signature(PATH, args)
+
+
+def test_expired_url_is_refused(keys, monkeypatch):
+    args = signed_args(ttl=60)
+    now = media_signing.time.time()
+    monkeypatch.setattr(media_signing.time, "time", lambda: int(args["exp"]) + 1)
+    assert not verify_media_signature(PATH, args)
+    monkeypatch.setattr(media_signing.time, "time", lambda: now)
+    assert verify_media_signature(PATH, args)
+
+
+def test_expiry_cannot_be_extended(keys):
+    args = signed_args()
+    assert not verify_media_signature(PATH, {**args, "exp": str(int(args["exp"]) + 3600)})
+    assert not verify_media_signature(PATH, {**args, "exp": "never"})
+
+
+@pytest.mark.parametrize("field, value", [
+    ("uid", "64b7f0c2a1e4d5f6a7b8c9d1"),
+    ("sig", "0" * 64),
+    ("kid", "k2"),
+])
+def test_tampered_parameters_are_refused(keys, field, value):
+    args = signed_args()
+    assert not verify_media_signature(PATH, {**args, field: value})
+
+
+def test_signature_is_bound_to_the_path(keys):
+    args = signed_args()
+    assert not verify_media_signature("/api/audio/voice_0002.ogg", args)
+
+
+def test_missing_parameters_are_refused(keys):
+    assert not verify_media_signature(PATH, {})
+
+
+def test_previous_key_still_verifies_after_rotation(keys):
+    old_args = signed_args()
+    keys("k2:" + "b" * 32, "k1:" + "a" * 32)
+    assert verify_media_signature(PATH, old_args)
+
+    new_args = signed_args()
+    assert new_args["kid"] == "k2"
+    assert verify_media_signature(PATH, new_args)
+
+    # Once the old key is dropped its URLs stop working
+    keys("k2:" + "b" * 32)
+    assert not verify_media_signature(PATH, old_args)
+    assert verify_media_signature(PATH, new_args)
+
+
+def test_key_derived_from_the_jwt_secret_without_configured_keys(keys, monkeypatch):
+    keys()
+    args = signed_args()
+    assert args["kid"] == DERIVED_KEY_ID
+    assert verify_media_signature(PATH, args)
+
+    monkeypatch.setattr(Config, "JWT_SECRET", "c" * 40)
+    assert not verify_media_signature(PATH, args)
+
+
+def test_urls_are_stable_within_an_expiry_bucket(keys, monkeypatch):
+    monkeypatch.setattr(media_signing.time, "time", lambda: 1_000_000)
+    first = sign_media_path(PATH, OWNER, ttl=3600)
+    monkeypatch.setattr(media_signing.time, "time", lambda: 1_000_100)
+    assert sign_media_path(PATH, OWNER, ttl=3600) == first
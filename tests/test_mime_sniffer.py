@@ -0,0 +1,96 @@
+import io
+import struct
+import wave
+
+import magic
+import pytest
+from PIL import Image
+
+from utils.mime_sniffer import detect_mime, sniff_signature
+from utils.upload_policy import MIME_SNIFF_BYTES
+
+
+@pytest.fixture(scope="module")
+def libmagic():
+    try:
+        return magic.Magic(mime=True)
+    except Exception as e:
+        pytest.skip(f"libmagic unavailable: {e}")
+
+
+def image(fmt):
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (40, 80, 120)).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def ftyp(major, *compatible):
+    body = major + b"\x00\x00\x00\x00" + b"".join(compatible)
+    return struct.pack(">I", 8 + len(body)) + b"ftyp" + body
+
+
+def wav():
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\x00" * 800)
+    return buffer.getvalue()
+
+
+def ogg_page(packet):
+    """A beginning-of-stream Ogg page carrying a single codec header packet."""
+    return (
+        b"OggS\x00\x02" + b"\x00" * 8 + struct.pack("<II", 1, 0) + b"\x00" * 4
+        + bytes([1, len(packet)]) + packet
+    )
+
+
+OPUS_HEAD = b"OpusHead\x01\x01" + struct.pack("<HI", 312, 48000) + b"\x00\x00\x00"
+VORBIS_ID = b"\x01vorbis" + struct.pack("<IBIiii", 0, 1, 44100, 0, 128000, 0) + b"\xb8\x01"
+# EBML header (version 1, DocType "webm") followed by the start of a Segment
+WEBM_HEADER = bytes.fromhex(
+    "1a45dfa39f4286810142f7810142f2810442f381084282847765626d42878104428581021853806701ffffffffffffff"
+)
+
+KNOWN_HEADERS = {
+    "jpeg": (image("JPEG"), "image/jpeg"),
+    "png": (image("PNG"), "image/png"),
+    "gif": (image("GIF"), "image/gif"),
+    "webp": (image("WEBP"), "image/webp"),
+    "pdf": (b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n1 0 obj\n<< /Type /Catalog >>\nendobj\n", "application/pdf"),
+    "avif": (ftyp(b"avif", b"avif", b"mif1", b"miaf"), "image/avif"),
+    "avif-sequence": (ftyp(b"avis", b"avis", b"msf1", b"miaf"), "image/avif"),
+    "heic": (ftyp(b"heic", b"mif1", b"heic"), "image/heic"),
+    "heif": (ftyp(b"mif1", b"mif1", b"heic"), "image/heif"),
+    "wav": (wav(), "audio/x-wav"),
+    "ogg-opus": (ogg_page(OPUS_HEAD), "audio/ogg"),
+    "ogg-vorbis": (ogg_page(VORBIS_ID), "audio/ogg"),
+    "webm": (WEBM_HEADER, "video/webm"),
+}
+
+UNKNOWN_HEADERS = {
+    "text": b"hello world\n",
+    "zip": b"PK\x03\x04" + b"\x00" * 40,
+    "mp4": ftyp(b"isom", b"isom"),
+    "avi": b"RIFF\x00\x00\x00\x00AVI LIST",
+    "ogg-theora": ogg_page(b"\x80theora\x03\x02\x00"),
+    "matroska": WEBM_HEADER.replace(b"\x42\x82\x84webm", b"\x42\x82\x84mkvx"),
+    "empty": b"",
+}
+
+
+@pytest.mark.parametrize("name", KNOWN_HEADERS)
+def test_signature_matches_libmagic(libmagic, name):
+    data, expected = KNOWN_HEADERS[name]
+    header = data[:MIME_SNIFF_BYTES]
+    assert sniff_signature(header) == expected
+    assert libmagic.from_buffer(header) == expected
+
+
+@pytest.mark.parametrize("name", UNKNOWN_HEADERS)
+def test_unknown_headers_are_left_to_libmagic(libmagic, name):
+    header = UNKNOWN_HEADERS[name]
+    assert sniff_signature(header) is None
+    assert detect_mime(header) == libmagic.from_buffer(header)
@@ -0,0 +1,134 @@
+import datetime
+
+import pytest
+from bson import ObjectId
+
+import app as app_module
+from utils import ownership_cache
+from utils.ownership_cache import OwnershipCache
+
+OWNER = str(ObjectId())
+
+
+class Owners:
+    """Counting stand-in for the MongoDB owner lookup."""
+
+    def __init__(self, owners):
+        self.owners = owners
+        self.calls = []
+
+    def __call__(self, filename):
+        self.calls.append(filename)
+        return self.owners.get(filename)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ownership_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_owner_is_served_from_the_cache_until_it_expires(clock):
+    cache = OwnershipCache(max_entries=10, ttl_seconds=60)
+    load = Owners({"a.ogg": OWNER})
+
+    assert cache.get_owner("a.ogg", load) == OWNER
+    clock[0] += 59
+    assert cache.get_owner("a.ogg", load) == OWNER
+    assert load.calls == ["a.ogg"]
+
+    clock[0] += 2
+    assert cache.get_owner("a.ogg", load) == OWNER
+    assert load.calls == ["a.ogg", "a.ogg"]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = OwnershipCache(max_entries=2, ttl_seconds=60)
+    load = Owners({"a.ogg": "1", "b.ogg": "2", "c.ogg": "3"})
+    cache.get_owner("a.ogg", load)
+    cache.get_owner("b.ogg", load)
+    cache.get_owner("a.ogg", load)  # b is now the least recently used
+    cache.get_owner("c.ogg", load)
+
+    assert cache.evictions == 1
+    assert cache.snapshot()["entries"] == 2
+    load.calls.clear()
+    cache.get_owner("a.ogg", load)
+    cache.get_owner("c.ogg", load)
+    assert load.calls == []
+    cache.get_owner("b.ogg", load)
+    assert load.calls == ["b.ogg"]
+
+
+def test_unknown_files_are_not_cached(clock):
+    cache = OwnershipCache(max_entries=10, ttl_seconds=60)
+    load = Owners({})
+    assert cache.get_owner("new.ogg", load) is None
+    load.owners["new.ogg"] = OWNER
+    assert cache.get_owner("new.ogg", load) == OWNER
+    assert load.calls == ["new.ogg", "new.ogg"]
+
+
+def test_zero_size_disables_caching(clock):
+    cache = OwnershipCache(max_entries=0, ttl_seconds=60)
+    load = Owners({"a.ogg": OWNER})
+    cache.get_owner("a.ogg", load)
+    cache.get_owner("a.ogg", load)
+    assert len(load.calls) == 2
+
+
+def test_invalidate_drops_only_the_named_entries(clock):
+    cache = OwnershipCache(max_entries=10, ttl_seconds=60)
+    load = Owners({"a.ogg": "1", "b.ogg": "2"})
+    cache.get_owner("a.ogg", load)
+    cache.get_owner("b.ogg", load)
+
+    cache.invalidate("a.ogg", None, "missing.ogg")
+    assert cache.invalidations == 1
+    load.calls.clear()
+    cache.get_owner("a.ogg", load)
+    cache.get_owner("b.ogg", load)
+    assert load.calls == ["a.ogg"]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = OwnershipCache(max_entries=10, ttl_seconds=60)
+    monkeypatch.setattr(app_module, "audio_owner_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def image_with_voice_note(mongo, upload_folder, cache):
+    def add(audio_filename):
+        image_id = ObjectId()
+        mongo.images.insert_one({
+            "_id": image_id, "user_id": OWNER, "filename": f"{image_id}.png", "title": "Bee",
+            "description": "On a flower", "created_at": datetime.datetime.now(), "audio_filename": audio_filename,
+        })
+        cache.get_owner(audio_filename, lambda filename: OWNER)
+        return image_id
+    return add
+
+
+def test_delete_route_invalidates_the_voice_note_owner(client, auth_headers, cache, image_with_voice_note):
+    image_id = image_with_voice_note("voice_1.ogg")
+    assert client.delete(f"/delete/{image_id}", headers=auth_headers(OWNER)).status_code == 200
+    assert cache.invalidations == 1
+    assert cache.snapshot()["entries"] == 0
+
+
+def test_bulk_delete_invalidates_every_voice_note_owner(app, client, auth_headers, cache, image_with_voice_note,
+                                                        monkeypatch):
+    # Queue the purge instead of running it on the upload I/O pool
+    monkeypatch.setitem(app.config, "BACKGROUND_JOBS", True)
+    image_ids = [image_with_voice_note("voice_1.ogg"), image_with_voice_note("voice_2.ogg")]
+    response = client.post(
+        "/api/user/images/delete", json={"ids": [str(image_id) for image_id in image_ids]},
+        headers=auth_headers(OWNER),
+    )
+    assert response.status_code == 200
+    assert cache.invalidations == 2
+    assert cache.snapshot()["entries"] == 0
@@ -0,0 +1,193 @@
+import base64
+import datetime
+
+import pytest
+from bson import ObjectId, json_util
+
+from database import userdatahandler
+from database.userdatahandler import _get_paginated_images_by_user, search_and_filter_images
+from utils.pagination import decode_cursor, encode_cursor, keyset_query, next_cursor
+
+NEWEST_FIRST = "created_at:-1"
+USER_ID = str(ObjectId())
+
+
+def test_cursor_round_trips_dates_and_object_ids():
+    created_at = datetime.datetime(2024, 5, 17, 9, 30, 15, 123000)
+    last_id = ObjectId()
+    token = encode_cursor(NEWEST_FIRST, created_at, last_id)
+    assert "=" not in token
+    assert decode_cursor(token, NEWEST_FIRST) == (created_at, last_id)
+
+
+def test_cursor_round_trips_strings():
+    last_id = ObjectId()
+    assert decode_cursor(encode_cursor("title:1", "Bees ✨", last_id), "title:1") == ("Bees ✨", last_id)
+
+
+@pytest.mark.parametrize("sort", ["created_at:1", "title:-1", "title:1"])
+def test_cursor_from_another_sort_is_rejected(sort):
+    token = encode_cursor(NEWEST_FIRST, datetime.datetime(2024, 5, 17), ObjectId())
+    with pytest.raises(ValueError, match="sort order"):
+        decode_cursor(token, sort)
+
+
+def reencode(payload):
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("token", [
+    "not a cursor",
+    "%%%%",
+    reencode("{not json"),
+    reencode('["created_at:-1", 1, 2]'),
+    reencode('{"s": "created_at:-1", "v": 1}'),
+    reencode('{"s": "created_at:-1", "v": {"$date": "yesterday"}, "id": 1}'),
+])
+def test_tampered_cursor_is_rejected(token):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(token, NEWEST_FIRST)
+
+
+def test_truncated_cursor_is_rejected():
+    token = encode_cursor(NEWEST_FIRST, datetime.datetime(2024, 5, 17), ObjectId())
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(token[:-6], NEWEST_FIRST)
+
+
+def test_cursor_with_a_rewritten_sort_is_rejected():
+    token = encode_cursor(NEWEST_FIRST, datetime.datetime(2024, 5, 17), ObjectId())
+    padded = token + "=" * (-len(token) % 4)
+    payload = json_util.loads(base64.urlsafe_b64decode(padded))
+    payload["s"] = "title:1"
+    with pytest.raises(ValueError, match="sort order"):
+        decode_cursor(reencode(json_util.dumps(payload)), NEWEST_FIRST)
+
+
+def test_keyset_query_breaks_ties_on_id():
+    last_id = ObjectId()
+    assert keyset_query({}, "created_at", -1, "v", last_id) == {"$or": [
+        {"created_at": {"$lt": "v"}},
+        {"created_at": "v", "_id": {"$lt": last_id}},
+    ]}
+    assert keyset_query({"user_id": "u"}, "title", 1, "v", last_id)["$and"][0] == {"user_id": "u"}
+
+
+def test_next_cursor_is_none_on_the_last_page():
+    rows = [{"_id": ObjectId(), "created_at": datetime.datetime(2024, 5, 17)}]
+    assert next_cursor(rows, NEWEST_FIRST, "created_at", has_more=False) is None
+    assert next_cursor([], NEWEST_FIRST, "created_at", has_more=True) is None
+    assert decode_cursor(next_cursor(rows, NEWEST_FIRST, "created_at", True), NEWEST_FIRST) == (
+        rows[0]["created_at"], rows[0]["_id"]
+    )
+
+
+@pytest.fixture
+def images_with_ties(mongo):
+    """Eleven images, most of them sharing a created_at with a neighbour."""
+    base = datetime.datetime(2024, 5, 17, 12, 0, 0)
+    stamps = [0, 0, 0, 1, 1, 2, 3, 3, 3, 3, 4]
+    docs = [{
+        "_id": ObjectId(), "user_id": USER_ID, "filename": f"{i}.png", "title": f"Bee {i % 3}",
+        "description": "On a flower", "created_at": base + datetime.timedelta(minutes=stamp),
+    } for i, stamp in enumerate(stamps)]
+    mongo.images.insert_many(docs)
+    mongo.images.insert_one({**docs[0], "_id": ObjectId(), "user_id": str(ObjectId())})
+    return docs
+
+
+@pytest.mark.parametrize("with_count", [True, False])
+def test_paging_through_ties_neither_drops_nor_repeats_rows(images_with_ties, with_count):
+    expected = [str(doc["_id"]) for doc in sorted(
+        images_with_ties, key=lambda doc: (doc["created_at"], doc["_id"]), reverse=True
+    )]
+    seen, cursor = [], None
+    while True:
+        page = _get_paginated_images_by_user(USER_ID, page_size=3, cursor=cursor, with_count=with_count)
+        assert page["total_count"] == (len(images_with_ties) if with_count else None)
+        seen.extend(image["id"] for image in page["images"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+@pytest.mark.parametrize("with_count", [True, False])
+def test_title_cursor_pages_through_ties(images_with_ties, with_count):
+    expected = [str(doc["_id"]) for doc in sorted(images_with_ties, key=lambda doc: (doc["title"], doc["_id"]))]
+    seen, cursor = [], None
+    while True:
+        page = search_and_filter_images(
+            USER_ID, sort_by="title", sort_order="asc", limit=4, cursor=cursor, with_count=with_count
+        )
+        assert "error" not in page
+        seen.extend(image["id"] for image in page["images"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_listing_rejects_a_cursor_from_another_sort(images_with_ties):
+    cursor = _get_paginated_images_by_user(USER_ID, page_size=3)["next_cursor"]
+    with pytest.raises(ValueError):
+        search_and_filter_images(USER_ID, sort_by="title", sort_order="asc", cursor=cursor)
+
+
+class RecordingCollection:
+    """Wraps a collection and records the filters and pipelines it is sent."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = []
+
+    def find(self, *args):
+        self.calls.append(("find", args[0]))
+        return self.collection.find(*args)
+
+    def aggregate(self, pipeline):
+        self.calls.append(("aggregate", pipeline))
+        return self.collection.aggregate(pipeline)
+
+    def count_documents(self, query):
+        self.calls.append(("count_documents", query))
+        return self.collection.count_documents(query)
+
+
+@pytest.fixture
+def recorded(images_with_ties, mongo, monkeypatch):
+    collection = RecordingCollection(mongo.images)
+    monkeypatch.setattr(userdatahandler, "beehive_image_collection", collection)
+    return collection
+
+
+def test_cursor_pages_seek_in_the_leading_filter(recorded):
+    cursor = _get_paginated_images_by_user(USER_ID, page_size=3)["next_cursor"]
+    recorded.calls.clear()
+
+    page = _get_paginated_images_by_user(USER_ID, page_size=3, cursor=cursor)
+    assert page["total_count"] == 11
+    assert [name for name, _ in recorded.calls] == ["find", "count_documents"]
+    page_filter = recorded.calls[0][1]
+    assert page_filter["$and"][0] == {"user_id": USER_ID}
+    assert page_filter["$and"][1] == keyset_query({}, "created_at", -1, *decode_cursor(cursor, NEWEST_FIRST))
+    # The total counts every match, not just the rows after the cursor
+    assert recorded.calls[1][1] == {"user_id": USER_ID}
+
+
+def test_cursor_pages_without_count_only_read_the_page(recorded):
+    cursor = _get_paginated_images_by_user(USER_ID, page_size=3)["next_cursor"]
+    recorded.calls.clear()
+
+    _get_paginated_images_by_user(USER_ID, page_size=3, cursor=cursor, with_count=False)
+    assert [name for name, _ in recorded.calls] == ["find"]
+    assert "$and" in recorded.calls[0][1]
+
+
+def test_offset_pages_read_rows_and_total_in_one_facet(recorded):
+    page = _get_paginated_images_by_user(USER_ID, page=2, page_size=3)
+    assert page["total_count"] == 11
+    assert [name for name, _ in recorded.calls] == ["aggregate"]
+    pipeline = recorded.calls[0][1]
+    assert pipeline[0] == {"$match": {"user_id": USER_ID}}
+    assert pipeline[-1]["$facet"]["rows"] == [{"$skip": 3}, {"$limit": 4}]
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+from pymongo import MongoClient, WriteConcern, monitoring
+from pymongo.read_preferences import Primary
+
+from database.databaseConfig import beehive, get_beehive_image_collection
+from database.read_routing import ANALYTICS, PRIMARY, READ_PROFILES, read_profile, read_profile_scope
+
+REPLSET_URI = os.environ.get("MONGODB_REPLSET_URI")
+
+
+def test_reads_use_primary_by_default():
+    assert get_beehive_image_collection().read_preference == Primary()
+    assert beehive.users.read_preference == Primary()
+
+
+def test_read_profile_scope_routes_collections():
+    with read_profile_scope(ANALYTICS):
+        assert get_beehive_image_collection().read_preference == READ_PROFILES[ANALYTICS]
+        assert beehive.users.read_preference == READ_PROFILES[ANALYTICS]
+    assert get_beehive_image_collection().read_preference == Primary()
+
+
+def test_read_profile_decorator_resets_after_errors():
+    @read_profile(ANALYTICS)
+    def failing():
+        assert beehive.users.read_preference == READ_PROFILES[ANALYTICS]
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        failing()
+    assert beehive.users.read_preference == Primary()
+
+
+def test_unknown_read_profile_is_rejected():
+    with pytest.raises(ValueError):
+        read_profile("reporting")
+
+
+class CommandAddresses(monitoring.CommandListener):
+    def __init__(self):
+        self.addresses = {}
+
+    def started(self, event):
+        if event.command_name in ("find", "aggregate"):
+            self.addresses[event.request_id] = event.connection_id
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+@pytest.mark.skipif(not REPLSET_URI, reason="set MONGODB_REPLSET_URI (docker compose --profile replset up)")
+def test_analytics_reads_go_to_a_secondary():
+    listener = CommandAddresses()
+    client = MongoClient(REPLSET_URI, event_listeners=[listener], serverSelectionTimeoutMS=10000)
+    try:
+        collection = client.beehive_read_routing_test.items
+        collection.with_options(write_concern=WriteConcern(w=3)).insert_one({"n": 1})
+        primary = client.primary
+
+        listener.addresses.clear()
+        collection.with_options(read_preference=READ_PROFILES[PRIMARY]).find_one({"n": 1})
+        assert set(listener.addresses.values()) == {primary}
+
+        listener.addresses.clear()
+        analytics = collection.with_options(read_preference=READ_PROFILES[ANALYTICS])
+        assert analytics.find_one({"n": 1}) is not None
+        list(analytics.aggregate([{"$facet": {"total": [{"$count": "count"}]}}]))
+        assert listener.addresses and primary not in set(listener.addresses.values())
+    finally:
+        client.drop_database("beehive_read_routing_test")
+        client.close()
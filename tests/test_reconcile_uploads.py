@@ -0,0 +1,136 @@
+import datetime
+import hashlib
+import os
+import time
+
+import pytest
+from bson import ObjectId
+
+import reconcile_uploads
+from database.jobqueue import JOB_SUCCEEDED, build_job
+from reconcile_uploads import Checkpoint, RateLimiter, iter_entries, scan_files
+from utils.content_store import blob_filename
+from utils.upload_paths import resolve_path
+
+HOUR = 3600
+
+
+def stored(upload_folder, filename, area="", name=None, age=2 * HOUR):
+    path = resolve_path(str(upload_folder), filename, area, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * 10)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def scan(upload_folder, checkpoint, quarantine_dir=None, max_entries=0, batch_size=2):
+    return scan_files(str(upload_folder), checkpoint, batch_size, RateLimiter(0), HOUR, max_entries, quarantine_dir)
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return Checkpoint(str(tmp_path / "cache" / "reconcile.json"))
+
+
+def add_image(mongo, filename, audio_filename=None, collection="images"):
+    mongo[collection].insert_one({
+        "_id": ObjectId(), "user_id": str(ObjectId()), "filename": filename, "audio_filename": audio_filename,
+        "title": "Bee", "description": "On a flower", "created_at": datetime.datetime.now(),
+    })
+
+
+def test_every_kind_of_reference_keeps_a_file(mongo, upload_folder, checkpoint, tmp_path):
+    kept = {
+        "image.png": stored(upload_folder, "image.png"),
+        "voice_1.ogg": stored(upload_folder, "voice_1.ogg"),
+        "trashed.png": stored(upload_folder, "trashed.png"),
+        "blob.png": stored(upload_folder, "blob.png"),
+        "queued.pdf": stored(upload_folder, "queued.pdf"),
+        "session.png": stored(upload_folder, "session.png"),
+        "young.png": stored(upload_folder, "young.png", age=60),
+        "image thumbnail": stored(upload_folder, "image.png", "thumbnails", "image.jpg"),
+        "queued thumbnail": stored(upload_folder, "queued.pdf", "thumbnails", "queued_pages.jpg"),
+        "blob derivative": stored(upload_folder, "blob.png", "derivatives", "blob_256.webp"),
+    }
+    content_hash = hashlib.sha256(b"direct").hexdigest()
+    direct = blob_filename(content_hash, "image/png")
+    kept["direct.png"] = stored(upload_folder, direct)
+    orphans = {
+        "orphan.png": stored(upload_folder, "orphan.png"),
+        "done.png": stored(upload_folder, "done.png"),
+        "orphan thumbnail": stored(upload_folder, "gone.pdf", "thumbnails", "gone.jpg"),
+    }
+
+    add_image(mongo, "image.png", "voice_1.ogg")
+    add_image(mongo, "trashed.png", collection="deleted_images")
+    mongo.blobs.insert_one({"_id": "blob.png", "refcount": 1})
+    mongo.jobs.insert_one(build_job("pdf_thumbnail", {"filename": "queued.pdf"}))
+    mongo.jobs.insert_one({**build_job("media_derivatives", {"filename": "done.png"}), "status": JOB_SUCCEEDED})
+    mongo.upload_sessions.insert_many([
+        {"status": "completed", "stored_filename": "session.png"},
+        {"status": "uploading", "direct": True, "content_hash": content_hash, "mime_type": "image/png"},
+    ])
+
+    quarantine_dir = tmp_path / "quarantine"
+    scanned, orphaned, orphaned_bytes, finished = scan(upload_folder, checkpoint, str(quarantine_dir))
+    assert (scanned, orphaned, orphaned_bytes, finished) == (14, 3, 30, True)
+    for label, path in kept.items():
+        assert os.path.exists(path), label
+    for label, path in orphans.items():
+        assert not os.path.exists(path), label
+        relpath = os.path.relpath(path, upload_folder)
+        assert (quarantine_dir / relpath).exists(), label
+
+
+def test_orphans_are_only_reported_without_quarantine(mongo, upload_folder, checkpoint):
+    path = stored(upload_folder, "orphan.png")
+    assert scan(upload_folder, checkpoint)[1] == 1
+    assert os.path.exists(path)
+
+
+def test_file_claimed_after_the_batch_query_is_not_quarantined(mongo, upload_folder, checkpoint, tmp_path,
+                                                                monkeypatch):
+    path = stored(upload_folder, "late.png")
+    real_find_orphans = reconcile_uploads.find_orphans
+
+    def find_then_claim(batch):
+        orphans = real_find_orphans(batch)
+        add_image(mongo, "late.png")
+        return orphans
+
+    monkeypatch.setattr(reconcile_uploads, "find_orphans", find_then_claim)
+    assert scan(upload_folder, checkpoint, str(tmp_path / "quarantine"))[1] == 0
+    assert os.path.exists(path)
+
+
+def test_capped_runs_resume_from_the_checkpoint(mongo, upload_folder, checkpoint):
+    names = [f"file_{i}.png" for i in range(5)]
+    for name in names:
+        stored(upload_folder, name)
+    stored(upload_folder, "legacy.png")
+    os.replace(resolve_path(str(upload_folder), "legacy.png"), os.path.join(upload_folder, "legacy.png"))
+    everything = list(iter_entries(str(upload_folder)))
+    assert len(everything) == 6 and everything[0] == ("", "", "legacy.png")
+
+    seen = []
+    for _ in range(3):
+        # A fresh Checkpoint each run, as in separate invocations
+        run_checkpoint = Checkpoint(checkpoint.path)
+        start = run_checkpoint.position("files")
+        scanned, _, _, finished = scan(upload_folder, run_checkpoint, max_entries=2)
+        seen.extend(list(iter_entries(str(upload_folder), start))[:scanned])
+        if finished:
+            break
+    assert seen == everything
+    assert finished
+    assert Checkpoint(checkpoint.path).position("files") is None
+
+
+def test_checkpoint_skips_whole_directories_already_scanned(upload_folder):
+    for name in ["a.png", "b.png", "c.png"]:
+        stored(upload_folder, name)
+    entries = list(iter_entries(str(upload_folder)))
+    area, directory, name = entries[1]
+    assert list(iter_entries(str(upload_folder), [0, directory, name])) == entries[2:]
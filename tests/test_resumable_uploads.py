@@ -0,0 +1,223 @@
+import hashlib
+import io
+import os
+
+import pytest
+from bson import ObjectId
+from PIL import Image
+
+from utils import media_storage
+from utils.content_store import blob_filename
+
+USER_ID = str(ObjectId())
+
+
+def png_bytes(size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 120, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def headers(auth_headers):
+    return auth_headers(USER_ID)
+
+
+@pytest.fixture
+def create_session(client, mongo, upload_folder, headers):
+    def create(size, filename="photo.png", **extra):
+        response = client.post("/api/user/upload/sessions", json={
+            "filename": filename, "size": size, "title": "Bee", "description": "On a flower", **extra,
+        }, headers=headers)
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()
+    return create
+
+
+def staging_path(upload_folder, session_id):
+    return os.path.join(upload_folder, ".staging", f"{session_id}.part")
+
+
+def patch_chunk(client, headers, session_id, offset, data):
+    return client.patch(
+        f"/api/user/upload/sessions/{session_id}",
+        data=data,
+        headers={**headers, "Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"},
+    )
+
+
+def test_chunk_at_the_wrong_offset_is_refused_with_the_committed_offset(client, headers, create_session):
+    data = png_bytes()
+    session_id = create_session(len(data))["session_id"]
+    assert patch_chunk(client, headers, session_id, 0, data[:100]).status_code == 200
+
+    response = patch_chunk(client, headers, session_id, 50, data[50:150])
+    assert response.status_code == 409
+    assert response.get_json()["offset"] == 100
+    assert response.headers["Upload-Offset"] == "100"
+
+    response = patch_chunk(client, headers, session_id, 100, data[100:])
+    assert response.status_code == 200
+    assert response.get_json()["offset"] == len(data)
+
+
+def test_chunk_past_the_declared_size_is_refused(client, headers, create_session, upload_folder):
+    session_id = create_session(10)["session_id"]
+    response = patch_chunk(client, headers, session_id, 0, b"x" * 11)
+    assert response.status_code == 413
+    assert os.path.getsize(staging_path(upload_folder, session_id)) == 0
+
+
+def test_finalize_before_every_byte_arrived_is_refused(client, headers, create_session):
+    data = png_bytes()
+    session_id = create_session(len(data))["session_id"]
+    patch_chunk(client, headers, session_id, 0, data[:-1])
+
+    response = client.post(f"/api/user/upload/sessions/{session_id}/finalize", headers=headers)
+    assert response.status_code == 409
+    assert response.get_json()["offset"] == len(data) - 1
+
+
+def test_finalize_stores_the_assembled_file(client, headers, create_session, mongo, upload_folder):
+    data = png_bytes()
+    session_id = create_session(len(data))["session_id"]
+    patch_chunk(client, headers, session_id, 0, data)
+
+    response = client.post(f"/api/user/upload/sessions/{session_id}/finalize", headers=headers)
+    assert response.status_code == 200
+    filename = response.get_json()["filename"]
+    assert filename == blob_filename(hashlib.sha256(data).hexdigest(), "image/png")
+    assert mongo.images.find_one({"filename": filename})["user_id"] == USER_ID
+    assert not os.path.exists(staging_path(upload_folder, session_id))
+
+
+def test_finalize_rejects_content_that_is_not_an_image(client, headers, create_session, mongo, upload_folder):
+    data = b"#!/bin/sh\necho not a png\n" * 10
+    session_id = create_session(len(data))["session_id"]
+    patch_chunk(client, headers, session_id, 0, data)
+
+    response = client.post(f"/api/user/upload/sessions/{session_id}/finalize", headers=headers)
+    assert response.status_code == 400
+    assert mongo.upload_sessions.count_documents({}) == 0
+    assert not os.path.exists(staging_path(upload_folder, session_id))
+
+
+def test_delete_discards_the_staged_bytes(client, headers, create_session, mongo, upload_folder):
+    data = png_bytes()
+    session_id = create_session(len(data))["session_id"]
+    patch_chunk(client, headers, session_id, 0, data[:100])
+
+    response = client.delete(f"/api/user/upload/sessions/{session_id}", headers=headers)
+    assert response.status_code == 200
+    assert not os.path.exists(staging_path(upload_folder, session_id))
+    assert mongo.upload_sessions.count_documents({}) == 0
+    assert client.get(f"/api/user/upload/sessions/{session_id}", headers=headers).status_code == 404
+
+
+def test_other_users_cannot_touch_a_session(client, create_session, auth_headers):
+    session_id = create_session(10)["session_id"]
+    other = auth_headers(ObjectId())
+    assert client.delete(f"/api/user/upload/sessions/{session_id}", headers=other).status_code == 403
+    assert patch_chunk(client, other, session_id, 0, b"x").status_code == 403
+
+
+class Bucket:
+    """In-memory stand-in for the S3 backend: objects keyed like the bucket."""
+
+    remote = True
+
+    def __init__(self):
+        self.objects = {}
+
+    def head(self, key):
+        return len(self.objects[key]) if key in self.objects else None
+
+    def checksum_sha256(self, key):
+        return hashlib.sha256(self.objects[key]).hexdigest() if key in self.objects else None
+
+    def read_range(self, key, length):
+        return self.objects[key][:length]
+
+    def delete(self, key):
+        self.objects.pop(key, None)
+
+    def put_file(self, path, key):
+        pass
+
+    def url(self, key, expires=None):
+        return f"https://bucket.test/{key}"
+
+    def presigned_put(self, key, content_type, checksum_sha256=None, expires=None):
+        return {"url": f"https://bucket.test/{key}", "method": "PUT", "headers": {"Content-Type": content_type}}
+
+
+@pytest.fixture
+def bucket(upload_folder, monkeypatch):
+    bucket = Bucket()
+    monkeypatch.setattr(media_storage, "_storage", bucket)
+    return bucket
+
+
+def bucket_key(upload):
+    return upload["url"].removeprefix("https://bucket.test/")
+
+
+def test_direct_upload_needs_a_bucket_backend(client, headers, mongo, upload_folder):
+    data = png_bytes()
+    response = client.post("/api/user/upload/sessions", json={
+        "filename": "photo.png", "size": len(data), "title": "Bee", "description": "On a flower",
+        "direct": True, "sha256": hashlib.sha256(data).hexdigest(), "content_type": "image/png",
+    }, headers=headers)
+    assert response.status_code == 400
+    assert "s3" in response.get_json()["error"]
+    assert mongo.upload_sessions.count_documents({}) == 0
+
+
+def test_direct_finalize_rejects_an_object_of_the_wrong_size(client, headers, create_session, bucket, mongo):
+    data = png_bytes()
+    created = create_session(len(data), direct=True, sha256=hashlib.sha256(data).hexdigest(),
+                             content_type="image/png")
+    key = bucket_key(created["upload"])
+    bucket.objects[key] = data + b"\x00"
+
+    response = client.post(f"/api/user/upload/sessions/{created['session_id']}/finalize", headers=headers)
+    assert response.status_code == 400
+    assert key not in bucket.objects
+    assert mongo.images.count_documents({}) == 0
+
+
+def test_direct_finalize_rejects_an_object_with_another_hash(client, headers, create_session, bucket, mongo):
+    data = png_bytes()
+    created = create_session(len(data), direct=True, sha256=hashlib.sha256(data).hexdigest(),
+                             content_type="image/png")
+    key = bucket_key(created["upload"])
+    bucket.objects[key] = png_bytes((48, 64))[:len(data)].ljust(len(data), b"\x00")
+
+    response = client.post(f"/api/user/upload/sessions/{created['session_id']}/finalize", headers=headers)
+    assert response.status_code == 400
+    assert "SHA-256" in response.get_json()["error"]
+    assert key not in bucket.objects
+    assert mongo.upload_sessions.count_documents({}) == 0
+
+
+def test_direct_finalize_waits_for_the_object(client, headers, create_session, bucket):
+    data = png_bytes()
+    created = create_session(len(data), direct=True, sha256=hashlib.sha256(data).hexdigest(),
+                             content_type="image/png")
+    response = client.post(f"/api/user/upload/sessions/{created['session_id']}/finalize", headers=headers)
+    assert response.status_code == 409
+    # The session can be finalized once the object is there
+    assert client.get(f"/api/user/upload/sessions/{created['session_id']}", headers=headers).get_json()["status"] == "uploading"
+
+
+def test_delete_of_a_direct_session_removes_its_unreferenced_object(client, headers, create_session, bucket, mongo):
+    data = png_bytes()
+    created = create_session(len(data), direct=True, sha256=hashlib.sha256(data).hexdigest(),
+                             content_type="image/png")
+    key = bucket_key(created["upload"])
+    bucket.objects[key] = data
+
+    response = client.delete(f"/api/user/upload/sessions/{created['session_id']}", headers=headers)
+    assert response.status_code == 200
+    assert key not in bucket.objects
+    assert mongo.upload_sessions.count_documents({}) == 0
@@ -0,0 +1,128 @@
+import os
+import sys
+
+import fitz
+import pytest
+from PIL import Image
+
+import backfill_thumbnails
+from config import Config
+from utils import thumbnails
+from utils.content_store import blob_filename, hash_file
+from utils.thumbnails import (
+    MAX_RENDER_ZOOM, PdfRenderer, _render_pdf, generate_pdf_thumbnail, preview_strip_path, thumbnail_path,
+)
+from utils.upload_paths import resolve_path
+
+
+def write_pdf(path, pages=((612, 792),)):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with fitz.open() as document:
+        for width, height in pages:
+            document.new_page(width=width, height=height)
+        document.save(path)
+    return path
+
+
+def image_size(path):
+    with Image.open(path) as image:
+        return image.size
+
+
+@pytest.mark.parametrize("page, expected", [
+    ((612, 792), (619, 800)),  # Letter is scaled down to the cap
+    ((200, 100), (400, 200)),  # A small page is rendered at most at MAX_RENDER_ZOOM
+])
+def test_render_scale_is_capped_both_ways(tmp_path, page, expected):
+    pdf_path = write_pdf(str(tmp_path / "doc.pdf"), [page])
+    output_path = str(tmp_path / "doc.jpg")
+    assert _render_pdf(pdf_path, output_path, 800)
+    assert image_size(output_path) == expected
+    assert expected[0] <= page[0] * MAX_RENDER_ZOOM
+
+
+def test_preview_strip_places_pages_side_by_side(tmp_path):
+    pdf_path = write_pdf(str(tmp_path / "doc.pdf"), [(612, 792)] * 4)
+    preview_path = str(tmp_path / "doc_pages.jpg")
+    assert _render_pdf(pdf_path, str(tmp_path / "doc.jpg"), 400, 3, preview_path)
+
+    page_width = round(612 * thumbnails.PREVIEW_PAGE_HEIGHT / 792)
+    width, height = image_size(preview_path)
+    assert height == thumbnails.PREVIEW_PAGE_HEIGHT
+    assert abs(width - (3 * page_width + 2 * thumbnails.PREVIEW_PAGE_GAP)) <= 3
+
+
+def test_pool_renders_in_a_spawned_process(tmp_path):
+    pdf_path = write_pdf(str(tmp_path / "doc.pdf"))
+    renderer = PdfRenderer(1)
+    try:
+        assert renderer.render(pdf_path, str(tmp_path / "doc.jpg"), 160)
+        assert image_size(tmp_path / "doc.jpg") == (124, 160)
+        assert renderer._executor._mp_context.get_start_method() == "spawn"
+    finally:
+        renderer.shutdown()
+    assert renderer._executor is None
+
+
+class CountingRenderer:
+    """Renders in-process and counts the renders it was asked for."""
+
+    def __init__(self):
+        self.calls = []
+
+    def render(self, *args):
+        self.calls.append(args[0])
+        return _render_pdf(*args)
+
+
+def test_content_addressed_pdfs_reuse_their_render(upload_folder):
+    pdf_path = write_pdf(str(upload_folder / "source.pdf"))
+    filename = blob_filename(hash_file(pdf_path), "application/pdf")
+    os.makedirs(os.path.dirname(resolve_path(str(upload_folder), filename)), exist_ok=True)
+    os.replace(pdf_path, resolve_path(str(upload_folder), filename))
+    renderer = CountingRenderer()
+
+    for _ in range(2):
+        assert generate_pdf_thumbnail(
+            resolve_path(str(upload_folder), filename), filename, str(upload_folder), 0, renderer
+        ) == thumbnail_path(str(upload_folder), filename)
+    assert len(renderer.calls) == 1
+
+
+def test_legacy_pdf_links_the_render_of_identical_bytes(upload_folder):
+    legacy_path = write_pdf(str(upload_folder / "report.pdf"), [(612, 792)] * 2)
+    hashed = blob_filename(hash_file(legacy_path), "application/pdf")
+    hashed_path = resolve_path(str(upload_folder), hashed)
+    os.makedirs(os.path.dirname(hashed_path), exist_ok=True)
+    os.link(legacy_path, hashed_path)
+    renderer = CountingRenderer()
+    generate_pdf_thumbnail(hashed_path, hashed, str(upload_folder), 2, renderer)
+
+    assert generate_pdf_thumbnail(legacy_path, "report.pdf", str(upload_folder), 2, renderer)
+    assert len(renderer.calls) == 1
+    assert os.path.samefile(thumbnail_path(str(upload_folder), "report.pdf"),
+                            thumbnail_path(str(upload_folder), hashed))
+    assert os.path.samefile(preview_strip_path(str(upload_folder), "report.pdf"),
+                            preview_strip_path(str(upload_folder), hashed))
+
+
+def test_backfill_renders_missing_thumbnails_in_both_layouts(upload_folder, monkeypatch):
+    write_pdf(str(upload_folder / "flat.pdf"))
+    sharded = write_pdf(str(upload_folder / "sharded.pdf"), [(300, 300)])
+    sharded_name = blob_filename(hash_file(sharded), "application/pdf")
+    os.makedirs(os.path.dirname(resolve_path(str(upload_folder), sharded_name)), exist_ok=True)
+    os.replace(sharded, resolve_path(str(upload_folder), sharded_name))
+    (upload_folder / "broken.pdf").write_bytes(b"%PDF-1.4 truncated")
+    (upload_folder / "photo.png").write_bytes(b"\x89PNG\r\n\x1a\n")
+
+    monkeypatch.setattr(backfill_thumbnails, "PdfRenderer", lambda workers: CountingRenderer())
+    monkeypatch.setattr(CountingRenderer, "shutdown", lambda self: None, raising=False)
+    monkeypatch.setattr(Config, "PDF_THUMBNAIL_MAX_DIMENSION", 200)
+    monkeypatch.setattr(sys, "argv", ["backfill_thumbnails.py", "--workers", "2", "--preview-pages", "0"])
+
+    assert backfill_thumbnails.main() == 1  # broken.pdf cannot be rendered
+    assert image_size(thumbnail_path(str(upload_folder), "flat.pdf")) == (155, 200)
+    assert os.path.exists(thumbnail_path(str(upload_folder), sharded_name))
+
+    # A re-run only retries the PDF that failed
+    assert list(backfill_thumbnails.find_pdfs(str(upload_folder), 0, force=False)) == ["broken.pdf"]
@@ -0,0 +1,162 @@
+import hashlib
+import os
+
+import pytest
+
+import migrate_uploads
+from config import Config
+from migrate_uploads import migrate, move_to_shard
+from utils.upload_paths import (
+    iter_stored_files, remove_stored_file, resolve_path, shard_dirs, sharded_relpath, upload_url,
+)
+
+CONTENT_HASH = "3fa9" + "0" * 60
+UPLOAD = f"{CONTENT_HASH}.jpg"
+
+
+def write(folder, relpath, data=b"x"):
+    path = os.path.join(folder, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def files_under(folder):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), folder)
+        for root, _, names in os.walk(folder) for name in names
+    )
+
+
+def test_content_hashes_shard_by_their_own_prefix():
+    assert shard_dirs(UPLOAD) == ("3f", "a9")
+    legacy = hashlib.sha256(b"photo").hexdigest()
+    assert shard_dirs("photo.png") == (legacy[:2], legacy[2:4])
+    # Derived files shard with the upload they belong to
+    assert sharded_relpath(UPLOAD, "thumbnails", f"{CONTENT_HASH}_pages.jpg") == os.path.join(
+        "thumbnails", "3f", "a9", f"{CONTENT_HASH}_pages.jpg"
+    )
+
+
+def test_resolve_path_falls_back_to_the_flat_file(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    sharded = os.path.join(folder, "3f", "a9", UPLOAD)
+    # Nothing stored yet: new files go to the sharded path
+    assert resolve_path(folder, UPLOAD) == sharded
+
+    flat = write(folder, UPLOAD)
+    assert resolve_path(folder, UPLOAD) == flat
+    assert upload_url(folder, UPLOAD) == f"/static/uploads/{UPLOAD}"
+
+    monkeypatch.setattr(Config, "UPLOAD_FLAT_FALLBACK", False)
+    assert resolve_path(folder, UPLOAD) == sharded
+    monkeypatch.setattr(Config, "UPLOAD_FLAT_FALLBACK", True)
+
+    write(folder, os.path.join("3f", "a9", UPLOAD))
+    assert resolve_path(folder, UPLOAD) == sharded
+    assert upload_url(folder, UPLOAD) == f"/static/uploads/3f/a9/{UPLOAD}"
+
+
+def test_stored_files_are_listed_and_removed_in_both_layouts(tmp_path):
+    folder = str(tmp_path)
+    write(folder, "legacy.png")
+    write(folder, os.path.join("3f", "a9", UPLOAD))
+    write(folder, os.path.join("3f", "a9", f"{UPLOAD}.1234.part"))
+    write(folder, os.path.join(".staging", "session.part"))
+    write(folder, os.path.join("thumbnails", "3f", "a9", f"{CONTENT_HASH}.jpg"))
+
+    assert sorted(iter_stored_files(folder)) == sorted(["legacy.png", UPLOAD])
+    assert list(iter_stored_files(folder, "thumbnails")) == [f"{CONTENT_HASH}.jpg"]
+
+    write(folder, UPLOAD)
+    assert remove_stored_file(folder, UPLOAD)
+    assert not remove_stored_file(folder, UPLOAD)
+    assert sorted(iter_stored_files(folder)) == ["legacy.png"]
+
+
+def test_move_links_before_unlinking(tmp_path, monkeypatch):
+    folder = str(tmp_path)
+    flat = write(folder, UPLOAD, b"bytes")
+    seen = []
+    real_remove = os.remove
+
+    def remove(path):
+        # Both names exist, with the same inode, when the flat one goes
+        seen.append(os.path.samefile(path, os.path.join(folder, "3f", "a9", UPLOAD)))
+        real_remove(path)
+
+    monkeypatch.setattr(migrate_uploads.os, "remove", remove)
+    assert move_to_shard(folder, UPLOAD)
+    assert seen == [True]
+    assert not os.path.exists(flat)
+    assert open(resolve_path(folder, UPLOAD), "rb").read() == b"bytes"
+    assert not move_to_shard(folder, UPLOAD)
+
+
+def test_existing_sharded_copy_wins(tmp_path):
+    folder = str(tmp_path)
+    write(folder, UPLOAD, b"stale")
+    write(folder, os.path.join("3f", "a9", UPLOAD), b"current")
+    assert move_to_shard(folder, UPLOAD)
+    assert files_under(folder) == [os.path.join("3f", "a9", UPLOAD)]
+    assert open(resolve_path(folder, UPLOAD), "rb").read() == b"current"
+
+
+@pytest.fixture
+def flat_tree(tmp_path):
+    folder = str(tmp_path)
+    write(folder, UPLOAD)
+    write(folder, os.path.join("thumbnails", f"{CONTENT_HASH}.jpg"))
+    write(folder, os.path.join("derivatives", f"{CONTENT_HASH}_256.webp"))
+    write(folder, "legacy.pdf")
+    write(folder, os.path.join("thumbnails", "legacy_pages.jpg"))
+    # A derivative whose upload was already migrated
+    write(folder, os.path.join("derivatives", "orphan_1024.jpg"))
+    write(folder, "upload.part")
+    return folder
+
+
+def test_migration_moves_uploads_with_their_derived_files(flat_tree):
+    legacy = hashlib.sha256(b"legacy").hexdigest()
+    orphan = hashlib.sha256(b"orphan").hexdigest()
+
+    assert migrate(flat_tree, batch_size=2, pause=0, dry_run=True) == (6, 0)
+    assert "upload.part" in files_under(flat_tree) and UPLOAD in files_under(flat_tree)
+
+    assert migrate(flat_tree, batch_size=2, pause=0) == (6, 0)
+    assert files_under(flat_tree) == sorted([
+        os.path.join("3f", "a9", UPLOAD),
+        os.path.join(legacy[:2], legacy[2:4], "legacy.pdf"),
+        os.path.join("derivatives", "3f", "a9", f"{CONTENT_HASH}_256.webp"),
+        os.path.join("derivatives", orphan[:2], orphan[2:4], "orphan_1024.jpg"),
+        os.path.join("thumbnails", "3f", "a9", f"{CONTENT_HASH}.jpg"),
+        os.path.join("thumbnails", legacy[:2], legacy[2:4], "legacy_pages.jpg"),
+        "upload.part",
+    ])
+
+
+def test_migration_is_idempotent(flat_tree):
+    migrate(flat_tree, batch_size=100, pause=0)
+    after_first = files_under(flat_tree)
+    assert migrate(flat_tree, batch_size=100, pause=0) == (0, 0)
+    assert files_under(flat_tree) == after_first
+
+
+def test_interrupted_migration_resumes(flat_tree, monkeypatch):
+    real_move = migrate_uploads.move_to_shard
+    moves = []
+
+    def interrupted(*args, **kwargs):
+        if len(moves) == 3:
+            raise KeyboardInterrupt
+        moves.append(args)
+        return real_move(*args, **kwargs)
+
+    monkeypatch.setattr(migrate_uploads, "move_to_shard", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        migrate(flat_tree, batch_size=100, pause=0)
+    monkeypatch.setattr(migrate_uploads, "move_to_shard", real_move)
+
+    assert migrate(flat_tree, batch_size=100, pause=0) == (3, 0)
+    assert [name for name in files_under(flat_tree) if os.sep not in name] == ["upload.part"]
@@ -0,0 +1,144 @@
+import io
+import os
+
+import pytest
+from flask import Flask, jsonify, request
+
+from utils import upload_policy
+from utils.upload_policy import MIME_SNIFF_BYTES
+from utils.upload_stream import UploadRejected, ValidatingUploadStream, init_streaming_uploads
+
+JPEG_HEADER = b"\xff\xd8\xff\xe0" + b"\x00" * 16
+
+
+def sniff_as(mime_type):
+    return lambda header: mime_type
+
+
+def ingest_files(directory):
+    return [name for name in os.listdir(directory) if name.startswith(".ingest-")]
+
+
+def test_disallowed_type_is_rejected_once_the_sniff_window_is_full(tmp_path):
+    stream = ValidatingUploadStream(str(tmp_path), "notes.jpg", sniff_as("text/plain"))
+    stream.write(b"a" * (MIME_SNIFF_BYTES - 1))
+    with pytest.raises(UploadRejected) as excinfo:
+        stream.write(b"a")
+    assert excinfo.value.status_code == 400
+    stream.close()
+
+
+def test_oversize_file_is_rejected_while_writing(tmp_path, monkeypatch):
+    monkeypatch.setitem(upload_policy.MIME_SIZE_LIMITS, "image/jpeg", 3 * MIME_SNIFF_BYTES)
+    stream = ValidatingUploadStream(str(tmp_path), "photo.jpg", sniff_as("image/jpeg"))
+    stream.write(JPEG_HEADER + b"\x00" * (MIME_SNIFF_BYTES - len(JPEG_HEADER)))
+    stream.write(b"\x00" * MIME_SNIFF_BYTES)
+    with pytest.raises(UploadRejected) as excinfo:
+        stream.write(b"\x00" * (MIME_SNIFF_BYTES + 1))
+    assert excinfo.value.status_code == 413
+    stream.close()
+
+
+def test_file_over_the_limit_within_the_sniff_window_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setitem(upload_policy.MIME_SIZE_LIMITS, "image/jpeg", 100)
+    stream = ValidatingUploadStream(str(tmp_path), "photo.jpg", sniff_as("image/jpeg"))
+    with pytest.raises(UploadRejected) as excinfo:
+        stream.write(b"\x00" * MIME_SNIFF_BYTES)
+    assert excinfo.value.status_code == 413
+    stream.close()
+
+
+def test_small_file_is_checked_when_the_parser_rewinds(tmp_path):
+    stream = ValidatingUploadStream(str(tmp_path), "tiny.jpg", sniff_as("text/plain"))
+    stream.write(b"hello")
+    with pytest.raises(UploadRejected) as excinfo:
+        stream.seek(0)
+    assert excinfo.value.status_code == 400
+    stream.close()
+
+
+def test_small_allowed_file_gets_its_type_on_seek(tmp_path):
+    seen = []
+    stream = ValidatingUploadStream(
+        str(tmp_path), "tiny.jpg", lambda header: seen.append(header) or "image/jpeg"
+    )
+    stream.write(JPEG_HEADER)
+    assert stream.mime_type is None
+    stream.seek(0)
+    assert stream.mime_type == "image/jpeg"
+    assert seen == [JPEG_HEADER]
+    assert stream.read() == JPEG_HEADER
+    stream.close()
+
+
+def test_missing_mime_detection_is_a_server_error(tmp_path):
+    stream = ValidatingUploadStream(str(tmp_path), "photo.jpg", sniff_as(None))
+    with pytest.raises(UploadRejected) as excinfo:
+        stream.write(b"\x00" * MIME_SNIFF_BYTES)
+    assert excinfo.value.status_code == 500
+    stream.close()
+
+
+def test_close_removes_the_temporary_file(tmp_path):
+    stream = ValidatingUploadStream(str(tmp_path), "photo.jpg", sniff_as("image/jpeg"))
+    stream.write(JPEG_HEADER)
+    assert os.path.exists(stream.path)
+    stream.close()
+    assert not os.path.exists(stream.path)
+    assert ingest_files(tmp_path) == []
+    # Closing twice is harmless
+    stream.close()
+
+
+def test_commit_moves_the_file_and_close_keeps_it(tmp_path):
+    stream = ValidatingUploadStream(str(tmp_path), "photo.jpg", sniff_as("image/jpeg"))
+    stream.write(JPEG_HEADER)
+    stream.seek(0)
+    destination = tmp_path / "ab" / "cd" / "photo.jpg"
+    stream.commit(str(destination))
+    stream.close()
+    assert destination.read_bytes() == JPEG_HEADER
+    assert ingest_files(tmp_path) == []
+
+
+@pytest.fixture
+def streaming_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(TESTING=True, STREAMING_UPLOADS=True, UPLOAD_FOLDER=str(tmp_path))
+    init_streaming_uploads(app, lambda header: "image/jpeg" if header.startswith(b"\xff\xd8\xff") else "text/plain")
+
+    @app.route("/upload", methods=["POST"], endpoint="upload_images")
+    def upload():
+        try:
+            files = request.files.getlist("files")
+        except UploadRejected as e:
+            return jsonify({"error": e.message}), e.status_code
+        return jsonify({"files": [f.filename for f in files]}), 200
+
+    return app
+
+
+def test_rejected_request_leaves_no_partial_files(streaming_app, tmp_path):
+    client = streaming_app.test_client()
+    response = client.post(
+        "/upload",
+        data={"files": [
+            (io.BytesIO(JPEG_HEADER * 200), "ok.jpg"),
+            (io.BytesIO(b"#!/bin/sh\n" * 400), "evil.jpg"),
+        ]},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 400
+    assert ingest_files(tmp_path) == []
+
+
+def test_accepted_request_cleans_up_uncommitted_files(streaming_app, tmp_path):
+    client = streaming_app.test_client()
+    response = client.post(
+        "/upload",
+        data={"files": [(io.BytesIO(JPEG_HEADER * 200), "ok.jpg")]},
+        content_type="multipart/form-data",
+    )
+    assert response.status_code == 200
+    assert response.get_json() == {"files": ["ok.jpg"]}
+    assert ingest_files(tmp_path) == []
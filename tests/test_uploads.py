@@ -0,0 +1,151 @@
+import hashlib
+import io
+import os
+from concurrent.futures import Future
+
+import pytest
+from bson import ObjectId
+from PIL import Image
+
+import app as app_module
+from config import Config
+from utils.content_store import blob_filename
+
+USER_ID = str(ObjectId())
+
+
+def png_bytes(color=(200, 120, 40)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def stored_name(data):
+    return blob_filename(hashlib.sha256(data).hexdigest(), "image/png")
+
+
+def stored_files(folder):
+    return sorted(name for _, _, names in os.walk(folder) for name in names)
+
+
+class InlineExecutor:
+    """Runs upload I/O in the request, so derivatives are done when the response arrives."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@pytest.fixture
+def upload(client, mongo, upload_folder, auth_headers, monkeypatch):
+    monkeypatch.setattr(app_module, "UPLOAD_IO_EXECUTOR", InlineExecutor())
+    headers = auth_headers(USER_ID)
+
+    def post(*payloads, **form):
+        data = {"title": "Bee", "description": "On a flower", **form}
+        if payloads:
+            data["files"] = [(io.BytesIO(payload), f"photo{i}.png") for i, payload in enumerate(payloads)]
+        return client.post("/api/user/upload", data=data, headers=headers, content_type="multipart/form-data")
+    return post
+
+
+@pytest.mark.parametrize("step", ["save_images", "save_notifications"])
+def test_failed_insert_rolls_back_blobs_files_and_audio(upload, mongo, upload_folder, monkeypatch, step):
+    def broken(*args):
+        raise RuntimeError("primary stepped down")
+
+    monkeypatch.setattr(app_module, step, broken)
+    response = upload(png_bytes(), audioData="data:audio/wav;base64,UklGRiQAAABXQVZFZm10IA==")
+
+    assert response.status_code == 500
+    assert mongo.blobs.count_documents({}) == 0
+    assert mongo.images.count_documents({}) == 0
+    assert stored_files(upload_folder) == []
+
+
+def test_failed_enqueue_rolls_back_the_upload(app, upload, mongo, upload_folder, monkeypatch):
+    def broken(jobs):
+        mongo.jobs.insert_many(jobs[:1])
+        raise RuntimeError("primary stepped down")
+
+    monkeypatch.setitem(app.config, "BACKGROUND_JOBS", True)
+    monkeypatch.setattr(app_module, "enqueue_jobs", broken)
+    response = upload(png_bytes())
+
+    assert response.status_code == 500
+    assert mongo.jobs.count_documents({}) == 0
+    assert mongo.blobs.count_documents({}) == 0
+    assert stored_files(upload_folder) == []
+
+
+def test_rollback_keeps_blobs_other_images_still_use(upload, mongo, upload_folder, monkeypatch):
+    data = png_bytes()
+    assert upload(data).status_code == 200
+
+    monkeypatch.setattr(app_module, "save_images", lambda *args: 1 / 0)
+    assert upload(data).status_code == 500
+
+    assert mongo.blobs.find_one({"_id": stored_name(data)})["refcount"] == 1
+    assert stored_name(data) in stored_files(upload_folder)
+
+
+def test_blob_is_unlinked_only_with_its_last_image(upload, client, auth_headers, mongo, upload_folder):
+    data = png_bytes()
+    assert upload(data).status_code == 200
+    assert upload(data).status_code == 200
+    assert mongo.blobs.find_one({"_id": stored_name(data)})["refcount"] == 2
+    assert stored_files(upload_folder).count(stored_name(data)) == 1
+
+    first, second = [image["_id"] for image in mongo.images.find({"filename": stored_name(data)})]
+    headers = auth_headers(USER_ID)
+    assert client.delete(f"/delete/{first}", headers=headers).status_code == 200
+    assert mongo.blobs.find_one({"_id": stored_name(data)})["refcount"] == 1
+    assert stored_name(data) in stored_files(upload_folder)
+
+    assert client.delete(f"/delete/{second}", headers=headers).status_code == 200
+    assert mongo.blobs.find_one({"_id": stored_name(data)}) is None
+    assert stored_files(upload_folder) == []
+
+
+def test_skipped_files_reference_the_blob_the_user_already_holds(upload, mongo, upload_folder):
+    data = png_bytes()
+    content_hash = hashlib.sha256(data).hexdigest()
+    assert upload(data).status_code == 200
+
+    response = upload(png_bytes((10, 20, 30)), existing_hashes=[content_hash, content_hash])
+    assert response.status_code == 200
+    assert mongo.images.count_documents({"filename": stored_name(data)}) == 3
+    assert mongo.blobs.find_one({"_id": stored_name(data)})["refcount"] == 3
+    originals = [name for name in stored_files(upload_folder) if name.endswith(".png")]
+    assert originals == sorted([stored_name(data), stored_name(png_bytes((10, 20, 30)))])
+
+
+def test_skipped_files_must_already_belong_to_the_user(upload, client, auth_headers, mongo):
+    data = png_bytes()
+    content_hash = hashlib.sha256(data).hexdigest()
+    headers = auth_headers(ObjectId())
+    client.post("/api/user/upload", data={
+        "title": "Bee", "description": "Someone else's", "files": [(io.BytesIO(data), "photo.png")],
+    }, headers=headers, content_type="multipart/form-data")
+
+    response = upload(existing_hashes=[content_hash])
+    assert response.status_code == 409
+    assert response.get_json()["missing"] == [content_hash]
+    assert mongo.blobs.find_one({"_id": stored_name(data)})["refcount"] == 1
+    assert upload(existing_hashes=["not-a-hash"]).status_code == 400
+
+
+def test_stored_names_cannot_be_computed_from_the_bytes(upload, upload_folder, monkeypatch):
+    data = png_bytes()
+    content_hash = hashlib.sha256(data).hexdigest()
+    assert upload(data).status_code == 200
+    name = stored_name(data)
+    assert name in stored_files(upload_folder)
+    assert not any(content_hash in stored for stored in stored_files(upload_folder))
+
+    monkeypatch.setattr(Config, "UPLOAD_NAME_KEY", "another deployment")
+    assert blob_filename(content_hash, "image/png") != name
@@ -0,0 +1,153 @@
+"""
+Admission control for upload endpoints.
+
+Each process admits at most UPLOAD_MAX_INFLIGHT_REQUESTS uploads and
+UPLOAD_MAX_INFLIGHT_BYTES of request bodies at a time, so a burst of uploads
+cannot occupy every worker thread and starve gallery reads. Uploads are also
+refused while UPLOAD_FOLDER is low on free space or, with background jobs, while
+the job queue is backed up. Rejections carry a Retry-After header: 429 when the
+process is busy, 503 when the host or the queue needs time to recover.
+"""
+import os
+import shutil
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+from config import Config
+from database.jobqueue import count_pending_jobs
+from utils.logger import Logger
+
+logger = Logger.get_logger("admission")
+
+# Queue depth is read from MongoDB at most this often
+QUEUE_DEPTH_CACHE_SECONDS = 5
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, message, status_code, retry_after):
+        self.reason = reason
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class UploadAdmissionController:
+    def __init__(self, upload_folder, max_inflight_requests, max_inflight_bytes,
+                 min_free_disk_bytes, max_queue_depth, retry_after_seconds):
+        self.upload_folder = upload_folder
+        self.max_inflight_requests = max_inflight_requests
+        self.max_inflight_bytes = max_inflight_bytes
+        self.min_free_disk_bytes = min_free_disk_bytes
+        self.max_queue_depth = max_queue_depth
+        self.retry_after_seconds = retry_after_seconds
+
+        self._lock = threading.Lock()
+        self.inflight_requests = 0
+        self.inflight_bytes = 0
+        self.admitted = 0
+        self.rejected = {}
+        self._queue_depth = None
+        self._queue_depth_checked_at = 0.0
+
+    def _free_disk_bytes(self):
+        path = os.path.abspath(self.upload_folder)
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    def _pending_jobs(self):
+        now = time.monotonic()
+        if self._queue_depth is None or now - self._queue_depth_checked_at > QUEUE_DEPTH_CACHE_SECONDS:
+            try:
+                self._queue_depth = count_pending_jobs()
+            except Exception as e:
+                # Do not fail uploads because the queue could not be counted
+                logger.warning(f"Could not read job queue depth: {e}")
+                self._queue_depth = 0
+            self._queue_depth_checked_at = now
+        return self._queue_depth
+
+    def _reject(self, reason, message, status_code):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise AdmissionRejected(reason, message, status_code, self.retry_after_seconds)
+
+    def admit(self, content_length, check_queue=False):
+        """Reserve capacity for a request body of `content_length` bytes."""
+        # Disk and queue checks run outside the lock; they only need to be roughly current
+        free_disk = self._free_disk_bytes()
+        queue_depth = self._pending_jobs() if check_queue and self.max_queue_depth else None
+
+        with self._lock:
+            if self.inflight_requests >= self.max_inflight_requests:
+                self._reject("requests", "Too many uploads in progress. Please retry shortly.", 429)
+            # A single body larger than the byte cap is still admitted when nothing else is in flight
+            if self.inflight_requests and self.inflight_bytes + content_length > self.max_inflight_bytes:
+                self._reject("bytes", "Too many uploads in progress. Please retry shortly.", 429)
+            if free_disk - self.inflight_bytes - content_length < self.min_free_disk_bytes:
+                self._reject("disk", "Uploads are temporarily unavailable: storage is almost full.", 503)
+            if queue_depth is not None and queue_depth >= self.max_queue_depth:
+                self._reject("queue", "Uploads are temporarily unavailable: processing is backed up.", 503)
+
+            self.inflight_requests += 1
+            self.inflight_bytes += content_length
+            self.admitted += 1
+
+    def release(self, content_length):
+        with self._lock:
+            self.inflight_requests -= 1
+            self.inflight_bytes -= content_length
+
+    def snapshot(self):
+        with self._lock:
+            state = {
+                "inflightRequests": self.inflight_requests,
+                "inflightBytes": self.inflight_bytes,
+                "maxInflightRequests": self.max_inflight_requests,
+                "maxInflightBytes": self.max_inflight_bytes,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+            }
+        state.update({
+            "freeDiskBytes": self._free_disk_bytes(),
+            "minFreeDiskBytes": self.min_free_disk_bytes,
+            "queueDepth": self._queue_depth,
+            "maxQueueDepth": self.max_queue_depth,
+            "pid": os.getpid(),
+        })
+        return state
+
+
+upload_admission = UploadAdmissionController(
+    Config.UPLOAD_FOLDER,
+    Config.UPLOAD_MAX_INFLIGHT_REQUESTS,
+    Config.UPLOAD_MAX_INFLIGHT_BYTES,
+    Config.UPLOAD_MIN_FREE_DISK_BYTES,
+    Config.UPLOAD_MAX_QUEUE_DEPTH,
+    Config.UPLOAD_RETRY_AFTER_SECONDS,
+)
+
+
+def admit_upload(f):
+    """Apply upload admission control before the request body is read."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        # Bodies without a Content-Length are assumed to be as large as allowed
+        content_length = request.content_length
+        if content_length is None:
+            content_length = current_app.config.get("MAX_CONTENT_LENGTH") or 0
+        try:
+            upload_admission.admit(content_length, check_queue=current_app.config["BACKGROUND_JOBS"])
+        except AdmissionRejected as e:
+            logger.warning(f"Upload rejected ({e.reason}): {e.message}")
+            response = jsonify({"error": e.message})
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response, e.status_code
+        try:
+            return f(*args, **kwargs)
+        finally:
+            upload_admission.release(content_length)
+    return decorated
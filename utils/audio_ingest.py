@@ -0,0 +1,134 @@
+"""
+Voice note ingest for the upload endpoint.
+
+Browser recordings arrive as a base64 data URL in the `audioData` form field.
+Instead of matching a regex over the whole payload and decoding it in one go,
+the header is parsed on its own and the base64 body is decoded in chunks
+straight into the destination file. The size limit is enforced as bytes are
+decoded and the container signature (WAV/Ogg/WebM) is checked on the first
+bytes, so only one chunk of decoded audio is held in memory at a time.
+"""
+import base64
+import binascii
+import os
+import shutil
+
+from utils.upload_stream import UploadRejected
+
+MAX_AUDIO_FILE_SIZE = 6 * 1024 * 1024
+
+# Base64 characters decoded per step; a multiple of 4 so chunks decode independently
+AUDIO_DECODE_CHUNK_CHARS = 64 * 1024
+
+# The "data:<mime>;base64," prefix is never longer than this
+MAX_DATA_URL_HEADER = 256
+
+AUDIO_SIGNATURE_BYTES = 12
+
+_WHITESPACE = str.maketrans("", "", " \t\r\n")
+
+# Container families by MIME type; Opus may come in either Ogg or WebM
+_AUDIO_CONTAINERS = {
+    "audio/wav": ("wav",),
+    "audio/x-wav": ("wav",),
+    "audio/ogg": ("ogg",),
+    "video/ogg": ("ogg",),
+    "application/ogg": ("ogg",),
+    "audio/opus": ("ogg", "webm"),
+    "audio/webm": ("webm",),
+    "video/webm": ("webm",),
+}
+
+
+def audio_size_error_message():
+    return f"Audio exceeds max size limit ({MAX_AUDIO_FILE_SIZE // (1024 * 1024)}MB)"
+
+
+def audio_signature_matches(mime_type, header):
+    """Check the leading bytes of an audio file against its declared container."""
+    for container in _AUDIO_CONTAINERS.get(mime_type, ()):
+        if container == "wav" and header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+            return True
+        if container == "ogg" and header[:4] == b"OggS":
+            return True
+        if container == "webm" and header[:4] == b"\x1a\x45\xdf\xa3":
+            return True
+    return False
+
+
+def parse_audio_data_url(audio_data, allowed_mime_types):
+    """
+    Parse the `data:<mime>[;params];base64,` header of a data URL.
+    Returns (base MIME type, offset of the base64 payload).
+    """
+    start = len(audio_data) - len(audio_data.lstrip())
+    comma = audio_data.find(",", start, start + MAX_DATA_URL_HEADER)
+    header = audio_data[start:comma] if comma != -1 else ""
+    if not header.startswith("data:") or not header.endswith(";base64"):
+        raise UploadRejected("Invalid audio data URL format")
+
+    base_mime = header[len("data:"):-len(";base64")].split(";")[0].strip().lower()
+    if base_mime not in allowed_mime_types:
+        raise UploadRejected("Unsupported audio MIME type")
+    return base_mime, comma + 1
+
+
+def write_audio_data_url(audio_data, offset, mime_type, path):
+    """
+    Decode the base64 payload of a data URL starting at `offset` into `path`.
+    The file is written under a temporary name and only renamed into place
+    once the whole payload has been validated.
+    """
+    # Cheap upper bound before decoding anything
+    if (len(audio_data) - offset) * 3 // 4 > MAX_AUDIO_FILE_SIZE:
+        raise UploadRejected(audio_size_error_message(), 413)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.part"
+    try:
+        with open(temp_path, "wb") as f:
+            size = 0
+            header = b""
+            pending = ""
+            for start in range(offset, len(audio_data), AUDIO_DECODE_CHUNK_CHARS):
+                pending += audio_data[start:start + AUDIO_DECODE_CHUNK_CHARS].translate(_WHITESPACE)
+                usable = len(pending) - len(pending) % 4
+                if not usable:
+                    continue
+                try:
+                    chunk = base64.b64decode(pending[:usable], validate=True)
+                except (binascii.Error, ValueError):
+                    raise UploadRejected("Audio data is not valid base64")
+                pending = pending[usable:]
+
+                size += len(chunk)
+                if size > MAX_AUDIO_FILE_SIZE:
+                    raise UploadRejected(audio_size_error_message(), 413)
+                if len(header) < AUDIO_SIGNATURE_BYTES:
+                    header += chunk[:AUDIO_SIGNATURE_BYTES - len(header)]
+                    if len(header) == AUDIO_SIGNATURE_BYTES and not audio_signature_matches(mime_type, header):
+                        raise UploadRejected("Audio content validation failed")
+                f.write(chunk)
+
+        if pending or not size:
+            raise UploadRejected("Audio data is not valid base64")
+        if len(header) < AUDIO_SIGNATURE_BYTES and not audio_signature_matches(mime_type, header):
+            raise UploadRejected("Audio content validation failed")
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def write_audio_file(stream, path):
+    """Copy an uploaded audio file into place in fixed-size chunks."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.part"
+    try:
+        stream.seek(0)
+        with open(temp_path, "wb") as f:
+            shutil.copyfileobj(stream, f)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
@@ -0,0 +1,192 @@
+"""
+Voice note normalization, run after upload by the audio job.
+
+With ffmpeg available every voice note is transcoded into a single mono Opus
+rendition (`<name>.opus`, Ogg container) with leading and trailing silence
+trimmed. Without ffmpeg, WAV recordings are still downmixed to mono 16-bit
+PCM and trimmed with the standard library into `<name>_mono.wav`; other
+containers are kept as sent. The rendition never overwrites the original,
+which stays served under its immutable URL until the images switch over.
+
+In both cases the duration and a compact waveform (WAVEFORM_PEAKS values in
+0-100) are computed so list endpoints can return them and the Gallery player
+can draw without downloading the audio.
+"""
+import array
+import os
+import shutil
+import subprocess
+import sys
+import wave
+
+from config import Config
+from utils.logger import Logger
+from utils.upload_paths import resolve_path
+
+logger = Logger.get_logger("audio_processing")
+
+FFMPEG = shutil.which(Config.FFMPEG_BINARY)
+if not FFMPEG:
+    logger.info("ffmpeg not found; voice notes will not be transcoded to Opus")
+
+# Sample rate used to analyse audio for peaks and duration
+ANALYSIS_SAMPLE_RATE = 8000
+
+# Samples below about -50 dBFS count as silence
+SILENCE_THRESHOLD = 100
+SILENCE_WINDOW_SECONDS = 0.01
+
+FFMPEG_TIMEOUT_SECONDS = 120
+
+
+def _trim_silence_filter():
+    # silenceremove only trims the start reliably, so trim, reverse, trim, reverse
+    trim = "silenceremove=start_periods=1:start_threshold=-50dB:start_silence=0.1"
+    return f"{trim},areverse,{trim},areverse"
+
+
+def _run_ffmpeg(args):
+    return subprocess.run(
+        [FFMPEG, "-nostdin", "-hide_banner", "-loglevel", "error", *args],
+        check=True,
+        capture_output=True,
+        timeout=FFMPEG_TIMEOUT_SECONDS,
+    )
+
+
+def _decode_pcm(path):
+    """Decode any input to mono signed 16-bit PCM at ANALYSIS_SAMPLE_RATE."""
+    result = _run_ffmpeg([
+        "-i", path, "-ac", "1", "-ar", str(ANALYSIS_SAMPLE_RATE), "-f", "s16le", "-",
+    ])
+    samples = array.array("h")
+    samples.frombytes(result.stdout[:len(result.stdout) - len(result.stdout) % 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples
+
+
+def waveform_peaks(samples, count=None):
+    """Peak amplitude per bucket, scaled to 0-100."""
+    count = count or Config.WAVEFORM_PEAKS
+    if not samples:
+        return []
+    bucket = max(1, len(samples) // count)
+    peaks = []
+    for start in range(0, len(samples), bucket):
+        window = samples[start:start + bucket]
+        peaks.append(max(max(window), -min(window)))
+    loudest = max(peaks) or 1
+    return [round(peak * 100 / loudest) for peak in peaks[:count]]
+
+
+def _transcode_to_opus(source_path, output_path):
+    temp_path = f"{output_path}.part"
+    try:
+        _run_ffmpeg([
+            "-y", "-i", source_path, "-vn", "-ac", "1",
+            "-af", _trim_silence_filter(),
+            "-c:a", "libopus", "-b:a", Config.AUDIO_OPUS_BITRATE, "-application", "voip",
+            "-f", "ogg", temp_path,
+        ])
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _read_wav_mono(path):
+    """Read a 16-bit PCM WAV as mono samples. Returns (samples, sample rate) or None."""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getcomptype() != "NONE":
+            return None
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        samples = array.array("h")
+        samples.frombytes(wav.readframes(wav.getnframes()))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    if channels > 1:
+        # Keep the first channel; browser recordings are dual mono
+        samples = samples[::channels]
+    return samples, sample_rate
+
+
+def _trim_samples(samples, sample_rate):
+    window = max(1, int(sample_rate * SILENCE_WINDOW_SECONDS))
+    starts = range(0, len(samples), window)
+    loud = [
+        start for start in starts
+        if max(samples[start:start + window]) > SILENCE_THRESHOLD
+        or -min(samples[start:start + window]) > SILENCE_THRESHOLD
+    ]
+    if not loud:
+        return samples
+    return samples[loud[0]:loud[-1] + window]
+
+
+def _normalize_wav(source_path, output_path):
+    decoded = _read_wav_mono(source_path)
+    if decoded is None:
+        return None
+    samples, sample_rate = decoded
+    samples = _trim_samples(samples, sample_rate)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    temp_path = f"{output_path}.part"
+    try:
+        with wave.open(temp_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(samples.tobytes())
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples, sample_rate
+
+
+def rendition_filename(audio_filename, ext):
+    """Name of the `ext` rendition of a voice note, never the name of the original."""
+    stem, original_ext = os.path.splitext(audio_filename)
+    if original_ext.lower() == ext:
+        return f"{stem}_mono{ext}"
+    return f"{stem}{ext}"
+
+
+def normalize_voice_note(upload_folder, audio_filename):
+    """
+    Write the normalized rendition of a voice note next to it.
+    Returns {"filename", "duration", "peaks"} or None when the audio cannot
+    be processed on this host. The original file is left in place.
+    """
+    source_path = resolve_path(upload_folder, audio_filename)
+    ext = os.path.splitext(audio_filename)[1].lower()
+
+    if FFMPEG:
+        filename = rendition_filename(audio_filename, ".opus")
+    elif ext == ".wav":
+        filename = rendition_filename(audio_filename, ".wav")
+    else:
+        return None
+    output_path = resolve_path(upload_folder, filename)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    if FFMPEG:
+        _transcode_to_opus(source_path, output_path)
+        samples = _decode_pcm(output_path)
+        sample_rate = ANALYSIS_SAMPLE_RATE
+    else:
+        decoded = _normalize_wav(source_path, output_path)
+        if decoded is None:
+            return None
+        samples, sample_rate = decoded
+
+    return {
+        "filename": filename,
+        "duration": round(len(samples) / sample_rate, 2),
+        "peaks": waveform_peaks(samples),
+    }
@@ -0,0 +1,72 @@
+"""
+Content-addressed naming for uploaded media.
+
+Identical bytes share one file in UPLOAD_FOLDER. The file is not named after
+its SHA-256, which anyone holding the bytes can compute, but after an HMAC
+of it keyed with UPLOAD_NAME_KEY: `<hmac>.<ext>`. Originals are served
+without authentication, so a plain hash would let anyone probe whether a
+known file was uploaded. The SHA-256 itself is only kept in the database
+for deduplication. The extension is derived from the detected MIME type,
+not the client filename, so the same bytes always map to the same name.
+
+Changing the key only affects new uploads: their names no longer match the
+files stored under the old key, so those bytes are stored again once.
+"""
+import hashlib
+import hmac
+import re
+
+from config import Config
+
+MIME_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/heif": "heif",
+    "image/heic": "heif",
+    "image/avif": "avif",
+    "application/pdf": "pdf",
+}
+
+HASH_READ_SIZE = 1024 * 1024
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def new_content_hash():
+    return hashlib.sha256()
+
+
+def hash_stream(stream):
+    """Return the SHA-256 hex digest of a seekable stream and rewind it."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_READ_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hash_stream(f)
+
+
+def _name_key():
+    if Config.UPLOAD_NAME_KEY:
+        return Config.UPLOAD_NAME_KEY.encode()
+    return hmac.new(Config.JWT_SECRET.encode(), b"upload-names", hashlib.sha256).digest()
+
+
+def blob_name(content_hash):
+    """Public name stem of the blob with SHA-256 `content_hash`."""
+    return hmac.new(_name_key(), content_hash.encode(), hashlib.sha256).hexdigest()
+
+
+def blob_filename(content_hash, mime_type):
+    return f"{blob_name(content_hash)}.{MIME_EXTENSIONS[mime_type]}"
+
+
+def is_content_hash(value):
+    return isinstance(value, str) and bool(SHA256_RE.match(value))
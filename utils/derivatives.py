@@ -0,0 +1,236 @@
+"""
+Responsive image derivatives for uploaded media.
+
+At ingest every image (and the thumbnail of every PDF) is resized into a
+small set of derivatives, e.g. 256 px and 1024 px, each encoded as WebP, AVIF
+when the installed Pillow can write it, and a JPEG fallback. Derivatives live
+in UPLOAD_FOLDER/derivatives/<shard>/ and are named after the stored file, so
+content-addressed uploads share them.
+
+HEIF/HEIC (and AVIF on older Pillow) originals are decoded through the
+optional pillow-heif plugin when it is installed.
+"""
+import os
+import re
+import warnings
+
+from PIL import Image, ImageOps
+
+from utils.logger import Logger
+from utils.thumbnails import THUMBNAILS_DIRNAME, thumbnail_name, thumbnail_path
+from utils.media_storage import delete_file, fetch_file, get_storage, media_url
+from utils.upload_paths import resolve_path, upload_url
+
+logger = Logger.get_logger("derivatives")
+
+try:
+    import pillow_heif
+
+    pillow_heif.register_heif_opener()
+    if hasattr(pillow_heif, "register_avif_opener"):
+        pillow_heif.register_avif_opener()
+    HEIF_SUPPORTED = True
+except ImportError:
+    HEIF_SUPPORTED = False
+    logger.info("pillow-heif not installed; HEIF/HEIC derivatives are disabled")
+
+DERIVATIVES_DIRNAME = "derivatives"
+
+# Longest edge in pixels for each derivative
+DERIVATIVE_SIZES = (256, 1024)
+
+# Refuse to decode images larger than this many pixels (decompression bombs)
+MAX_SOURCE_PIXELS = 64 * 1024 * 1024
+
+_FORMAT_OPTIONS = {
+    "avif": ("AVIF", {"quality": 55}),
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def _can_write(pil_format):
+    Image.init()
+    return pil_format in Image.SAVE
+
+
+# Pillow >= 11.2 (or pillow-heif's AVIF plugin) is needed to encode AVIF
+AVIF_SUPPORTED = _can_write("AVIF")
+
+
+def derivative_formats():
+    """Formats produced for every derivative, most compact first."""
+    formats = ["webp", "jpg"]
+    if AVIF_SUPPORTED:
+        formats.insert(0, "avif")
+    return formats
+
+
+def derivative_filename(filename, size, fmt):
+    stem, _ = os.path.splitext(filename)
+    return f"{stem}_{size}.{fmt}"
+
+
+_DERIVED_NAME_RE = re.compile(r"^(?P<stem>.+)_(?:\d+|pages)\.[a-z0-9]+$")
+
+
+def derived_file_owner(area, name):
+    """
+    Stem of the upload a thumbnail or derivative was made from: `<stem>.jpg`
+    and `<stem>_pages.jpg` in thumbnails/, `<stem>_<size>.<fmt>` in derivatives/.
+    """
+    if area == THUMBNAILS_DIRNAME and not name.endswith("_pages.jpg"):
+        return os.path.splitext(name)[0]
+    match = _DERIVED_NAME_RE.match(name)
+    return match.group("stem") if match else os.path.splitext(name)[0]
+
+
+def derivative_path(upload_folder, filename, size, fmt):
+    return resolve_path(
+        upload_folder, filename, DERIVATIVES_DIRNAME, derivative_filename(filename, size, fmt)
+    )
+
+
+def derivative_source_path(upload_folder, filename):
+    """Derivatives of a PDF are rendered from its first-page thumbnail."""
+    if filename.lower().endswith(".pdf"):
+        return thumbnail_path(upload_folder, filename)
+    return resolve_path(upload_folder, filename)
+
+
+def fetch_derivative_source(upload_folder, filename):
+    """Like derivative_source_path, downloading the source when this node has no copy."""
+    if filename.lower().endswith(".pdf"):
+        return fetch_file(upload_folder, filename, THUMBNAILS_DIRNAME, thumbnail_name(filename))
+    return fetch_file(upload_folder, filename)
+
+
+def _open_bounded(source_path, target_size):
+    """
+    Open an image with decompression-bomb protection and, for JPEG sources,
+    draft-mode decoding at the smallest DCT scale that still covers `target_size`.
+    """
+    image = Image.open(source_path)
+    width, height = image.size
+    if width * height > MAX_SOURCE_PIXELS:
+        image.close()
+        raise ValueError(
+            f"Image '{os.path.basename(source_path)}' is {width}x{height}, above the "
+            f"{MAX_SOURCE_PIXELS} pixel limit"
+        )
+    if image.format == "JPEG":
+        image.draft("RGB", (target_size, target_size))
+    return image
+
+
+def generate_derivatives(upload_folder, filename):
+    """
+    Create the derivatives for a stored upload. Existing files are reused.
+    Returns {size: {format: derivative filename}} or {} when the source
+    cannot be decoded.
+    """
+    source_path = derivative_source_path(upload_folder, filename)
+    if not os.path.exists(source_path):
+        return {}
+
+    formats = derivative_formats()
+    derivatives = {
+        str(size): {fmt: derivative_filename(filename, size, fmt) for fmt in formats}
+        for size in DERIVATIVE_SIZES
+    }
+    if all(
+        os.path.exists(derivative_path(upload_folder, filename, size, fmt))
+        for size in DERIVATIVE_SIZES
+        for fmt in formats
+    ):
+        return derivatives
+
+    for directory in {
+        os.path.dirname(derivative_path(upload_folder, filename, size, fmt))
+        for size in DERIVATIVE_SIZES
+        for fmt in formats
+    }:
+        os.makedirs(directory, exist_ok=True)
+    try:
+        with warnings.catch_warnings():
+            # Pillow only warns between MAX_IMAGE_PIXELS and twice that; treat it as fatal
+            warnings.simplefilter("error", Image.DecompressionBombWarning)
+            with _open_bounded(source_path, max(DERIVATIVE_SIZES)) as image:
+                image = ImageOps.exif_transpose(image)
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+                # Resize from the largest derivative down so each step works on fewer pixels
+                current = image
+                for size in sorted(DERIVATIVE_SIZES, reverse=True):
+                    resized = current.copy()
+                    resized.thumbnail((size, size), Image.LANCZOS)
+                    for fmt in formats:
+                        _save_derivative(
+                            resized, derivative_path(upload_folder, filename, size, fmt), fmt
+                        )
+                    current = resized
+    except (OSError, ValueError, Image.DecompressionBombError, Image.DecompressionBombWarning) as e:
+        logger.error(f"Failed to generate derivatives for '{filename}': {e}")
+        return {}
+
+    return derivatives
+
+
+def render_resized(source_path, width, height, fmt, destination):
+    """
+    Resize `source_path` to fit within width x height (either may be None)
+    without upscaling, and write it to `destination` as `fmt`.
+    """
+    bound = max(width or 0, height or 0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+        with _open_bounded(source_path, bound) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            image.thumbnail((width or image.width, height or image.height), Image.LANCZOS)
+            _encode(image, destination, fmt)
+
+
+def _encode(image, path, fmt):
+    pil_format, options = _FORMAT_OPTIONS[fmt]
+    if pil_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(path, pil_format, **options)
+
+
+def _save_derivative(image, path, fmt):
+    temp_path = f"{path}.part"
+    _encode(image, temp_path, fmt)
+    os.replace(temp_path, path)
+
+
+def remove_derivatives(upload_folder, filename):
+    for size in DERIVATIVE_SIZES:
+        for fmt in _FORMAT_OPTIONS:
+            delete_file(
+                upload_folder, filename, DERIVATIVES_DIRNAME, derivative_filename(filename, size, fmt)
+            )
+
+
+def derivative_urls(upload_folder, filename, derivatives):
+    """Turn stored derivative filenames into URLs for API responses."""
+    if not derivatives:
+        return {}
+    if get_storage().remote:
+        # Presigned URLs are signed per object
+        return {
+            size: {
+                fmt: media_url(upload_folder, filename, DERIVATIVES_DIRNAME, name)
+                for fmt, name in formats.items()
+            }
+            for size, formats in derivatives.items()
+        }
+    # All derivatives of a file share one directory, so resolve it once
+    first = next(name for formats in derivatives.values() for name in formats.values())
+    directory = os.path.dirname(upload_url(upload_folder, filename, DERIVATIVES_DIRNAME, first))
+    return {
+        size: {fmt: f"{directory}/{name}" for fmt, name in formats.items()}
+        for size, formats in derivatives.items()
+    }
@@ -0,0 +1,135 @@
+"""
+Size-capped disk cache for on-demand image resizes.
+
+Entries are files in a single directory named after a hash of the cache key.
+The LRU order is kept in memory and seeded from file access times at start-up,
+so a restarted process keeps evicting the least recently served resizes first.
+Once the total size exceeds `max_bytes` the oldest entries are removed.
+
+The byte cap and LRU order are per process: each worker sharing the directory
+tracks only the entries it has seen, so with N workers the directory can grow
+to about N times `max_bytes`.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from utils.logger import Logger
+
+logger = Logger.get_logger("media_cache")
+
+
+class ResizeCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # name -> size, least recently used first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}  # name -> [lock, number of threads holding or waiting for it]
+        self._loaded = False
+
+    @staticmethod
+    def key_for(*parts):
+        return hashlib.sha256(":".join(str(part) for part in parts).encode()).hexdigest()
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name.endswith(".part"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._loaded = True
+
+    def path_for(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        """Return the path of a cached entry and mark it recently used, or None."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        path = self.path_for(name)
+        try:
+            # Record the access on disk so the LRU order survives restarts
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            self._forget(name)
+            return None
+        return path
+
+    def get_or_create(self, name, render):
+        """
+        Return the path for `name`, calling `render(temp_path)` to produce it
+        on a miss. Concurrent misses for the same entry render it once.
+        """
+        path = self.get(name)
+        if path:
+            return path
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(name, [threading.Lock(), 0])
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                path = self.get(name)
+                if path:
+                    return path
+                path = self.path_for(name)
+                if not os.path.exists(path):
+                    # Not rendered yet by this or another process sharing the directory
+                    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+                    try:
+                        render(temp_path)
+                        os.replace(temp_path, path)
+                    finally:
+                        if os.path.exists(temp_path):
+                            os.remove(temp_path)
+                self._add(name, os.path.getsize(path))
+                return path
+        finally:
+            with self._lock:
+                # Only the last waiter drops the lock, so later misses never get a second one
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    del self._key_locks[name]
+
+    def _add(self, name, size):
+        with self._lock:
+            if name in self._entries:
+                self._total_bytes -= self._entries.pop(name)
+            self._entries[name] = size
+            self._total_bytes += size
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_name, old_size = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(self.path_for(old_name))
+            except FileNotFoundError:
+                pass
+        if evicted:
+            logger.info(f"Evicted {len(evicted)} resized images from the media cache")
+
+    def _forget(self, name):
+        with self._lock:
+            size = self._entries.pop(name, None)
+            if size is not None:
+                self._total_bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
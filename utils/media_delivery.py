@@ -0,0 +1,88 @@
+"""
+Sending stored media from authorized views.
+
+Views check access first and then hand the file to `send_media`. By default
+Flask streams the bytes itself, which keeps a worker busy for the whole
+download. With MEDIA_OFFLOAD the response only names the file and the front
+proxy sends it:
+
+- `x-accel-redirect` (nginx): `X-Accel-Redirect: <MEDIA_OFFLOAD_PREFIX>/<location>/<relpath>`.
+  Each location needs an `internal` nginx location aliasing its directory,
+  e.g. `location /_protected/uploads/ { internal; alias /app/static/uploads/; }`.
+- `x-sendfile` (Apache mod_xsendfile, lighttpd): Flask's USE_X_SENDFILE,
+  which sends the absolute path in `X-Sendfile`.
+
+Stored files never change once written (names are content hashes or carry a
+unique id), so responses are cacheable for MEDIA_MAX_AGE_SECONDS and marked
+immutable. Flask answers Range requests with 206 and If-None-Match with 304
+against a strong ETag; content-addressed files use their hash as the ETag.
+"""
+import mimetypes
+import os
+import time
+from urllib.parse import quote
+
+from flask import Response, current_app, send_from_directory
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+from config import Config
+from utils.content_store import is_content_hash
+
+OFFLOAD_OFF = "off"
+OFFLOAD_X_ACCEL = "x-accel-redirect"
+OFFLOAD_X_SENDFILE = "x-sendfile"
+OFFLOAD_MODES = (OFFLOAD_OFF, OFFLOAD_X_ACCEL, OFFLOAD_X_SENDFILE)
+
+# Internal locations the proxy maps to directories (see the module docstring)
+UPLOADS_LOCATION = "uploads"
+MEDIA_CACHE_LOCATION = "media-cache"
+
+
+def cache_media_response(response, private=True):
+    """Long-lived caching for a response carrying a stored (never changing) file."""
+    response.cache_control.no_cache = None
+    response.cache_control.public = not private or None
+    response.cache_control.private = private or None
+    max_age = current_app.config["MEDIA_MAX_AGE_SECONDS"]
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    response.expires = int(time.time() + max_age)
+    if response.status_code == 200 and "X-Accel-Redirect" not in response.headers:
+        # Werkzeug only advertises ranges when answering one; media players look for it up front
+        response.accept_ranges = "bytes"
+    return response
+
+
+def _etag(relpath):
+    stem = os.path.splitext(os.path.basename(relpath))[0]
+    # Content-addressed files already carry a strong validator in their name
+    return stem if is_content_hash(stem) else True
+
+
+def _accel_redirect(directory, relpath, location, mimetype):
+    path = safe_join(directory, relpath)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    uri = "/".join([Config.MEDIA_OFFLOAD_PREFIX.rstrip("/"), location, relpath.replace(os.sep, "/")])
+    response = Response(
+        mimetype=mimetype or mimetypes.guess_type(relpath)[0] or "application/octet-stream"
+    )
+    response.headers["X-Accel-Redirect"] = quote(uri)
+    return response
+
+
+def send_media(directory, relpath, location, mimetype=None, private=True):
+    """
+    Response for the file at `relpath` inside `directory`, offloaded to the
+    proxy's `location` when MEDIA_OFFLOAD is enabled. Raises NotFound when
+    the file does not exist.
+    """
+    if current_app.config["MEDIA_OFFLOAD"] == OFFLOAD_X_ACCEL:
+        # nginx handles Range and validators for the file it sends; only the caching headers pass through
+        return cache_media_response(_accel_redirect(directory, relpath, location, mimetype), private)
+    # With x-sendfile Flask itself swaps the body for the header (USE_X_SENDFILE)
+    response = send_from_directory(
+        directory, relpath, mimetype=mimetype, etag=_etag(relpath), conditional=True
+    )
+    return cache_media_response(response, private)
@@ -0,0 +1,83 @@
+"""
+HMAC-signed, expiring URLs for authorized media.
+
+List endpoints hand out `/api/audio/<filename>?uid=&exp=&kid=&sig=` URLs.
+The signature covers the filename, the owner and the expiry, so the media
+view can serve a signed request without looking the file up in MongoDB or
+checking a JWT.
+
+Keys come from MEDIA_URL_SIGNING_KEYS as `kid:secret` pairs. The first key
+signs; every listed key verifies. To rotate, put a new key first and drop
+the old one after MEDIA_URL_TTL_SECONDS. Without configured keys a key is
+derived from JWT_SECRET.
+
+Expiries are rounded up to a bucket of half the TTL, so listing the same
+gallery twice returns identical URLs and cached responses stay usable.
+"""
+import hashlib
+import hmac
+import math
+import time
+from urllib.parse import urlencode
+
+from config import Config
+
+DERIVED_KEY_ID = "jwt"
+
+
+def _signing_keys():
+    """Ordered {kid: secret bytes}; the first entry signs."""
+    keys = {}
+    for entry in Config.MEDIA_URL_SIGNING_KEYS:
+        kid, _, secret = entry.partition(":")
+        if kid and secret:
+            keys[kid] = secret.encode()
+    if not keys:
+        derived = hmac.new(
+            Config.JWT_SECRET.encode(), b"media-url-signing", hashlib.sha256
+        ).digest()
+        keys[DERIVED_KEY_ID] = derived
+    return keys
+
+
+def _signature(secret, path, owner_id, expires):
+    message = f"{path}\n{owner_id}\n{expires}".encode()
+    return hmac.new(secret, message, hashlib.sha256).hexdigest()
+
+
+def _expiry(ttl, now=None):
+    now = time.time() if now is None else now
+    bucket = max(1, ttl // 2)
+    return int(math.ceil((now + ttl) / bucket) * bucket)
+
+
+def sign_media_path(path, owner_id, ttl=None):
+    """Signed URL for `path` (e.g. /api/audio/<filename>) owned by `owner_id`."""
+    ttl = ttl or Config.MEDIA_URL_TTL_SECONDS
+    kid, secret = next(iter(_signing_keys().items()))
+    expires = _expiry(ttl)
+    query = urlencode({
+        "uid": owner_id,
+        "exp": expires,
+        "kid": kid,
+        "sig": _signature(secret, path, owner_id, expires),
+    })
+    return f"{path}?{query}"
+
+
+def verify_media_signature(path, args):
+    """
+    True when `args` (the request's query parameters) carry a valid,
+    unexpired signature for `path`.
+    """
+    secret = _signing_keys().get(args.get("kid", ""))
+    if secret is None:
+        return False
+    try:
+        expires = int(args.get("exp", ""))
+    except ValueError:
+        return False
+    if expires < time.time():
+        return False
+    expected = _signature(secret, path, args.get("uid", ""), expires)
+    return hmac.compare_digest(expected, args.get("sig", ""))
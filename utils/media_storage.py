@@ -0,0 +1,268 @@
+"""
+Storage backends for uploaded media.
+
+Uploads are always ingested, validated and processed (thumbnails,
+derivatives, voice notes) in UPLOAD_FOLDER. The storage backend decides where
+the results live and how they are served:
+
+- `local` (default): UPLOAD_FOLDER is the store and files are served by
+  Flask's static route. Nothing is copied.
+- `s3`: an S3-compatible bucket (AWS S3, MinIO, ...). Stored files are
+  published to the bucket under the same relative key as in the sharded
+  layout, served with presigned GET URLs, and browsers can PUT new uploads
+  straight into the bucket with presigned URLs. UPLOAD_FOLDER is then only a
+  working copy, refilled from the bucket when a worker on another node needs
+  a file. This backend needs the optional boto3 package.
+"""
+import base64
+import mimetypes
+import os
+import threading
+
+from config import Config
+from utils.logger import Logger
+from utils.upload_paths import remove_stored_file, resolve_path, sharded_relpath, upload_url
+
+logger = Logger.get_logger("media_storage")
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+
+def storage_key(filename, area="", name=None):
+    """Object key of a stored file: its sharded path with forward slashes."""
+    return sharded_relpath(filename, area, name).replace(os.sep, "/")
+
+
+def _content_type(key):
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+class LocalStorage:
+    """UPLOAD_FOLDER itself is the store."""
+
+    remote = False
+
+    def __init__(self, upload_folder):
+        self.upload_folder = upload_folder
+
+    def _path(self, key):
+        return os.path.join(self.upload_folder, *key.split("/"))
+
+    def put_file(self, path, key):
+        pass
+
+    def get_file(self, key, path):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def head(self, key):
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            return None
+
+    def checksum_sha256(self, key):
+        return None
+
+    def read_range(self, key, length):
+        with open(self._path(key), "rb") as f:
+            return f.read(length)
+
+    def url(self, key, expires=None):
+        return f"/static/uploads/{key}"
+
+
+class S3Storage:
+    """S3-compatible bucket accessed with boto3."""
+
+    remote = True
+
+    def __init__(self, bucket, prefix="", endpoint_url=None, region=None,
+                 access_key_id=None, secret_access_key=None, addressing_style="auto",
+                 presign_expires=900, max_connections=10):
+        if boto3 is None:
+            raise RuntimeError("MEDIA_STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.presign_expires = presign_expires
+        # boto3 clients are thread-safe; one client serves every request and worker thread
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+            config=BotoConfig(
+                signature_version="s3v4",
+                s3={"addressing_style": addressing_style},
+                max_pool_connections=max_connections,
+            ),
+        )
+
+    def _key(self, key):
+        return f"{self.prefix}{key}"
+
+    @staticmethod
+    def _not_found(error):
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put_file(self, path, key):
+        self.client.upload_file(
+            path, self.bucket, self._key(key), ExtraArgs={"ContentType": _content_type(key)}
+        )
+
+    def get_file(self, key, path):
+        """Download an object to `path`. Returns False when it does not exist."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            self.client.download_file(self.bucket, self._key(key), temp_path)
+            os.replace(temp_path, path)
+            return True
+        except ClientError as e:
+            if self._not_found(e):
+                return False
+            raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def delete(self, key):
+        # Deleting a missing key succeeds
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def _head(self, key, **kwargs):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key), **kwargs)
+        except ClientError as e:
+            if self._not_found(e):
+                return None
+            raise
+
+    def head(self, key):
+        """Size of an object in bytes, or None when it does not exist."""
+        response = self._head(key)
+        return response["ContentLength"] if response else None
+
+    def checksum_sha256(self, key):
+        """Hex SHA-256 the bucket verified on upload, or None when it was stored without one."""
+        response = self._head(key, ChecksumMode="ENABLED")
+        checksum = (response or {}).get("ChecksumSHA256")
+        if not checksum or "-" in checksum:
+            # Multipart checksums are composite and cannot be compared to a content hash
+            return None
+        return base64.b64decode(checksum).hex()
+
+    def read_range(self, key, length):
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self._key(key), Range=f"bytes=0-{length - 1}"
+        )
+        return response["Body"].read()
+
+    def url(self, key, expires=None):
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=expires or self.presign_expires,
+        )
+
+    def presigned_put(self, key, content_type, checksum_sha256=None, expires=None):
+        """
+        Presigned PUT for a browser upload. Returns {url, method, headers};
+        the client must send exactly these headers. With `checksum_sha256`
+        (hex) the bucket rejects bytes that do not match it.
+        """
+        params = {"Bucket": self.bucket, "Key": self._key(key), "ContentType": content_type}
+        headers = {"Content-Type": content_type}
+        if checksum_sha256:
+            encoded = base64.b64encode(bytes.fromhex(checksum_sha256)).decode("ascii")
+            params["ChecksumSHA256"] = encoded
+            headers["x-amz-checksum-sha256"] = encoded
+        url = self.client.generate_presigned_url(
+            "put_object", Params=params, ExpiresIn=expires or self.presign_expires
+        )
+        return {"url": url, "method": "PUT", "headers": headers}
+
+
+def create_storage():
+    backend = Config.MEDIA_STORAGE_BACKEND
+    if backend == "s3":
+        return S3Storage(
+            Config.S3_BUCKET,
+            prefix=Config.S3_KEY_PREFIX,
+            endpoint_url=Config.S3_ENDPOINT_URL,
+            region=Config.S3_REGION,
+            access_key_id=Config.S3_ACCESS_KEY_ID,
+            secret_access_key=Config.S3_SECRET_ACCESS_KEY,
+            addressing_style=Config.S3_ADDRESSING_STYLE,
+            presign_expires=Config.S3_PRESIGN_EXPIRES_SECONDS,
+        )
+    if backend != "local":
+        raise ValueError(f"Unknown MEDIA_STORAGE_BACKEND '{backend}'")
+    return LocalStorage(Config.UPLOAD_FOLDER)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """The configured backend, created on first use."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage()
+    return _storage
+
+
+def media_url(upload_folder, filename, area="", name=None):
+    """URL clients use to fetch a stored file."""
+    storage = get_storage()
+    if storage.remote:
+        return storage.url(storage_key(filename, area, name))
+    return upload_url(upload_folder, filename, area, name)
+
+
+def publish_file(upload_folder, filename, area="", name=None):
+    """Copy a file written to UPLOAD_FOLDER to the storage backend. Returns False if it is missing."""
+    storage = get_storage()
+    if not storage.remote:
+        return True
+    path = resolve_path(upload_folder, filename, area, name)
+    if not os.path.exists(path):
+        return False
+    storage.put_file(path, storage_key(filename, area, name))
+    return True
+
+
+def fetch_file(upload_folder, filename, area="", name=None):
+    """
+    Local path of a stored file, downloading it from the storage backend when
+    this node does not have a working copy. Returns None when it does not exist.
+    """
+    path = resolve_path(upload_folder, filename, area, name)
+    if os.path.exists(path):
+        return path
+    storage = get_storage()
+    if storage.remote and storage.get_file(storage_key(filename, area, name), path):
+        return path
+    return None
+
+
+def delete_file(upload_folder, filename, area="", name=None):
+    """Remove a stored file from UPLOAD_FOLDER (both layouts) and the storage backend."""
+    remove_stored_file(upload_folder, filename, area, name)
+    storage = get_storage()
+    if storage.remote:
+        storage.delete(storage_key(filename, area, name))
@@ -0,0 +1,103 @@
+"""
+Thread-safe MIME detection for uploads.
+
+libmagic handles are not safe to share between threads, so each thread gets
+its own `magic.Magic` lazily. Before touching libmagic at all, the header is
+matched against a small signature table covering the formats uploads accept
+(JPEG, PNG, GIF, WebP, PDF, AVIF/HEIF, WAV, Ogg, WebM). The table returns the
+same MIME strings libmagic does, so only unknown headers pay for a libmagic
+call.
+"""
+import threading
+
+import magic
+
+from utils.logger import Logger
+
+logger = Logger.get_logger("mime_sniffer")
+
+# ISO-BMFF major brands, as classified by libmagic
+_FTYP_BRANDS = {
+    b"avif": "image/avif",
+    b"avis": "image/avif",
+    b"heic": "image/heic",
+    b"heix": "image/heic",
+    b"hevc": "image/heic-sequence",
+    b"hevx": "image/heic-sequence",
+    b"mif1": "image/heif",
+    b"msf1": "image/heif-sequence",
+}
+
+_EBML_MAGIC = b"\x1a\x45\xdf\xa3"
+
+
+def sniff_signature(header):
+    """Return the MIME type of a known signature, or None to defer to libmagic."""
+    if header[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF":
+        if header[8:12] == b"WEBP":
+            return "image/webp"
+        if header[8:12] == b"WAVE":
+            return "audio/x-wav"
+        return None
+    if header[:5] == b"%PDF-":
+        return "application/pdf"
+    if header[4:8] == b"ftyp":
+        return _FTYP_BRANDS.get(header[8:12])
+    if header[:4] == b"OggS":
+        # Only audio codecs; Ogg video and other streams go to libmagic
+        if header[28:36] == b"OpusHead" or header[28:35] == b"\x01vorbis":
+            return "audio/ogg"
+        return None
+    if header[:4] == _EBML_MAGIC:
+        # The EBML DocType sits within the first few dozen bytes of the header
+        if b"\x42\x82\x84webm" in header[:64]:
+            return "video/webm"
+        return None
+    return None
+
+
+class MimeDetector:
+    """Signature fast path backed by one libmagic handle per thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._unavailable = False
+
+    def _magic(self):
+        handle = getattr(self._local, "magic", None)
+        if handle is None and not self._unavailable:
+            try:
+                handle = self._local.magic = magic.Magic(mime=True)
+            except Exception as e:
+                # Only log once; libmagic will not start working later in this process
+                self._unavailable = True
+                logger.error(
+                    "MIME detection unavailable: libmagic missing or misconfigured. Install "
+                    "system libmagic (e.g., `apt-get install libmagic1`) and python-magic. Error: %s",
+                    e,
+                )
+        return handle
+
+    def from_buffer(self, header):
+        """
+        Return the MIME type of `header`, or None when the header is not a
+        known signature and libmagic cannot be initialized.
+        """
+        mime_type = sniff_signature(header)
+        if mime_type is not None:
+            return mime_type
+        handle = self._magic()
+        return handle.from_buffer(header) if handle is not None else None
+
+
+mime_detector = MimeDetector()
+
+
+def detect_mime(header):
+    return mime_detector.from_buffer(header)
@@ -0,0 +1,91 @@
+"""
+In-process cache of media owners for authorization checks.
+
+Playing a voice note sends several requests (range requests, replays), and
+each one needs the owner of the file. Owners never change, so the owner
+`user_id` of each filename is kept in a per-process LRU with a TTL. Only
+found owners are cached: a file that is not referenced yet is looked up
+again on the next request.
+
+Deletes, edits and voice note renditions invalidate their entries in the
+process that made the change. Other processes (worker.py, further app
+workers) may serve a stale owner for at most MEDIA_OWNER_CACHE_TTL_SECONDS.
+This is harmless because a deleted file is gone from disk anyway.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config import Config
+
+
+class OwnershipCache:
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # filename -> (owner id, expires at), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_owner(self, filename, load_owner):
+        """
+        Owner of `filename`, from the cache or `load_owner(filename)` (which
+        returns None when no image references the file).
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(filename)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[filename]
+            self.misses += 1
+
+        owner_id = load_owner(filename)
+        if owner_id is None or self.max_entries <= 0:
+            return owner_id
+        with self._lock:
+            self._entries[filename] = (owner_id, now + self.ttl_seconds)
+            self._entries.move_to_end(filename)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return owner_id
+
+    def invalidate(self, *filenames):
+        with self._lock:
+            for filename in filenames:
+                if filename and self._entries.pop(filename, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "ttlSeconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "pid": os.getpid(),
+            }
+
+
+# Voice note filename -> owner user_id
+audio_owner_cache = OwnershipCache(
+    Config.MEDIA_OWNER_CACHE_SIZE,
+    Config.MEDIA_OWNER_CACHE_TTL_SECONDS,
+)
@@ -1,3 +1,8 @@
+import base64
+import binascii
+
+from bson import json_util
+from bson.errors import BSONError
 from flask import request
 
 def parse_pagination_params(default_page=1, default_size=12, max_size=50):
@@ -32,3 +37,51 @@ def parse_pagination_params(default_page=1, default_size=12, max_size=50):
     page_size = min(max(1, page_size), max_size)
 
     return page, page_size
+
+
+def encode_cursor(sort, value, last_id):
+    """
+    Opaque keyset cursor for the row after (`value`, `last_id`) in `sort`,
+    e.g. "created_at:-1". Values are stored as extended JSON so dates and
+    ObjectIds survive the round trip.
+    """
+    payload = json_util.dumps({"s": sort, "v": value, "id": last_id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, sort):
+    """
+    (value, last_id) of a cursor made by `encode_cursor` for the same sort.
+    Raises ValueError for a malformed cursor or one from another sort order.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        cursor_sort, value, last_id = payload["s"], payload["v"], payload["id"]
+    except (ValueError, TypeError, KeyError, binascii.Error, BSONError):
+        raise ValueError("Invalid cursor parameter")
+    if cursor_sort != sort:
+        raise ValueError("Cursor does not match the requested sort order")
+    return value, last_id
+
+
+def keyset_query(query, field, direction, cursor_value, last_id):
+    """
+    `query` restricted to the rows that come after (`cursor_value`, `last_id`)
+    when sorted by [(field, direction), ('_id', direction)]. Paging this way
+    seeks in the index instead of skipping over every earlier row.
+    """
+    op = "$gt" if direction == 1 else "$lt"
+    after = {"$or": [
+        {field: {op: cursor_value}},
+        {field: cursor_value, "_id": {op: last_id}},
+    ]}
+    return {"$and": [query, after]} if query else after
+
+
+def next_cursor(rows, sort, field, has_more):
+    """Cursor for the page after `rows` (raw documents), or None on the last page."""
+    if not has_more or not rows:
+        return None
+    last = rows[-1]
+    return encode_cursor(sort, last.get(field), last["_id"])
@@ -0,0 +1,237 @@
+"""
+PDF thumbnail rendering.
+
+Pages are rasterised by PyMuPDF in a dedicated process pool so large scans do
+not hold a request or job thread (and the GIL) while they render. The JPEG is
+encoded straight from the pixmap and the render scale is chosen so the output
+never exceeds PDF_THUMBNAIL_MAX_DIMENSION pixels on its longest edge. Small
+pages are not enlarged beyond MAX_RENDER_ZOOM.
+
+Optionally the first PDF_PREVIEW_PAGES pages are also rendered side by side
+into a preview strip, `thumbnails/<shard>/<stem>_pages.jpg`.
+
+Renders are cached by file hash: content-addressed uploads are already named
+after their hash, and for older uploads an existing render of identical bytes
+is linked instead of rendering again.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+
+from config import Config
+from utils.content_store import blob_filename, hash_file, is_content_hash
+from utils.logger import Logger
+from utils.media_storage import delete_file, media_url
+from utils.upload_paths import resolve_path
+
+logger = Logger.get_logger("thumbnails")
+
+THUMBNAILS_DIRNAME = "thumbnails"
+THUMBNAIL_JPEG_QUALITY = 85
+
+PREVIEW_PAGE_HEIGHT = 256
+PREVIEW_PAGE_GAP = 8
+
+# Largest render scale, the fixed zoom thumbnails were rendered at before the cap
+MAX_RENDER_ZOOM = 2
+
+# Seconds to wait for a single render before giving up on it
+RENDER_TIMEOUT_SECONDS = 120
+
+
+def thumbnail_name(filename):
+    return f"{os.path.splitext(filename)[0]}.jpg"
+
+
+def preview_strip_name(filename):
+    return f"{os.path.splitext(filename)[0]}_pages.jpg"
+
+
+def thumbnail_path(upload_folder, filename):
+    return resolve_path(upload_folder, filename, THUMBNAILS_DIRNAME, thumbnail_name(filename))
+
+
+def preview_strip_path(upload_folder, filename):
+    return resolve_path(upload_folder, filename, THUMBNAILS_DIRNAME, preview_strip_name(filename))
+
+
+def thumbnail_url(upload_folder, filename):
+    return media_url(upload_folder, filename, THUMBNAILS_DIRNAME, thumbnail_name(filename))
+
+
+def _page_pixmap(page, scale):
+    return page.get_pixmap(
+        matrix=fitz.Matrix(scale, scale), colorspace=fitz.csRGB, alpha=False
+    )
+
+
+def _save_jpeg(pixmap, path):
+    temp_path = f"{path}.{os.getpid()}.part"
+    pixmap.save(temp_path, output="jpeg", jpg_quality=THUMBNAIL_JPEG_QUALITY)
+    os.replace(temp_path, path)
+
+
+def _render_pdf(pdf_path, output_path, max_dimension, preview_pages=0, preview_path=None):
+    """
+    Process-pool entry point. Renders the first page to `output_path` and,
+    when `preview_pages` > 0, the first pages as a strip to `preview_path`.
+    Returns False when the PDF has no pages.
+    """
+    with fitz.open(pdf_path) as pdf_document:
+        if not pdf_document.page_count:
+            return False
+
+        first_page = pdf_document.load_page(0)
+        longest_edge = max(first_page.rect.width, first_page.rect.height) or 1
+        scale = min(max_dimension / longest_edge, MAX_RENDER_ZOOM)
+        _save_jpeg(_page_pixmap(first_page, scale), output_path)
+
+        if preview_pages > 0 and preview_path:
+            pixmaps = []
+            for page in pdf_document.pages(0, min(preview_pages, pdf_document.page_count)):
+                pixmaps.append(_page_pixmap(page, PREVIEW_PAGE_HEIGHT / (page.rect.height or 1)))
+            width = sum(pix.width for pix in pixmaps) + PREVIEW_PAGE_GAP * (len(pixmaps) - 1)
+            height = max(pix.height for pix in pixmaps)
+            strip = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, width, height), False)
+            strip.clear_with(255)
+            x = 0
+            for pix in pixmaps:
+                pix.set_origin(x, 0)
+                strip.copy(pix, pix.irect)
+                x += pix.width + PREVIEW_PAGE_GAP
+            _save_jpeg(strip, preview_path)
+    return True
+
+
+class PdfRenderer:
+    """Lazily started process pool shared by the app, the worker and the backfill CLI."""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: the parent runs thread pools, which must not be forked
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, *args):
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(_render_pdf, *args)
+        except BrokenProcessPool:
+            # A render process crashed (e.g. on a malformed PDF); start a fresh pool
+            self._reset(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(_render_pdf, *args)
+
+    def submit(self, *args):
+        return self._submit(*args)[1]
+
+    def render(self, *args, timeout=RENDER_TIMEOUT_SECONDS):
+        executor, future = self._submit(*args)
+        try:
+            return future.result(timeout=timeout)
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+PDF_RENDERER = PdfRenderer(Config.PDF_RENDER_WORKERS)
+
+
+def _link_cached_render(cached_path, path):
+    try:
+        os.link(cached_path, path)
+    except FileExistsError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+def _find_cached_render(upload_folder, pdf_path, filename):
+    """
+    Older uploads are not named after their content; look for a render of a
+    content-addressed PDF with the same bytes and reuse its output.
+    """
+    if is_content_hash(os.path.splitext(filename)[0]):
+        return None
+    cached_filename = blob_filename(hash_file(pdf_path), "application/pdf")
+    cached_path = thumbnail_path(upload_folder, cached_filename)
+    return cached_filename if os.path.exists(cached_path) else None
+
+
+# generate thumbnail for the pdf
+def generate_pdf_thumbnail(pdf_path, filename, upload_folder, preview_pages=None, renderer=None):
+    """
+    Render the first page of a PDF (and an optional preview strip) in the
+    render process pool. Returns the thumbnail path or None on failure.
+    """
+    if preview_pages is None:
+        preview_pages = Config.PDF_PREVIEW_PAGES
+    renderer = renderer or PDF_RENDERER
+
+    output_path = thumbnail_path(upload_folder, filename)
+    preview_path = preview_strip_path(upload_folder, filename)
+    for directory in {os.path.dirname(output_path), os.path.dirname(preview_path)}:
+        os.makedirs(directory, exist_ok=True)
+
+    try:
+        if is_content_hash(os.path.splitext(filename)[0]) and os.path.exists(output_path) and (
+            not preview_pages or os.path.exists(preview_path)
+        ):
+            # Content-addressed PDFs share one render across uploads
+            return output_path
+
+        cached_filename = _find_cached_render(upload_folder, pdf_path, filename)
+        if cached_filename:
+            cached_preview = preview_strip_path(upload_folder, cached_filename)
+            if _link_cached_render(thumbnail_path(upload_folder, cached_filename), output_path) and (
+                not preview_pages
+                or (os.path.exists(cached_preview) and _link_cached_render(cached_preview, preview_path))
+            ):
+                return output_path
+
+        # Render processes may not share our working directory; hand them absolute paths
+        rendered = renderer.render(
+            os.path.abspath(pdf_path),
+            os.path.abspath(output_path),
+            Config.PDF_THUMBNAIL_MAX_DIMENSION,
+            preview_pages,
+            os.path.abspath(preview_path),
+        )
+        if not rendered:
+            logger.warning(f"PDF '{filename}' has no pages, cannot generate thumbnail.")
+            return None
+        return output_path
+    except Exception as e:
+        logger.error(f"Failed to generate thumbnail for PDF '{filename}': {e}")
+        return None
+
+
+def remove_pdf_thumbnails(upload_folder, filename):
+    for name in (thumbnail_name(filename), preview_strip_name(filename)):
+        delete_file(upload_folder, filename, THUMBNAILS_DIRNAME, name)
@@ -0,0 +1,277 @@
+"""
+Background job types for post-upload processing.
+
+`build_upload_jobs` is used by the upload views to describe the work for a
+stored file; `JOB_HANDLERS` is consumed by worker.py to run it. Handlers must
+be safe to run more than once because a job whose lease expires is retried.
+"""
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from config import Config
+from database.blobhandler import release_blob, set_blob_derivatives
+from database.jobqueue import build_job
+from database.userdatahandler import (
+    claim_expired_deleted_images,
+    count_images_by_audio_filename,
+    delete_claimed_images,
+    get_image_by_audio_filename,
+    get_referenced_filenames,
+    save_image,
+    save_notification,
+    set_voice_note_rendition,
+)
+from utils.audio_processing import normalize_voice_note, rendition_filename
+from utils.derivatives import DERIVATIVES_DIRNAME, generate_derivatives, remove_derivatives
+from utils.logger import Logger
+from utils.media_storage import delete_file, fetch_file, publish_file
+from utils.ownership_cache import audio_owner_cache
+from utils.thumbnails import (
+    THUMBNAILS_DIRNAME,
+    generate_pdf_thumbnail,
+    preview_strip_name,
+    remove_pdf_thumbnails,
+    thumbnail_name,
+)
+
+logger = Logger.get_logger("upload_jobs")
+
+IMAGE_METADATA_JOB = "image_metadata"
+UPLOAD_NOTIFICATION_JOB = "upload_notification"
+PDF_THUMBNAIL_JOB = "pdf_thumbnail"
+MEDIA_DERIVATIVES_JOB = "media_derivatives"
+VOICE_NOTE_JOB = "voice_note"
+PURGE_DELETED_IMAGES_JOB = "purge_deleted_images"
+
+JOB_HANDLERS = {}
+
+
+def job_handler(job_type):
+    def decorator(f):
+        JOB_HANDLERS[job_type] = f
+        return f
+    return decorator
+
+
+def build_upload_jobs(image_id, notification_id, user_id, username, filename, title,
+                      description, time_created, audio_filename=None, sentiment=None,
+                      content_hash=None, original_filename=None):
+    """Return the jobs needed to finish processing one stored upload."""
+    jobs = [
+        build_job(IMAGE_METADATA_JOB, {
+            "image_id": image_id,
+            "user_id": user_id,
+            "filename": filename,
+            "title": title,
+            "description": description,
+            "created_at": time_created,
+            "audio_filename": audio_filename,
+            "sentiment": sentiment,
+            "content_hash": content_hash,
+            "original_filename": original_filename,
+        }, user_id=user_id),
+        build_job(UPLOAD_NOTIFICATION_JOB, {
+            "notification_id": notification_id,
+            "user_id": user_id,
+            "username": username,
+            "filename": filename,
+            "title": title,
+            "created_at": time_created,
+            "sentiment": sentiment,
+        }, user_id=user_id),
+    ]
+    jobs.append(build_job(MEDIA_DERIVATIVES_JOB, {"filename": filename}, user_id=user_id))
+    return jobs
+
+
+def build_voice_note_job(audio_filename, user_id):
+    """One voice note is shared by every image of an upload, so it gets a single job."""
+    return build_job(VOICE_NOTE_JOB, {"audio_filename": audio_filename}, user_id=user_id)
+
+
+def build_purge_job(image_ids, token, purge_at, user_id):
+    """Release the files of deleted images once their undo window has passed."""
+    return build_job(
+        PURGE_DELETED_IMAGES_JOB,
+        {"image_ids": image_ids, "token": token},
+        user_id=user_id,
+        run_at=purge_at,
+    )
+
+
+@job_handler(IMAGE_METADATA_JOB)
+def run_image_metadata_job(payload):
+    try:
+        save_image(
+            payload["user_id"],
+            payload["filename"],
+            payload["title"],
+            payload["description"],
+            payload["created_at"],
+            payload.get("audio_filename"),
+            payload.get("sentiment"),
+            image_id=payload["image_id"],
+            content_hash=payload.get("content_hash"),
+            original_filename=payload.get("original_filename"),
+        )
+    except DuplicateKeyError:
+        logger.info(f"Image {payload['image_id']} already recorded, skipping retry")
+
+
+@job_handler(UPLOAD_NOTIFICATION_JOB)
+def run_upload_notification_job(payload):
+    try:
+        save_notification(
+            payload["user_id"],
+            payload["username"],
+            payload["filename"],
+            payload["title"],
+            payload["created_at"],
+            payload.get("sentiment"),
+            notification_id=payload["notification_id"],
+        )
+    except DuplicateKeyError:
+        logger.info(f"Notification {payload['notification_id']} already recorded, skipping retry")
+
+
+def publish_pdf_thumbnails(upload_folder, filename):
+    """Copy the thumbnail and preview strip of a PDF to the storage backend."""
+    publish_file(upload_folder, filename, THUMBNAILS_DIRNAME, thumbnail_name(filename))
+    publish_file(upload_folder, filename, THUMBNAILS_DIRNAME, preview_strip_name(filename))
+
+
+def publish_derivatives(upload_folder, filename, derivatives):
+    for formats in derivatives.values():
+        for name in formats.values():
+            publish_file(upload_folder, filename, DERIVATIVES_DIRNAME, name)
+
+
+@job_handler(PDF_THUMBNAIL_JOB)
+def run_pdf_thumbnail_job(payload):
+    filename = payload["filename"]
+    # With a remote storage backend the upload may have been stored by another node
+    pdf_path = fetch_file(Config.UPLOAD_FOLDER, filename)
+    if pdf_path is None:
+        # The upload was deleted before the worker got to it
+        logger.info(f"PDF '{filename}' no longer exists, skipping thumbnail")
+        return
+    if generate_pdf_thumbnail(pdf_path, filename, Config.UPLOAD_FOLDER) is None:
+        raise RuntimeError(f"Thumbnail generation failed for '{filename}'")
+    publish_pdf_thumbnails(Config.UPLOAD_FOLDER, filename)
+
+
+@job_handler(MEDIA_DERIVATIVES_JOB)
+def run_media_derivatives_job(payload):
+    filename = payload["filename"]
+    if fetch_file(Config.UPLOAD_FOLDER, filename) is None:
+        logger.info(f"Upload '{filename}' no longer exists, skipping derivatives")
+        return
+    if filename.lower().endswith(".pdf"):
+        # PDF derivatives are resized from the first-page thumbnail
+        run_pdf_thumbnail_job(payload)
+    derivatives = generate_derivatives(Config.UPLOAD_FOLDER, filename)
+    if not derivatives:
+        raise RuntimeError(f"Derivative generation failed for '{filename}'")
+    publish_derivatives(Config.UPLOAD_FOLDER, filename, derivatives)
+    set_blob_derivatives(filename, derivatives)
+
+
+def process_voice_note(upload_folder, audio_filename):
+    """Normalize a voice note and point its images at the new rendition."""
+    source_path = fetch_file(upload_folder, audio_filename)
+    if source_path is None:
+        # Every image using it was deleted before the audio got processed
+        logger.info(f"Voice note '{audio_filename}' no longer exists, skipping")
+        return
+
+    image = get_image_by_audio_filename(audio_filename)
+    if image is None:
+        if any(
+            count_images_by_audio_filename(rendition_filename(audio_filename, ext))
+            for ext in (".opus", ".wav")
+        ):
+            # An earlier attempt switched the images over but did not remove the original
+            delete_file(upload_folder, audio_filename)
+            return
+        # With background jobs the image metadata may not be recorded yet; retry later
+        raise RuntimeError(f"No image references voice note '{audio_filename}' yet")
+    if image.get("audio_duration") is not None:
+        return
+
+    rendition = normalize_voice_note(upload_folder, audio_filename)
+    if rendition is None:
+        logger.info(f"Voice note '{audio_filename}' cannot be normalized on this host, keeping it as sent")
+        return
+
+    publish_file(upload_folder, rendition["filename"])
+    updated = set_voice_note_rendition(audio_filename, rendition)
+    # The images now point at the rendition; the original name must not authorize anything
+    audio_owner_cache.invalidate(audio_filename)
+    if updated:
+        delete_file(upload_folder, audio_filename)
+    else:
+        # The images were deleted while transcoding
+        delete_file(upload_folder, rendition["filename"])
+
+
+@job_handler(VOICE_NOTE_JOB)
+def run_voice_note_job(payload):
+    process_voice_note(Config.UPLOAD_FOLDER, payload["audio_filename"])
+
+
+def discard_stored_upload(upload_folder, filename, audio_filename=None):
+    """
+    Best-effort removal of an upload's files (with its PDF thumbnail and
+    derivatives) from UPLOAD_FOLDER and the storage backend.
+    """
+    removals = []
+    if filename:
+        removals.append((filename, lambda: remove_derivatives(upload_folder, filename)))
+        if filename.lower().endswith(".pdf"):
+            removals.append((filename, lambda: remove_pdf_thumbnails(upload_folder, filename)))
+        removals.append((filename, lambda: delete_file(upload_folder, filename)))
+    if audio_filename:
+        removals.append((audio_filename, lambda: delete_file(upload_folder, audio_filename)))
+    for name, remove in removals:
+        try:
+            remove()
+        except Exception as e:
+            logger.warning(f"Failed to remove '{name}': {e}")
+
+
+def purge_deleted_images(upload_folder, image_ids, token):
+    """
+    Drop deleted images whose undo window has passed and unlink the files no
+    other image uses. `token` identifies this purge so a retry picks up the
+    same images. Documents are removed before blob references are released:
+    an interruption can leak a file (found by reconcile_uploads.py) but never
+    releases a reference twice.
+    """
+    images = claim_expired_deleted_images(image_ids, token)
+    delete_claimed_images(token)
+    if not images:
+        return 0
+
+    references = {}
+    for image in images:
+        references[image["filename"]] = references.get(image["filename"], 0) + 1
+    for filename, count in references.items():
+        if release_blob(filename, count):
+            discard_stored_upload(upload_folder, filename)
+
+    # A voice note is shared by the images of one upload; keep it while any of them remains
+    audio_filenames = {image["audio_filename"] for image in images if image.get("audio_filename")}
+    still_used = get_referenced_filenames(audio_filenames)
+    for audio_filename in audio_filenames - still_used:
+        discard_stored_upload(upload_folder, None, audio_filename)
+    return len(images)
+
+
+@job_handler(PURGE_DELETED_IMAGES_JOB)
+def run_purge_deleted_images_job(payload):
+    purged = purge_deleted_images(
+        Config.UPLOAD_FOLDER,
+        [ObjectId(image_id) for image_id in payload["image_ids"]],
+        payload["token"],
+    )
+    logger.info(f"Purged {purged} deleted images")
@@ -0,0 +1,140 @@
+"""
+Hash-sharded layout for files under UPLOAD_FOLDER.
+
+A flat directory with every upload in it gets slow to list, back up and
+look up once it holds hundreds of thousands of files, so stored files live
+under two levels of hash-prefix directories:
+
+    static/uploads/3f/a9/3fa9....jpg
+    static/uploads/thumbnails/3f/a9/3fa9....jpg
+    static/uploads/derivatives/3f/a9/3fa9..._256.webp
+
+The prefix comes from the file stem: content-addressed uploads use their own
+hash, older names are hashed first. Thumbnails and derivatives share the
+stem of their source and therefore its directory.
+
+Files from before the sharded layout are migrated by `migrate_uploads.py`.
+Until that has finished (UPLOAD_FLAT_FALLBACK), lookups fall back to the flat
+path, so both layouts stay readable while files move.
+"""
+import hashlib
+import os
+import re
+
+from config import Config
+from utils.content_store import is_content_hash
+
+# URL prefix UPLOAD_FOLDER is served under by Flask's static route
+STATIC_UPLOADS_URL = "/static/uploads"
+
+_SHARD_DIR_RE = re.compile(r"^[0-9a-f]{2}$")
+
+
+def shard_dirs(filename):
+    """The two hash-prefix directories for a stored file or anything derived from it."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    key = stem if is_content_hash(stem) else hashlib.sha256(stem.encode("utf-8")).hexdigest()
+    return key[0:2], key[2:4]
+
+
+def sharded_relpath(filename, area="", name=None):
+    """
+    Relative path of `name` (defaults to `filename`) in the sharded layout.
+    `area` is a subdirectory such as "thumbnails"; `filename` is the upload
+    the file belongs to and decides the shard.
+    """
+    return os.path.join(area, *shard_dirs(filename), name or filename)
+
+
+def flat_relpath(filename, area="", name=None):
+    return os.path.join(area, name or filename)
+
+
+def resolve_relpath(upload_folder, filename, area="", name=None):
+    """
+    Relative path of a stored file inside `upload_folder`. New files go to
+    the sharded layout; a file that only exists at its flat path resolves
+    there until it has been migrated.
+    """
+    sharded = sharded_relpath(filename, area, name)
+    if not Config.UPLOAD_FLAT_FALLBACK or os.path.exists(os.path.join(upload_folder, sharded)):
+        return sharded
+    flat = flat_relpath(filename, area, name)
+    if os.path.exists(os.path.join(upload_folder, flat)):
+        return flat
+    return sharded
+
+
+def resolve_path(upload_folder, filename, area="", name=None):
+    return os.path.join(upload_folder, resolve_relpath(upload_folder, filename, area, name))
+
+
+def candidate_paths(upload_folder, filename, area="", name=None):
+    """Every path the file may exist at, sharded first."""
+    return [
+        os.path.join(upload_folder, sharded_relpath(filename, area, name)),
+        os.path.join(upload_folder, flat_relpath(filename, area, name)),
+    ]
+
+
+def remove_stored_file(upload_folder, filename, area="", name=None):
+    """Remove a stored file from both layouts. Returns True if anything was removed."""
+    removed = False
+    for path in candidate_paths(upload_folder, filename, area, name):
+        try:
+            os.remove(path)
+            removed = True
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def upload_url(upload_folder, filename, area="", name=None):
+    """Public URL of a stored file under STATIC_UPLOADS_URL."""
+    relpath = resolve_relpath(upload_folder, filename, area, name)
+    return f"{STATIC_UPLOADS_URL}/{relpath.replace(os.sep, '/')}"
+
+
+def _stored_entries(directory):
+    try:
+        for entry in os.scandir(directory):
+            # Dot entries are in-progress writes and the staging area
+            if not entry.name.startswith(".") and not entry.name.endswith(".part"):
+                yield entry
+    except FileNotFoundError:
+        return
+
+
+def iter_flat_files(upload_folder, area=""):
+    """Names of files still stored in the flat layout of `area`."""
+    for entry in _stored_entries(os.path.join(upload_folder, area)):
+        if entry.is_file():
+            yield entry.name
+
+
+def _shard_subdirs(directory):
+    return sorted(
+        entry.name for entry in _stored_entries(directory)
+        if entry.is_dir() and _SHARD_DIR_RE.match(entry.name)
+    )
+
+
+def iter_shard_dirs(upload_folder, area=""):
+    """Relative "ab/cd" paths of the existing shard directories of `area`, in sorted order."""
+    base = os.path.join(upload_folder, area)
+    for first in _shard_subdirs(base):
+        for second in _shard_subdirs(os.path.join(base, first)):
+            yield f"{first}/{second}"
+
+
+def iter_shard_files(upload_folder, area, shard):
+    for entry in _stored_entries(os.path.join(upload_folder, area, *shard.split("/"))):
+        if entry.is_file():
+            yield entry.name
+
+
+def iter_stored_files(upload_folder, area=""):
+    """Names of every file stored in `area`, in either layout."""
+    yield from iter_flat_files(upload_folder, area)
+    for shard in iter_shard_dirs(upload_folder, area):
+        yield from iter_shard_files(upload_folder, area, shard)
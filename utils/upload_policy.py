@@ -0,0 +1,53 @@
+"""
+Upload validation policy shared by every ingest path.
+
+Keeps the allowed extensions, MIME types and per-MIME size limits in one
+place so the regular, streaming and resumable upload paths agree on what
+is accepted.
+"""
+import os
+
+ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp", "heif", "pdf", "avif"}
+
+ALLOWED_MIME_TYPES = {
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "image/heif",
+    "application/pdf",
+    "image/avif",
+}
+
+MIME_SIZE_LIMITS = {
+    "image/jpeg": 10 * 1024 * 1024,
+    "image/png": 10 * 1024 * 1024,
+    "image/webp": 10 * 1024 * 1024,
+    "image/gif": 8 * 1024 * 1024,
+    "image/heif": 15 * 1024 * 1024,
+    "image/heic": 15 * 1024 * 1024,
+    "application/pdf": 25 * 1024 * 1024,
+}
+
+# Number of leading bytes handed to the MIME sniffer
+MIME_SNIFF_BYTES = 2048
+
+
+def file_extension(filename):
+    """Return the lower-cased extension of `filename` without the leading dot."""
+    return os.path.splitext(filename or "")[1].lstrip(".").lower()
+
+
+def is_allowed_extension(filename):
+    return file_extension(filename) in ALLOWED_EXTENSIONS
+
+
+def extension_error_message():
+    return f"File type not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
+
+
+def size_limit_error_message(filename, max_allowed):
+    return (
+        f"File '{filename}' exceeds max size limit "
+        f"({max_allowed // (1024 * 1024)}MB)"
+    )
@@ -0,0 +1,190 @@
+"""
+Streaming multipart ingest for the upload endpoint.
+
+By default Werkzeug spools every uploaded file into a SpooledTemporaryFile,
+the view validates it afterwards and `FileStorage.save()` copies the bytes a
+second time into UPLOAD_FOLDER. When STREAMING_UPLOADS is enabled, files sent
+to a streaming endpoint are instead written straight into a temporary file
+inside UPLOAD_FOLDER while the MIME type and per-MIME size limit are checked
+as the bytes arrive. Forbidden or oversize files abort the request early and
+accepted files are moved into place with a rename.
+"""
+import os
+import tempfile
+
+from flask import Request, current_app
+
+from utils.content_store import new_content_hash
+from utils.upload_policy import (
+    ALLOWED_MIME_TYPES,
+    MIME_SIZE_LIMITS,
+    MIME_SNIFF_BYTES,
+    is_allowed_extension,
+    size_limit_error_message,
+)
+
+
+class UploadRejected(Exception):
+    """Raised while the request body is parsed to abort an upload early."""
+
+    def __init__(self, message, status_code=400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(self.message)
+
+
+class ValidatingUploadStream:
+    """
+    Writable file container handed to Werkzeug's multipart parser.
+
+    The first MIME_SNIFF_BYTES are buffered for MIME detection; once the type
+    is known every further write is checked against its size limit. A SHA-256
+    digest is computed on the fly for content-addressed storage.
+    """
+
+    def __init__(self, directory, filename, sniff):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix=".ingest-", suffix=".part", dir=directory)
+        self._file = os.fdopen(fd, "w+b")
+        self._sniff = sniff
+        self._header = bytearray()
+        self._limit = None
+        self._committed = False
+        self._digest = new_content_hash()
+        self.filename = filename
+        self.mime_type = None
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        if self._header is not None:
+            self._header += data
+            if len(self._header) >= MIME_SNIFF_BYTES:
+                self._detect()
+        elif self.size > self._limit:
+            raise UploadRejected(size_limit_error_message(self.filename, self._limit), 413)
+        self._digest.update(data)
+        self._file.write(data)
+        return len(data)
+
+    def _detect(self):
+        header = bytes(self._header[:MIME_SNIFF_BYTES])
+        self._header = None
+
+        mime_type = self._sniff(header)
+        if mime_type is None:
+            raise UploadRejected(
+                "Server MIME detection unavailable; contact administrator.", 500
+            )
+        if mime_type not in ALLOWED_MIME_TYPES:
+            raise UploadRejected(
+                f'File content validation failed. Detected type "{mime_type}" is not allowed.'
+            )
+        limit = MIME_SIZE_LIMITS.get(mime_type)
+        if limit is None:
+            raise UploadRejected(f"Unsupported MIME type: {mime_type}")
+
+        self.mime_type = mime_type
+        self._limit = limit
+        if self.size > limit:
+            raise UploadRejected(size_limit_error_message(self.filename, limit), 413)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # The parser rewinds the container once the part is complete, which is
+        # where files smaller than the sniff window get their type checked.
+        if self._header is not None:
+            self._detect()
+        return self._file.seek(offset, whence)
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    @property
+    def content_hash(self):
+        return self._digest.hexdigest()
+
+    def commit(self, destination):
+        """Move the validated file to `destination` without copying its bytes."""
+        self._file.close()
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(self.path, destination)
+        self._committed = True
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self._committed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+class StreamingUploadRequest(Request):
+    """Request class that validates uploads to streaming endpoints while parsing."""
+
+    streaming_endpoints = {"upload_images"}
+
+    def _get_file_stream(
+        self, total_content_length, content_type, filename=None, content_length=None
+    ):
+        config = current_app.config
+        if not (
+            config.get("STREAMING_UPLOADS")
+            and self.endpoint in self.streaming_endpoints
+            and is_allowed_extension(filename)
+        ):
+            # Audio attachments and anything the view rejects by extension
+            # keep the default spooled container.
+            return super()._get_file_stream(
+                total_content_length, content_type, filename, content_length
+            )
+
+        sniff = current_app.extensions["streaming_uploads"]["sniff"]
+        stream = ValidatingUploadStream(config["UPLOAD_FOLDER"], filename, sniff)
+        self._ingest_streams.append(stream)
+        return stream
+
+    @property
+    def _ingest_streams(self):
+        streams = self.__dict__.get("_ingest_stream_list")
+        if streams is None:
+            streams = self.__dict__["_ingest_stream_list"] = []
+        return streams
+
+    def close(self):
+        # Streams created before an UploadRejected never reach `request.files`,
+        # so they are tracked here to make sure partial files are removed.
+        try:
+            super().close()
+        finally:
+            for stream in self.__dict__.get("_ingest_stream_list", ()):
+                stream.close()
+
+
+def init_streaming_uploads(app, sniff):
+    """
+    Install the streaming request class on `app`.
+
+    `sniff` receives the leading bytes of a file and returns its MIME type, or
+    None when MIME detection is unavailable.
+    """
+    app.request_class = StreamingUploadRequest
+    app.extensions["streaming_uploads"] = {"sniff": sniff}
+
+
+def is_streamed_upload(file):
+    return isinstance(getattr(file, "stream", None), ValidatingUploadStream)
@@ -0,0 +1,105 @@
+"""
+Background job worker for post-upload processing.
+
+Runs as a separate process next to the Flask app and processes jobs from the
+MongoDB `jobs` collection with N concurrent worker threads:
+
+    python worker.py --concurrency 4
+"""
+import argparse
+import os
+import signal
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import Config
+from database.jobqueue import claim_next_job, complete_job, fail_job
+from utils.logger import Logger
+from utils.upload_jobs import JOB_HANDLERS
+
+logger = Logger.get_logger("worker")
+
+
+def run_worker(worker_id, stop_event, poll_interval, visibility_timeout):
+    logger.info(f"Worker {worker_id} started")
+    while not stop_event.is_set():
+        try:
+            job = claim_next_job(worker_id, JOB_HANDLERS.keys(), visibility_timeout)
+        except Exception as e:
+            logger.error(f"Worker {worker_id} failed to claim a job: {e}")
+            stop_event.wait(poll_interval)
+            continue
+
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+
+        if job["attempts"] > job["max_attempts"]:
+            # Lease expired after the final attempt; record the failure without rerunning
+            fail_job(job, worker_id, job.get("last_error") or "Visibility timeout exceeded")
+            continue
+
+        try:
+            JOB_HANDLERS[job["type"]](job["payload"])
+        except Exception as e:
+            logger.error(
+                f"Job {job['_id']} ({job['type']}) attempt {job['attempts']} failed: {e}\n"
+                f"{traceback.format_exc()}"
+            )
+            fail_job(job, worker_id, str(e))
+        else:
+            if not complete_job(job["_id"], worker_id):
+                logger.warning(f"Job {job['_id']} lease was lost before completion")
+    logger.info(f"Worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Beehive background job workers.")
+    parser.add_argument(
+        "--concurrency", type=int, default=Config.JOB_WORKER_CONCURRENCY,
+        help="Number of concurrent worker threads",
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=1.0,
+        help="Seconds to wait when the queue is empty",
+    )
+    parser.add_argument(
+        "--visibility-timeout", type=int, default=Config.JOB_VISIBILITY_TIMEOUT_SECONDS,
+        help="Seconds before a claimed job becomes visible to other workers again",
+    )
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+
+    def _stop(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down workers")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+
+    visibility_timeout = timedelta(seconds=args.visibility_timeout)
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            args=(f"{prefix}:{i}", stop_event, args.poll_interval, visibility_timeout),
+            daemon=True,
+        )
+        for i in range(max(1, args.concurrency))
+    ]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=1)
+
+
+if __name__ == "__main__":
+    main()